@@ -0,0 +1,62 @@
+import time
+import argparse
+import cv2
+import torch
+
+from pipeline.inference import init_grounding_dino, dino_preprocess, dino_predict
+from pipeline.grounding import CaptionCache
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", type=str, default="figs/sea.jpg")
+    parser.add_argument(
+        "--captions",
+        type=str,
+        nargs="+",
+        default=[
+            "the biggest foreground object",
+            "glass, lens, crystal, diamond, bubble, bulb, web, grid",
+        ],
+    )
+    parser.add_argument("--box-threshold", type=float, default=0.25)
+    parser.add_argument("--text-threshold", type=float, default=0.25)
+    parser.add_argument("--runs", type=int, default=5)
+    return parser.parse_args()
+
+
+def timed(func, runs):
+    func()
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = func()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+    return result, (time.perf_counter() - start) / runs
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    model = init_grounding_dino()
+    image = dino_preprocess(cv2.cvtColor(cv2.imread(args.image), cv2.COLOR_BGR2RGB))
+    captions = CaptionCache(model)
+
+    for caption in args.captions:
+
+        def predict(cache):
+            return dino_predict(
+                model, image, caption, args.box_threshold, args.text_threshold, caption_cache=cache
+            )
+
+        (boxes, logits, phrases), uncached_time = timed(lambda: predict(None), args.runs)
+        (cached_boxes, cached_logits, cached_phrases), cached_time = timed(
+            lambda: predict(captions), args.runs
+        )
+        assert phrases == cached_phrases, (phrases, cached_phrases)
+        assert torch.allclose(boxes, cached_boxes, atol=1e-5)
+        assert torch.allclose(logits, cached_logits, atol=1e-5)
+        print(
+            f"{caption!r}: {len(phrases)} detections, "
+            f"predict {uncached_time * 1000:.1f} ms, cached text {cached_time * 1000:.1f} ms"
+        )
+    print("detections match GroundingDINO's predict")
@@ -0,0 +1,62 @@
+import time
+import argparse
+import torch
+
+from modeling.criterion.matting_criterion import MattingCriterion, FusedMattingCriterion
+
+LOSSES = ["unknown_l1_loss", "known_l1_loss", "loss_pha_laplacian", "loss_gradient_penalty"]
+
+
+def make_inputs(batch_size, size, device):
+    targets = torch.rand(batch_size, 1, size, size, device=device)
+    trimap = torch.randint(0, 3, (batch_size, 1, size, size), device=device) * 0.5
+    sample_map = (trimap == 0.5).float()
+    preds = torch.rand(batch_size, 1, size, size, device=device, requires_grad=True)
+    return sample_map, {"phas": preds}, {"phas": targets}
+
+
+def timeit(criterion, inputs, iters, device):
+    sample_map, preds, targets = inputs
+    for _ in range(3):
+        sum(criterion(sample_map, preds, targets).values()).backward()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(iters):
+        sum(criterion(sample_map, preds, targets).values()).backward()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / iters
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=15)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--iters", type=int, default=20)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    reference = MattingCriterion(losses=LOSSES).to(device)
+    fused = FusedMattingCriterion(losses=LOSSES).to(device)
+    inputs = make_inputs(args.batch_size, args.size, device)
+    sample_map, preds, targets = inputs
+
+    expected = reference(sample_map, preds, targets)
+    grad_expected = torch.autograd.grad(sum(expected.values()), preds["phas"])[0]
+    actual = fused(sample_map, preds, targets)
+    grad_actual = torch.autograd.grad(sum(actual.values()), preds["phas"])[0]
+    for name in LOSSES:
+        print(f"{name:>22}: {expected[name].item():.6f} vs {actual[name].item():.6f}")
+        torch.testing.assert_close(actual[name], expected[name], rtol=1e-5, atol=1e-6)
+    torch.testing.assert_close(grad_actual, grad_expected, rtol=1e-5, atol=1e-6)
+    print("losses and gradients match")
+
+    reference_time = timeit(reference, inputs, args.iters, device)
+    fused_time = timeit(fused, inputs, args.iters, device)
+    print(f"MattingCriterion:      {reference_time * 1000:8.2f} ms forward+backward")
+    print(f"FusedMattingCriterion: {fused_time * 1000:8.2f} ms forward+backward")
+    print(f"speedup: {reference_time / fused_time:.2f}x")
@@ -0,0 +1,108 @@
+import os
+import time
+import argparse
+import tempfile
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from detectron2.config import LazyConfig
+
+from data import ImageFileTrain, DataGenerator
+
+
+def make_synthetic(root, num_fg, num_bg, size=(1080, 1440)):
+    """
+    Random foregrounds with blurry elliptic alphas and random backgrounds.
+    """
+    h, w = size
+    for name in ("fg", "alpha", "bg"):
+        os.makedirs(os.path.join(root, name), exist_ok=True)
+    rng = np.random.default_rng(0)
+    for i in range(num_fg):
+        fg = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        alpha = np.zeros((h, w), np.uint8)
+        axes = (int(w * rng.uniform(0.2, 0.4)), int(h * rng.uniform(0.2, 0.4)))
+        cv2.ellipse(alpha, (w // 2, h // 2), axes, 0, 0, 360, 255, -1)
+        alpha = cv2.GaussianBlur(alpha, (0, 0), 15)
+        cv2.imwrite(os.path.join(root, "fg", f"{i}.jpg"), fg)
+        cv2.imwrite(os.path.join(root, "alpha", f"{i}.png"), alpha)
+    for i in range(num_bg):
+        bg = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        cv2.imwrite(os.path.join(root, "bg", f"{i}.jpg"), bg)
+
+
+def measure(dataset, batch_size, num_workers, iters):
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=True,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        drop_last=True,
+        persistent_workers=num_workers > 0,
+    )
+    it = iter(loader)
+    # the first batch includes the worker startup
+    next(it)
+    start = time.perf_counter()
+    count = 0
+    while count < iters:
+        try:
+            next(it)
+        except StopIteration:
+            it = iter(loader)
+            continue
+        count += 1
+    return iters * batch_size / (time.perf_counter() - start)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", type=str, default="./configs/common/dataloader.py")
+    parser.add_argument("--root", type=str, default=None, help="dataset root, synthetic if not set")
+    parser.add_argument("--alpha-dir", type=str, default="alpha")
+    parser.add_argument("--fg-dir", type=str, default="fg")
+    parser.add_argument("--bg-dir", type=str, default="bg")
+    parser.add_argument("--cache-dir", type=str, default=None)
+    parser.add_argument("--synthetic", type=int, default=64, help="number of synthetic foregrounds")
+    parser.add_argument("--iters", type=int, default=50)
+    parser.add_argument("--num-workers", type=int, nargs="+", default=None)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    cfg = LazyConfig.load(args.config)
+    train = cfg.dataloader.train
+    num_workers = args.num_workers or [train.num_workers]
+    batch_sizes = args.batch_size or [train.batch_size]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.root is None:
+            make_synthetic(tmp, args.synthetic, args.synthetic)
+            root, alpha_ext = tmp, ".png"
+        else:
+            root, alpha_ext = args.root, ".jpg"
+        files = ImageFileTrain(
+            alpha_dir=args.alpha_dir,
+            fg_dir=args.fg_dir,
+            bg_dir=args.bg_dir,
+            root=root,
+            alpha_ext=alpha_ext,
+        )
+        cache_dir = args.cache_dir or os.path.join(tmp, "cache")
+        start = time.perf_counter()
+        cached = DataGenerator(files, cache_dir=cache_dir)
+        print(f"cache ready in {time.perf_counter() - start:.1f} s")
+        datasets = {"files": DataGenerator(files), "cache": cached}
+
+        for batch_size in batch_sizes:
+            for workers in num_workers:
+                for name, dataset in datasets.items():
+                    rate = measure(dataset, batch_size, workers, args.iters)
+                    print(
+                        f"{name:>6}: batch_size {batch_size:3d}, num_workers {workers:2d}: "
+                        f"{rate:8.1f} samples/s"
+                    )
@@ -0,0 +1,77 @@
+import time
+import argparse
+import numpy as np
+import torch
+
+from pipeline.grounding import CaptionCache
+from pipeline.inference import init_grounding_dino, dino_preprocess, dino_predict, dino_predict_batch
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--caption", type=str, default="the biggest foreground object")
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--box-threshold", type=float, default=0.25)
+    parser.add_argument("--text-threshold", type=float, default=0.25)
+    return parser.parse_args()
+
+
+def synchronize():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    model = init_grounding_dino()
+    captions = CaptionCache(model)
+    rng = np.random.default_rng(0)
+    # same size images need no padding, so the batch has to match exactly
+    images = [
+        dino_preprocess(rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8))
+        for _ in range(args.images)
+    ]
+
+    def single():
+        return [
+            dino_predict(
+                model,
+                image,
+                args.caption,
+                args.box_threshold,
+                args.text_threshold,
+                caption_cache=captions,
+            )
+            for image in images
+        ]
+
+    def batched():
+        results = []
+        for start in range(0, len(images), args.batch_size):
+            results += dino_predict_batch(
+                model,
+                images[start : start + args.batch_size],
+                args.caption,
+                args.box_threshold,
+                args.text_threshold,
+                caption_cache=captions,
+            )
+        return results
+
+    results = {}
+    for name, run in [("one by one", single), ("batched", batched)]:
+        run()
+        synchronize()
+        start = time.perf_counter()
+        results[name] = run()
+        synchronize()
+        print(f"{name:>10}: {(time.perf_counter() - start) / args.images * 1000:8.1f} ms/image")
+
+    for (boxes, logits, phrases), (batch_boxes, batch_logits, batch_phrases) in zip(
+        results["one by one"], results["batched"]
+    ):
+        assert phrases == batch_phrases, (phrases, batch_phrases)
+        assert torch.allclose(boxes, batch_boxes, atol=1e-4)
+        assert torch.allclose(logits, batch_logits, atol=1e-4)
+    print("batched detections match")
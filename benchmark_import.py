@@ -0,0 +1,44 @@
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+TARGETS = {
+    "matte_anything (UI)": "import matte_anything",
+    "pipeline.inference": "import pipeline.inference",
+    "headless --help": None,
+}
+
+
+def measure(code, runs):
+    if code is None:
+        command = [sys.executable, "headless.py", "--help"]
+    else:
+        command = [sys.executable, "-c", code]
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(command, capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+    return statistics.median(times), None
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Time a fresh interpreter importing each entry point")
+    parser.add_argument("--runs", type=int, default=5)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    baseline, _ = measure("pass", args.runs)
+    print(f"{'interpreter startup':>22}: {baseline * 1000:8.1f} ms")
+    for name, code in TARGETS.items():
+        elapsed, error = measure(code, args.runs)
+        if error is not None:
+            print(f"{name:>22}: failed, {error}")
+        else:
+            print(f"{name:>22}: {elapsed * 1000:8.1f} ms")
@@ -0,0 +1,99 @@
+import time
+import argparse
+import cv2
+import numpy as np
+from scipy import ndimage
+
+from evaluate import compute_metrics
+
+
+def reference_connectivity(pred, target, unknown, step=0.1):
+    """
+    Per-threshold loop of the usual connectivity implementation.
+    """
+    thresholds = np.linspace(0, 1, int(round(1 / step)) + 1)
+    l_map = np.full(pred.shape, -1.0)
+    for i in range(1, len(thresholds)):
+        both = (pred >= thresholds[i]) & (target >= thresholds[i])
+        labels, count = ndimage.label(both)
+        omega = np.zeros(pred.shape, dtype=bool)
+        if count > 0:
+            omega = labels == np.argmax(np.bincount(labels.ravel())[1:]) + 1
+        l_map[(l_map == -1) & ~omega] = thresholds[i - 1]
+    l_map[l_map == -1] = 1
+    pred_d = pred - l_map
+    target_d = target - l_map
+    pred_phi = 1 - pred_d * (pred_d >= 0.15)
+    target_phi = 1 - target_d * (target_d >= 0.15)
+    return np.abs(pred_phi - target_phi)[unknown].sum() / 1000
+
+
+def reference_gradient(pred, target, unknown, sigma=1.4):
+    """
+    Gradient error with the full 2-D derivative kernels.
+    """
+    epsilon = 1e-2
+    half = int(np.ceil(sigma * np.sqrt(-2 * np.log(np.sqrt(2 * np.pi) * sigma * epsilon))))
+    x = np.arange(-half, half + 1)
+    gauss = np.exp(-(x**2) / (2 * sigma**2)) / (sigma * np.sqrt(2 * np.pi))
+    hx = gauss[:, None] * (-x * gauss / sigma**2)[None, :]
+    hx = hx / np.sqrt(np.sum(hx**2))
+
+    def amplitude(im):
+        gx = ndimage.convolve(im, hx, mode="nearest")
+        gy = ndimage.convolve(im, hx.T, mode="nearest")
+        return np.sqrt(gx**2 + gy**2)
+
+    return np.square(amplitude(pred) - amplitude(target))[unknown].sum() / 1000
+
+
+def make_sample(height, width, seed):
+    rng = np.random.default_rng(seed)
+    target = np.zeros((height, width), np.uint8)
+    for _ in range(4):
+        center = (int(rng.integers(width)), int(rng.integers(height)))
+        axes = (int(rng.integers(width // 8, width // 3)), int(rng.integers(height // 8, height // 3)))
+        cv2.ellipse(target, center, axes, 0, 0, 360, 255, -1)
+    target = cv2.GaussianBlur(target, (0, 0), 8)
+    noise = cv2.GaussianBlur(rng.normal(0, 40, (height, width)), (0, 0), 3)
+    pred = np.clip(target + noise, 0, 255) / 255
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (25, 25))
+    trimap = np.full((height, width), 128, np.uint8)
+    trimap[cv2.erode((target == 255).astype(np.uint8), kernel) == 1] = 255
+    trimap[cv2.erode((target == 0).astype(np.uint8), kernel) == 1] = 0
+    return pred, target, trimap
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--samples", type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    reference_time, vectorized_time = 0.0, 0.0
+    for seed in range(args.samples):
+        pred, target, trimap = make_sample(args.height, args.width, seed)
+        start = time.perf_counter()
+        actual = compute_metrics(pred, target, trimap)
+        vectorized_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        t, unknown = target / 255, trimap == 128
+        expected = {
+            "SAD": np.abs(pred - t)[unknown].sum() / 1000,
+            "MSE": np.square(pred - t)[unknown].sum() / unknown.sum(),
+            "Grad": reference_gradient(pred, t, unknown),
+            "Conn": reference_connectivity(pred, t, unknown),
+        }
+        reference_time += time.perf_counter() - start
+
+        for name, value in expected.items():
+            assert np.isclose(actual[name], value, rtol=1e-6), (name, actual[name], value)
+        print(", ".join(f"{k} {v:.4f}" for k, v in actual.items()))
+    print("metrics match the reference implementation")
+    print(f" reference: {reference_time / args.samples * 1000:8.1f} ms/image")
+    print(f"vectorized: {vectorized_time / args.samples * 1000:8.1f} ms/image")
@@ -0,0 +1,84 @@
+import time
+import argparse
+import cv2
+import numpy as np
+import torch
+from detectron2.config import LazyConfig, instantiate
+from detectron2.checkpoint import DetectionCheckpointer
+
+from pipeline.memory import MemoryPlanner
+from pipeline.inference import (
+    generate_trimap,
+    pred_matting,
+    pred_matting_batch,
+    expand_crop,
+    matte_objects,
+    matte_within_budget,
+)
+
+
+def make_objects(height, width, count, seed=0):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    trimaps = []
+    for _ in range(count):
+        mask = np.zeros((height, width), np.uint8)
+        center = (int(rng.integers(width)), int(rng.integers(height)))
+        axes = (int(rng.integers(width // 16, width // 8)), int(rng.integers(height // 16, height // 8)))
+        cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
+        trimaps.append(generate_trimap(mask))
+    return image, trimaps
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", type=str, default="./configs/matte_anything.py")
+    parser.add_argument("--checkpoint", type=str, default="")
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--objects", type=int, default=4)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    cfg = LazyConfig.load(args.config)
+    model = instantiate(cfg.model)
+    model.to(device)
+    model.eval()
+    if args.checkpoint:
+        DetectionCheckpointer(model).load(args.checkpoint)
+    planner = MemoryPlanner(model)
+
+    image, trimaps = make_objects(args.height, args.width, args.objects)
+
+    # the batch gives the same alphas as the crops matted one by one
+    crops = [planner.roi(trimap) for trimap in trimaps]
+    size = (max(c[1] - c[0] for c in crops), max(c[3] - c[2] for c in crops))
+    boxes = [expand_crop(crop, size, image.shape[:2]) for crop in crops]
+    images = [image[y0:y1, x0:x1] for y0, y1, x0, x1 in boxes]
+    crop_trimaps = [t[y0:y1, x0:x1] for t, (y0, y1, x0, x1) in zip(trimaps, boxes)]
+    batched = pred_matting_batch(model, images, crop_trimaps)
+    for crop, trimap, alpha in zip(images, crop_trimaps, batched):
+        max_diff = np.abs(pred_matting(model, crop, trimap) - alpha).max()
+        assert max_diff < 1e-3, max_diff
+    print(f"{args.objects} objects at {size[0]}x{size[1]}, batched alphas match")
+
+    timings = {}
+    with torch.no_grad():
+        for name, run in [
+            ("one by one", lambda: [matte_within_budget(model, image, t, planner) for t in trimaps]),
+            ("batched", lambda: matte_objects(model, image, trimaps, planner)),
+        ]:
+            run()
+            if device == "cuda":
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            run()
+            if device == "cuda":
+                torch.cuda.synchronize()
+            timings[name] = time.perf_counter() - start
+    for name, elapsed in timings.items():
+        print(f"{name:>10}: {elapsed * 1000:8.1f} ms")
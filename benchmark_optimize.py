@@ -0,0 +1,80 @@
+import copy
+import time
+import argparse
+import torch
+from detectron2.config import LazyConfig, instantiate
+from detectron2.checkpoint import DetectionCheckpointer
+
+from modeling.meta_arch.optimize import optimize_for_inference
+
+
+def build_model(config, checkpoint, device):
+    cfg = LazyConfig.load(config)
+    model = instantiate(cfg.model)
+    model.to(device)
+    model.eval()
+    if checkpoint:
+        DetectionCheckpointer(model).load(checkpoint)
+    else:
+        # random BatchNorm statistics, otherwise folding is close to a no-op
+        for m in model.modules():
+            if isinstance(m, torch.nn.BatchNorm2d):
+                m.running_mean.uniform_(-0.5, 0.5)
+                m.running_var.uniform_(0.5, 2.0)
+                m.weight.data.uniform_(0.5, 1.5)
+                m.bias.data.uniform_(-0.5, 0.5)
+    return model
+
+
+def make_inputs(height, width, device):
+    image = torch.rand(1, 3, height, width, device=device)
+    trimap = torch.zeros(1, 1, height, width, device=device)
+    trimap[:, :, height // 4 : 3 * height // 4, width // 4 : 3 * width // 4] = 0.5
+    trimap[:, :, 3 * height // 8 : 5 * height // 8, 3 * width // 8 : 5 * width // 8] = 1
+    return {"image": image, "trimap": trimap}
+
+
+def timeit(model, inputs, iters, device):
+    with torch.no_grad():
+        model(inputs)
+        if device == "cuda":
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(inputs)
+        if device == "cuda":
+            torch.cuda.synchronize()
+    elapsed = (time.perf_counter() - start) / iters
+    peak = torch.cuda.max_memory_allocated() / 2**20 if device == "cuda" else float("nan")
+    return elapsed, peak
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", type=str, default="./configs/matte_anything.py")
+    parser.add_argument("--checkpoint", type=str, default="")
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--iters", type=int, default=10)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    reference = build_model(args.config, args.checkpoint, device)
+    optimized = optimize_for_inference(copy.deepcopy(reference))
+    inputs = make_inputs(args.height, args.width, device)
+
+    with torch.no_grad():
+        expected = reference(inputs)["phas"]
+        actual = optimized(inputs)["phas"]
+    max_diff = (expected - actual).abs().max().item()
+    print(f"max abs difference: {max_diff:.3e}")
+    assert torch.allclose(expected, actual, atol=1e-4), "optimized model diverges"
+
+    for name, model in [("baseline", reference), ("optimized", optimized)]:
+        elapsed, peak = timeit(model, inputs, args.iters, device)
+        print(f"{name:>10}: {elapsed * 1000:8.1f} ms/iter, peak {peak:8.1f} MiB")
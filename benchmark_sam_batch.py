@@ -0,0 +1,54 @@
+import time
+import argparse
+import numpy as np
+import torch
+
+from pipeline.image_loader import ImagePyramid
+from pipeline.inference import init_segment_anything, set_sam_image
+from pipeline.sam_embedding import embed_batch
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sam-model", type=str, default="vit_b", choices=["vit_h", "vit_b"])
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=4)
+    return parser.parse_args()
+
+
+def synchronize():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    predictor = init_segment_anything(args.sam_model)
+    rng = np.random.default_rng(0)
+    # mixed sizes and orientations, each padded to the square input on its own
+    sizes = [(1080, 1920), (1920, 1080), (768, 1024), (2000, 1500)]
+    pyramids = [
+        ImagePyramid.from_array(rng.integers(0, 256, sizes[i % len(sizes)] + (3,), dtype=np.uint8))
+        for i in range(args.images)
+    ]
+
+    embed_batch(predictor, pyramids[: args.batch_size], args.batch_size)
+    synchronize()
+    start = time.perf_counter()
+    entries = embed_batch(predictor, pyramids, args.batch_size)
+    synchronize()
+    batched_time = time.perf_counter() - start
+
+    single_time = 0.0
+    for pyramid, entry in zip(pyramids, entries):
+        start = time.perf_counter()
+        set_sam_image(predictor, pyramid)
+        synchronize()
+        single_time += time.perf_counter() - start
+        assert predictor.input_size == entry["input_size"]
+        assert predictor.original_size == entry["original_size"]
+        max_diff = (predictor.features - entry["features"]).abs().max().item()
+        assert max_diff < 1e-3, max_diff
+    print("batched embeddings match set_image")
+    print(f"one by one: {single_time / args.images * 1000:8.1f} ms/image")
+    print(f"   batched: {batched_time / args.images * 1000:8.1f} ms/image")
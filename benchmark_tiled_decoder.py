@@ -0,0 +1,62 @@
+import time
+import argparse
+import torch
+from detectron2.config import LazyConfig, instantiate
+from detectron2.checkpoint import DetectionCheckpointer
+
+from benchmark_optimize import make_inputs
+
+
+def run_decoder(decoder, features, images, tile_size, device):
+    decoder.tile_size = tile_size
+    if device == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+    start = time.perf_counter()
+    with torch.no_grad():
+        phas = decoder(features, images)["phas"]
+    if device == "cuda":
+        torch.cuda.synchronize()
+        peak = (torch.cuda.max_memory_allocated() - base) / 2**20
+    else:
+        peak = float("nan")
+    return phas, time.perf_counter() - start, peak
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", type=str, default="./configs/matte_anything.py")
+    parser.add_argument("--checkpoint", type=str, default="")
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--tile-sizes", type=int, nargs="+", default=[2048, 1024, 512])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    cfg = LazyConfig.load(args.config)
+    model = instantiate(cfg.model)
+    model.to(device)
+    model.eval()
+    if args.checkpoint:
+        DetectionCheckpointer(model).load(args.checkpoint)
+
+    with torch.no_grad():
+        images, _, _, _ = model.preprocess_inputs(
+            make_inputs(args.height, args.width, device)
+        )
+        features = model.backbone(images)
+
+    expected, elapsed, peak = run_decoder(model.decoder, features, images, None, device)
+    print(f"{'untiled':>10}: {elapsed * 1000:8.1f} ms, decoder peak {peak:8.1f} MiB")
+    for tile_size in args.tile_sizes:
+        phas, elapsed, peak = run_decoder(model.decoder, features, images, tile_size, device)
+        max_diff = (phas - expected).abs().max().item()
+        print(
+            f"{tile_size:>10}: {elapsed * 1000:8.1f} ms, decoder peak {peak:8.1f} MiB, "
+            f"max abs difference {max_diff:.3e}"
+        )
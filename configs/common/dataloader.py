@@ -3,7 +3,7 @@ from torch.utils.data import DataLoader
 from detectron2.config import LazyCall as L
 from torch.utils.data.distributed import DistributedSampler
 
-from data import ImageFileTrain, DataGenerator
+from data import ImageFileTrain, DataGenerator, BatchAugmentation, BucketBatchSampler
 
 #Dataloader
 train_dataset = DataGenerator(
@@ -13,7 +13,9 @@ train_dataset = DataGenerator(
         bg_dir='path/to/alpha',
         root='path/to/Adobe_Image_Matting'
     ),
-    phase = 'train'
+    phase = 'train',
+    crop_size = 512,
+    cache_dir = 'path/to/cache'
 )
 
 dataloader = OmegaConf.create()
@@ -27,4 +29,16 @@ dataloader.train = L(DataLoader)(
         dataset = train_dataset,
     ),
     drop_last=True
-)
\ No newline at end of file
+)
+# batches of same-size crops at several resolutions and aspect ratios, with a batch
+# size keeping the tokens per batch constant; replaces dataloader.train
+dataloader.train_bucketed = L(DataLoader)(
+    dataset = train_dataset,
+    num_workers=4,
+    pin_memory=True,
+    batch_sampler=L(BucketBatchSampler)(
+        dataset = train_dataset,
+    ),
+)
+# photometric augmentation on the GPU, pass to MattingTrainer(batch_transform=...)
+dataloader.batch_augmentation = L(BatchAugmentation)()
\ No newline at end of file
@@ -1,7 +1,7 @@
 import torch.nn as nn
 from functools import partial
 from detectron2.config import LazyCall as L
-from modeling import ViTMatte, MattingCriterion, Detail_Capture, ViT
+from modeling import ViTMatte, FusedMattingCriterion, Detail_Capture, ViT
 
 # Base
 embed_dim, num_heads = 384, 6
@@ -34,7 +34,7 @@ model = L(ViTMatte)(
         use_rel_pos=True,
         out_feature="last_feat",
     ),
-    criterion=L(MattingCriterion)(
+    criterion=L(FusedMattingCriterion)(
         losses = ['unknown_l1_loss', 'known_l1_loss', 'loss_pha_laplacian', 'loss_gradient_penalty']
     ),
     pixel_mean = [123.675 / 255., 116.280 / 255., 103.530 / 255.],
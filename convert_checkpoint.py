@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import argparse
+import torch
+from detectron2.config import LazyConfig, instantiate
+from detectron2.checkpoint import DetectionCheckpointer
+from segment_anything import sam_model_registry
+
+from pipeline.inference import models, vitmatte_models, vitmatte_config, ROOT
+from pipeline.checkpoint import mapped_path, save_mapped
+
+AEMATTER_CHECKPOINT = "./pretrained/AEMFIX.ckpt"
+
+
+def build_sam(model_type):
+    return sam_model_registry[model_type](checkpoint=models[model_type])
+
+
+def build_vitmatte(model_type):
+    # the weights before optimize_for_inference, which runs again after loading
+    model = instantiate(LazyConfig.load(vitmatte_config[model_type]).model)
+    DetectionCheckpointer(model).load(vitmatte_models[model_type])
+    return model
+
+
+def build_aematter():
+    sys.path.insert(0, os.path.join(ROOT, "AEMatter"))
+    from model import AEMatter
+
+    model = AEMatter()
+    model.load_state_dict(torch.load(AEMATTER_CHECKPOINT, map_location="cpu")["model"])
+    return model
+
+
+# name: (original checkpoint, builder loading it)
+BUILDERS = {
+    "sam_vit_h": (models["vit_h"], lambda: build_sam("vit_h")),
+    "sam_vit_b": (models["vit_b"], lambda: build_sam("vit_b")),
+    "vitmatte_vit_b": (vitmatte_models["vit_b"], lambda: build_vitmatte("vit_b")),
+    "aematter": (AEMATTER_CHECKPOINT, build_aematter),
+}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Convert checkpoints to memory-mappable files, which matte_anything.py "
+        "loads instead of the original checkpoints when they exist"
+    )
+    parser.add_argument("models", nargs="+", choices=list(BUILDERS) + ["all"])
+    parser.add_argument("--force", action="store_true", help="overwrite existing conversions")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    names = list(BUILDERS) if "all" in args.models else args.models
+    for name in names:
+        checkpoint, build = BUILDERS[name]
+        path = mapped_path(checkpoint)
+        if not os.path.exists(checkpoint):
+            print(f"{name}: {checkpoint} not found, skipped")
+            continue
+        if os.path.exists(path) and not args.force:
+            print(f"{name}: {path} exists, use --force to overwrite")
+            continue
+        start = time.perf_counter()
+        save_mapped(build(), path)
+        size = os.path.getsize(path) / 2**20
+        print(f"{name}: wrote {path} ({size:.0f} MiB) in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,4 @@
+from .cache import AssetCache
+from .dim_dataset import ImageFile, ImageFileTrain, DataGenerator
+from .augmentation import BatchAugmentation
+from .sampler import BucketBatchSampler, make_buckets
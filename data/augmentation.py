@@ -0,0 +1,52 @@
+import torch
+
+__all__ = ["BatchAugmentation"]
+
+
+class BatchAugmentation:
+    """
+    Photometric foreground augmentation applied to a whole collated batch, typically
+    on the GPU after the transfer, instead of per sample in the DataLoader workers.
+
+    Brightness, contrast, saturation and gamma of `fg` are jittered with factors
+    drawn per sample, then `image` is composited again from the jittered `fg`,
+    `bg` and `alpha`. The returned batch holds float tensors in [0, 1] for those keys.
+    """
+
+    def __init__(self, brightness=0.2, contrast=0.2, saturation=0.2, gamma=0.2, p=0.5):
+        """
+        Args:
+            brightness, contrast, saturation, gamma (float): maximum relative change.
+            p (float): probability for a sample to be augmented.
+        """
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.gamma = gamma
+        self.p = p
+
+    @staticmethod
+    def _float(x):
+        return x.float().div_(255) if x.dtype == torch.uint8 else x.float()
+
+    def _factors(self, amount, batch_size, apply, device):
+        factors = 1 + (torch.rand(batch_size, 1, 1, 1, device=device) * 2 - 1) * amount
+        return torch.where(apply, factors, torch.ones_like(factors))
+
+    @torch.no_grad()
+    def __call__(self, batch):
+        fg, bg, alpha = (self._float(batch[k]) for k in ("fg", "bg", "alpha"))
+        B, device = fg.shape[0], fg.device
+        apply = torch.rand(B, 1, 1, 1, device=device) < self.p
+
+        fg = fg * self._factors(self.brightness, B, apply, device)
+        mean = fg.mean(dim=(1, 2, 3), keepdim=True)
+        fg = (fg - mean) * self._factors(self.contrast, B, apply, device) + mean
+        gray = (fg * fg.new_tensor([0.299, 0.587, 0.114]).view(1, 3, 1, 1)).sum(1, keepdim=True)
+        fg = (fg - gray) * self._factors(self.saturation, B, apply, device) + gray
+        fg = fg.clamp_(0, 1).pow_(self._factors(self.gamma, B, apply, device))
+
+        batch = dict(batch)
+        batch["fg"], batch["bg"], batch["alpha"] = fg, bg, alpha
+        batch["image"] = fg * alpha + bg * (1 - alpha)
+        return batch
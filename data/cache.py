@@ -0,0 +1,101 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+__all__ = ["AssetCache"]
+
+
+def _decode(path, grayscale):
+    if grayscale:
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    else:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"cannot decode {path}")
+    return image if grayscale else cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def _name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class AssetCache:
+    """
+    Decoded uint8 images stored back to back in a memory-mapped `<path>.bin`, with
+    their names, offsets and shapes in `<path>.json`.
+
+    Items are zero-copy views of the mapping, which is opened lazily in every
+    process so the cache can be shared with DataLoader workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(f"{path}.json") as f:
+            self.index = json.load(f)
+        self.names = [entry["name"] for entry in self.index]
+        self._data = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        if self._pid != os.getpid():
+            self._data = np.memmap(f"{self.path}.bin", dtype=np.uint8, mode="r")
+            self._pid = os.getpid()
+        entry = self.index[i]
+        size = int(np.prod(entry["shape"]))
+        offset = entry["offset"]
+        return self._data[offset : offset + size].reshape(entry["shape"])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"], state["_pid"] = None, None
+        return state
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(f"{path}.json") and os.path.exists(f"{path}.bin")
+
+    @classmethod
+    def build(cls, paths, path, grayscale=False, num_threads=8, chunk_size=64):
+        """
+        Decode `paths` (color images to RGB) into a new cache at `path`.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        index, offset = [], 0
+        with open(f"{path}.bin.tmp", "wb") as f, ThreadPoolExecutor(num_threads) as executor:
+            for start in range(0, len(paths), chunk_size):
+                chunk = paths[start : start + chunk_size]
+                for image_path, image in zip(
+                    chunk, executor.map(lambda p: _decode(p, grayscale), chunk)
+                ):
+                    f.write(image.tobytes())
+                    index.append(
+                        {
+                            "name": _name(image_path),
+                            "offset": offset,
+                            "shape": list(image.shape),
+                        }
+                    )
+                    offset += image.nbytes
+        with open(f"{path}.json.tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(f"{path}.bin.tmp", f"{path}.bin")
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+        return cls(path)
+
+    @classmethod
+    def open_or_build(cls, paths, path, grayscale=False):
+        """
+        The cache at `path`, built from `paths` if it does not exist or holds other
+        images, e.g. after assets were added or renamed, since items are read by index.
+        """
+        if cls.exists(path):
+            cache = cls(path)
+            if cache.names == [_name(p) for p in paths]:
+                return cache
+        return cls.build(paths, path, grayscale)
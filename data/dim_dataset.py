@@ -0,0 +1,245 @@
+import os
+import glob
+from functools import reduce
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+
+from .cache import AssetCache, _decode
+
+__all__ = ["ImageFile", "ImageFileTrain", "DataGenerator"]
+
+
+class ImageFile(object):
+    def __init__(self, phase="train"):
+        self.phase = phase
+        self.rng = np.random.RandomState(0)
+
+    def _get_valid_names(self, *dirs, shuffle=True):
+        name_sets = [self._get_name_set(d) for d in dirs]
+        valid_names = sorted(reduce(lambda a, b: a & b, name_sets))
+        if shuffle:
+            self.rng.shuffle(valid_names)
+        return valid_names
+
+    @staticmethod
+    def _get_name_set(dir_name):
+        path_list = glob.glob(os.path.join(dir_name, "*"))
+        return {os.path.splitext(os.path.basename(path))[0] for path in path_list}
+
+    @staticmethod
+    def _list_abspath(data_dir, ext, data_list):
+        return [os.path.join(data_dir, name + ext) for name in data_list]
+
+
+class ImageFileTrain(ImageFile):
+    """
+    Lists the foreground, alpha and background files of a composition dataset such
+    as Adobe Image Matting. Foregrounds and alphas are matched by name.
+    """
+
+    def __init__(
+        self,
+        alpha_dir="train_alpha",
+        fg_dir="train_fg",
+        bg_dir="train_bg",
+        root="",
+        alpha_ext=".jpg",
+        fg_ext=".jpg",
+        bg_ext=".jpg",
+    ):
+        super(ImageFileTrain, self).__init__(phase="train")
+
+        self.alpha_dir = os.path.join(root, alpha_dir)
+        self.fg_dir = os.path.join(root, fg_dir)
+        self.bg_dir = os.path.join(root, bg_dir)
+        self.alpha_ext = alpha_ext
+        self.fg_ext = fg_ext
+        self.bg_ext = bg_ext
+
+        self.valid_fg_list = self._get_valid_names(self.fg_dir, self.alpha_dir)
+        self.valid_bg_list = sorted(self._get_name_set(self.bg_dir))
+
+        self.alpha = self._list_abspath(self.alpha_dir, self.alpha_ext, self.valid_fg_list)
+        self.fg = self._list_abspath(self.fg_dir, self.fg_ext, self.valid_fg_list)
+        self.bg = self._list_abspath(self.bg_dir, self.bg_ext, self.valid_bg_list)
+
+    def __len__(self):
+        return len(self.alpha)
+
+
+class _FileList:
+    """
+    Same interface as AssetCache, decoding the files on every access.
+    """
+
+    def __init__(self, paths, grayscale=False):
+        self.paths = paths
+        self.grayscale = grayscale
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, i):
+        return _decode(self.paths[i], self.grayscale)
+
+
+def _kernels(max_size=30):
+    return [None] + [
+        cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+        for size in range(1, max_size + 1)
+    ]
+
+
+class DataGenerator(Dataset):
+    """
+    Composites training samples on the fly from foregrounds, alphas and backgrounds.
+
+    Each sample crops the foreground around its unknown region at a random scale,
+    to `crop_size` or to the (h, w) given along the index by BucketBatchSampler,
+    flips it, composites it over a random background crop and generates a trimap by
+    eroding the alpha with random kernels. Everything is returned as uint8 tensors,
+    which `ViTMatte.preprocess_inputs` converts on the device:
+    image, fg, bg (3, H, W), alpha (1, H, W) and trimap (1, H, W) in 0/128/255.
+
+    With `cache_dir`, the decoded assets are read from memory-mapped AssetCaches,
+    built on first use.
+    """
+
+    def __init__(
+        self,
+        data,
+        phase="train",
+        crop_size=512,
+        scale_range=(0.75, 1.5),
+        max_kernel_size=30,
+        cache_dir=None,
+    ):
+        """
+        Args:
+            data (ImageFileTrain): the dataset files.
+            phase (str): only "train" is supported.
+            crop_size (int): side of the square training crops.
+            scale_range (tuple): range of the random foreground crop scale.
+            max_kernel_size (int): largest erosion kernel of the trimap generation.
+            cache_dir (str or None): directory of the decoded asset caches.
+        """
+        assert phase == "train", "DataGenerator only composites training samples"
+        self.phase = phase
+        self.crop_size = crop_size
+        self.scale_range = scale_range
+        self.max_kernel_size = max_kernel_size
+        self.kernels = _kernels(max_kernel_size)
+
+        if cache_dir is not None and len(data) > 0:
+            self.fg = AssetCache.open_or_build(data.fg, os.path.join(cache_dir, "fg"))
+            self.alpha = AssetCache.open_or_build(
+                data.alpha, os.path.join(cache_dir, "alpha"), grayscale=True
+            )
+            self.bg = AssetCache.open_or_build(data.bg, os.path.join(cache_dir, "bg"))
+        else:
+            self.fg = _FileList(data.fg)
+            self.alpha = _FileList(data.alpha, grayscale=True)
+            self.bg = _FileList(data.bg)
+        self._rng = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self.fg)
+
+    @property
+    def rng(self):
+        # reseeded in every worker from the seed the DataLoader gives to torch
+        if self._pid != os.getpid():
+            self._rng = np.random.default_rng(torch.initial_seed() % 2**32)
+            self._pid = os.getpid()
+        return self._rng
+
+    def _window(self, h, w, size):
+        # crop window of the aspect ratio of `size` at a random scale, fitting in h x w
+        crop_h, crop_w = size
+        scale = self.rng.uniform(*self.scale_range)
+        scale = min(scale, h / crop_h, w / crop_w)
+        return max(int(crop_h * scale), 1), max(int(crop_w * scale), 1)
+
+    def _crop_foreground(self, fg, alpha, size):
+        rng = self.rng
+        h, w = alpha.shape
+        win_h, win_w = self._window(h, w, size)
+        # center the crop on the unknown region when there is one
+        ys, xs = np.nonzero((alpha > 0) & (alpha < 255))
+        if len(ys) > 0:
+            i = rng.integers(len(ys))
+            cy, cx = ys[i], xs[i]
+        else:
+            cy, cx = rng.integers(h), rng.integers(w)
+        y0 = int(np.clip(cy - win_h // 2, 0, h - win_h))
+        x0 = int(np.clip(cx - win_w // 2, 0, w - win_w))
+        fg = fg[y0 : y0 + win_h, x0 : x0 + win_w]
+        alpha = alpha[y0 : y0 + win_h, x0 : x0 + win_w]
+        if (win_h, win_w) != tuple(size):
+            fg = cv2.resize(fg, size[::-1], interpolation=cv2.INTER_LINEAR)
+            alpha = cv2.resize(alpha, size[::-1], interpolation=cv2.INTER_LINEAR)
+        if rng.random() < 0.5:
+            fg, alpha = fg[:, ::-1], alpha[:, ::-1]
+        return fg, alpha
+
+    def _crop_background(self, bg, size):
+        rng = self.rng
+        h, w = bg.shape[:2]
+        win_h, win_w = self._window(h, w, size)
+        y0, x0 = rng.integers(h - win_h + 1), rng.integers(w - win_w + 1)
+        bg = bg[y0 : y0 + win_h, x0 : x0 + win_w]
+        if (win_h, win_w) != tuple(size):
+            bg = cv2.resize(bg, size[::-1], interpolation=cv2.INTER_LINEAR)
+        return bg
+
+    def _trimap(self, alpha):
+        rng = self.rng
+        fg_kernel = self.kernels[rng.integers(1, self.max_kernel_size + 1)]
+        bg_kernel = self.kernels[rng.integers(1, self.max_kernel_size + 1)]
+        fg_mask = cv2.erode((alpha >= 254).astype(np.uint8), fg_kernel)
+        bg_mask = cv2.erode((alpha <= 1).astype(np.uint8), bg_kernel)
+        trimap = np.full(alpha.shape, 128, dtype=np.uint8)
+        trimap[fg_mask == 1] = 255
+        trimap[bg_mask == 1] = 0
+        return trimap
+
+    def sizes(self):
+        """
+        (h, w) of every foreground, used by BucketBatchSampler.
+        """
+        if isinstance(self.fg, AssetCache):
+            return [tuple(entry["shape"][:2]) for entry in self.fg.index]
+        sizes = []
+        for path in self.fg.paths:
+            with Image.open(path) as img:
+                sizes.append(img.size[::-1])
+        return sizes
+
+    def __getitem__(self, idx):
+        if isinstance(idx, tuple):
+            # (index, (h, w)) from BucketBatchSampler
+            idx, size = idx
+        else:
+            size = (self.crop_size, self.crop_size)
+        fg, alpha = self._crop_foreground(self.fg[idx], self.alpha[idx], size)
+        bg = self._crop_background(self.bg[self.rng.integers(len(self.bg))], size)
+
+        a = alpha[..., None].astype(np.float32) * (1 / 255)
+        image = fg * a + bg * (1 - a)
+        image = np.clip(image + 0.5, 0, 255).astype(np.uint8)
+
+        def chw(array):
+            return torch.from_numpy(np.ascontiguousarray(array.transpose(2, 0, 1)))
+
+        return {
+            "image": chw(image),
+            "fg": chw(fg),
+            "bg": chw(bg),
+            "alpha": torch.from_numpy(np.ascontiguousarray(alpha))[None],
+            "trimap": torch.from_numpy(self._trimap(alpha))[None],
+        }
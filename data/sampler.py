@@ -0,0 +1,124 @@
+import math
+
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+__all__ = ["BucketBatchSampler", "make_buckets"]
+
+
+def make_buckets(sides=(512, 768, 1024), aspect_ratios=(0.5, 0.75, 1.0, 4 / 3, 2.0), multiple=32):
+    """
+    Crop sizes (h, w) with the area of `sides`**2 at each aspect ratio (w / h), rounded
+    to `multiple` so that no padding is needed.
+    """
+    buckets = set()
+    for side in sides:
+        for ratio in aspect_ratios:
+            h = max(round(side / math.sqrt(ratio) / multiple), 1) * multiple
+            w = max(round(side * math.sqrt(ratio) / multiple), 1) * multiple
+            buckets.add((h, w))
+    return sorted(buckets)
+
+
+class BucketBatchSampler(Sampler):
+    """
+    Batches samples of the same crop size, with a batch size per crop size keeping
+    the number of ViT tokens per batch close to `token_budget`.
+
+    Each sample is assigned to the largest bucket that fits in its foreground with
+    the closest aspect ratio. Batches are yielded as lists of (index, (h, w)), which
+    DataGenerator crops accordingly. Like DistributedSampler, the sampler shuffles
+    with `seed + epoch` (see `set_epoch`) and gives every rank a different part of
+    the data. At each step all ranks get a batch of the same bucket, so the steps
+    cost the same on every rank.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        buckets=None,
+        token_budget=15 * 32 * 32,
+        patch_size=16,
+        num_replicas=None,
+        rank=None,
+        shuffle=True,
+        seed=0,
+        aspect_tolerance=0.05,
+    ):
+        """
+        Args:
+            dataset (DataGenerator): provides the foreground sizes with `sizes()`.
+            buckets (list[tuple] or None): crop sizes (h, w), see `make_buckets`.
+            token_budget (int): number of patch tokens per batch, the default gives
+                batches of 15 at 512x512.
+            patch_size (int): patch size of the ViT backbone.
+            num_replicas (int or None): number of ranks, from torch.distributed if None.
+            rank (int or None): rank of this process, from torch.distributed if None.
+            shuffle (bool): shuffle samples and batches every epoch.
+            seed (int): base seed, must be the same on all ranks.
+            aspect_tolerance (float): log aspect ratios closer than this are treated
+                as the same when assigning samples.
+        """
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        self.buckets = buckets or make_buckets()
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.aspect_tolerance = aspect_tolerance
+        self.batch_sizes = [
+            max(token_budget // ((h // patch_size) * (w // patch_size)), 1) for h, w in self.buckets
+        ]
+        self.assignments = self._assign(dataset.sizes())
+
+    def _assign(self, sizes):
+        bucket_hw = np.array(self.buckets, dtype=np.float64)
+        bucket_aspect = np.log(bucket_hw[:, 1] / bucket_hw[:, 0])
+        bucket_area = bucket_hw.prod(1)
+        assignments = [[] for _ in self.buckets]
+        for index, (h, w) in enumerate(sizes):
+            fits = (bucket_hw[:, 0] <= h) & (bucket_hw[:, 1] <= w)
+            if not fits.any():
+                # smaller than every bucket, it gets upscaled to the smallest one
+                fits = bucket_area == bucket_area.min()
+            aspect_error = np.where(fits, np.abs(bucket_aspect - math.log(w / h)), np.inf)
+            # closest aspect ratio, up to the rounding of the bucket sizes, then the largest area
+            close = aspect_error <= aspect_error.min() + self.aspect_tolerance
+            assignments[int(np.argmax(np.where(close, bucket_area, -1)))].append(index)
+        return assignments
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _groups(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        groups = []
+        for bucket, (indices, batch_size) in enumerate(zip(self.assignments, self.batch_sizes)):
+            indices = np.array(indices)
+            if self.shuffle:
+                indices = rng.permutation(indices)
+            group_size = batch_size * self.num_replicas
+            # incomplete groups are dropped, like drop_last
+            for start in range(0, len(indices) - group_size + 1, group_size):
+                groups.append((bucket, indices[start : start + group_size]))
+        if self.shuffle:
+            groups = [groups[i] for i in rng.permutation(len(groups))]
+        return groups
+
+    def __iter__(self):
+        for bucket, indices in self._groups():
+            batch_size = self.batch_sizes[bucket]
+            size = self.buckets[bucket]
+            batch = indices[self.rank * batch_size : (self.rank + 1) * batch_size]
+            yield [(int(i), size) for i in batch]
+
+    def __len__(self):
+        return sum(
+            len(indices) // (batch_size * self.num_replicas)
+            for indices, batch_size in zip(self.assignments, self.batch_sizes)
+        )
@@ -1 +1,2 @@
 from .mattingtrainer import MattingTrainer
+from .prefetch import DevicePrefetcher
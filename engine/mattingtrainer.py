@@ -2,15 +2,38 @@ from detectron2.engine import AMPTrainer
 import torch
 import time
 
+from .prefetch import DevicePrefetcher
+
 def cycle(iterable):
     while True:
         for x in iterable:
             yield x
 
 class MattingTrainer(AMPTrainer):
-    def __init__(self, model, data_loader, optimizer, grad_scaler=None):
+    def __init__(
+        self, model, data_loader, optimizer, grad_scaler=None, batch_transform=None, prefetch=2
+    ):
+        """
+        Args:
+            batch_transform (callable or None): applied to each batch once it is on the
+                GPU, e.g. data.BatchAugmentation.
+            prefetch (int): number of batches moved to the GPU ahead of the training
+                step by a background thread, 0 to load them synchronously. Ignored
+                when the model is not on a CUDA device.
+        """
         super().__init__(model, data_loader, optimizer, grad_scaler=None)
-        self.data_loader_iter = iter(cycle(self.data_loader))
+        self.batch_transform = batch_transform
+        # the device of the model, so that a DDP rank prefetches to its own GPU
+        self.device = next(model.parameters()).device
+        if self.device.type != "cuda":
+            prefetch = 0
+        if prefetch > 0:
+            self.data_loader_iter = DevicePrefetcher(
+                cycle(self.data_loader), self.device, prefetch, batch_transform
+            )
+        else:
+            self.data_loader_iter = iter(cycle(self.data_loader))
+        self.prefetch = prefetch
 
     def run_step(self):
         """
@@ -23,6 +46,9 @@ class MattingTrainer(AMPTrainer):
         #matting pass
         start = time.perf_counter()        
         data = next(self.data_loader_iter)
+        if self.batch_transform is not None and not self.prefetch:
+            data = {k: v.to(self.device, non_blocking=True) for k, v in data.items()}
+            data = self.batch_transform(data)
         data_time = time.perf_counter() - start
 
         with autocast():
@@ -0,0 +1,101 @@
+import queue
+import threading
+
+import torch
+
+__all__ = ["DevicePrefetcher"]
+
+
+def _to_device(data, device):
+    if isinstance(data, torch.Tensor):
+        return data.to(device, non_blocking=True)
+    if isinstance(data, dict):
+        return {k: _to_device(v, device) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return type(data)(_to_device(v, device) for v in data)
+    return data
+
+
+def _record_stream(data, stream):
+    if isinstance(data, torch.Tensor):
+        data.record_stream(stream)
+    elif isinstance(data, dict):
+        for v in data.values():
+            _record_stream(v, stream)
+    elif isinstance(data, (list, tuple)):
+        for v in data:
+            _record_stream(v, stream)
+
+
+class _Stop:
+    pass
+
+
+class DevicePrefetcher:
+    """
+    Iterator keeping up to `depth` batches of `iterable` ready on `device`.
+
+    A background thread pulls the batches, copies them to the GPU on a side stream
+    with non-blocking transfers and applies `transform` there, so loading, transfer
+    and augmentation overlap with the training step. The consuming stream waits on
+    the copy of each batch before using it.
+    """
+
+    def __init__(self, iterable, device="cuda", depth=2, transform=None):
+        """
+        Args:
+            iterable: batches, typically from a DataLoader with pin_memory=True.
+            device (str or torch.device): target device.
+            depth (int): number of batches prepared ahead.
+            transform (callable or None): applied to each batch on the device.
+        """
+        self.device = torch.device(device)
+        if self.device.type == "cuda" and self.device.index is None:
+            self.device = torch.device("cuda", torch.cuda.current_device())
+        self.transform = transform
+        self.stream = torch.cuda.Stream(self.device) if self.device.type == "cuda" else None
+        self._queue = queue.Queue(maxsize=depth)
+        self._iterator = iter(iterable)
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def _prepare(self, batch):
+        if self.stream is None:
+            batch = _to_device(batch, self.device)
+            return (self.transform(batch) if self.transform is not None else batch), None
+        with torch.cuda.stream(self.stream):
+            batch = _to_device(batch, self.device)
+            if self.transform is not None:
+                batch = self.transform(batch)
+            ready = torch.cuda.Event()
+            ready.record(self.stream)
+        return batch, ready
+
+    def _worker(self):
+        if self.stream is not None:
+            torch.cuda.set_device(self.device)
+        try:
+            for batch in self._iterator:
+                self._queue.put(self._prepare(batch))
+        except Exception as e:
+            self._queue.put((_Stop, e))
+            return
+        self._queue.put((_Stop, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        batch, ready = self._queue.get()
+        if batch is _Stop:
+            # keep raising on later calls
+            self._queue.put((_Stop, ready))
+            if ready is not None:
+                raise ready
+            raise StopIteration
+        if ready is not None:
+            current = torch.cuda.current_stream(self.device)
+            current.wait_event(ready)
+            # the tensors were allocated on the side stream but are used on this one
+            _record_stream(batch, current)
+        return batch
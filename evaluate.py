@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import glob
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import cv2
+import numpy as np
+from scipy import ndimage
+
+METRICS = ["SAD", "MSE", "Grad", "Conn"]
+PRECISIONS = {"fp32": None, "fp16": "float16", "bf16": "bfloat16"}
+MODES = ["full", "sparse", "tiled", "budget"]
+
+# 4-connectivity within each threshold plane, no connection across planes
+_PLANE_STRUCTURE = np.zeros((3, 3, 3), dtype=bool)
+_PLANE_STRUCTURE[1] = ndimage.generate_binary_structure(2, 1)
+
+
+def compute_sad(pred, target, unknown):
+    """
+    Sum of absolute differences over the unknown region, in thousands.
+    """
+    return np.abs(pred - target)[unknown].sum() / 1000
+
+
+def compute_mse(pred, target, unknown):
+    """
+    Mean squared error over the unknown region.
+    """
+    count = np.count_nonzero(unknown)
+    return np.square(pred - target)[unknown].sum() / max(count, 1)
+
+
+def _gauss_derivative(sigma, epsilon=1e-2):
+    half = int(np.ceil(sigma * np.sqrt(-2 * np.log(np.sqrt(2 * np.pi) * sigma * epsilon))))
+    x = np.arange(-half, half + 1, dtype=np.float64)
+    gauss = np.exp(-(x**2) / (2 * sigma**2)) / (sigma * np.sqrt(2 * np.pi))
+    dgauss = -x * gauss / sigma**2
+    # the 2-D kernel outer(gauss, dgauss) normalized to unit L2 norm
+    norm = np.linalg.norm(gauss) * np.linalg.norm(dgauss)
+    return gauss, dgauss / norm
+
+
+def compute_gradient_error(pred, target, unknown, sigma=1.4):
+    """
+    Squared difference of the Gaussian gradient magnitudes over the unknown region,
+    in thousands. The derivative filter is separable and applied with two 1-D passes.
+    """
+    gauss, dgauss = _gauss_derivative(sigma)
+
+    def magnitude(image):
+        gx = cv2.sepFilter2D(image, cv2.CV_64F, dgauss, gauss, borderType=cv2.BORDER_REPLICATE)
+        gy = cv2.sepFilter2D(image, cv2.CV_64F, gauss, dgauss, borderType=cv2.BORDER_REPLICATE)
+        return np.hypot(gx, gy)
+
+    return np.square(magnitude(pred) - magnitude(target))[unknown].sum() / 1000
+
+
+def largest_components(masks):
+    """
+    Largest 4-connected component of every plane of `masks` (T, H, W), with a single
+    labeling of the whole stack. Ties go to the component found first in raster
+    order, like an argmax over the label counts of each plane.
+    """
+    labels, count = ndimage.label(masks, structure=_PLANE_STRUCTURE)
+    if count == 0:
+        return np.zeros(masks.shape, dtype=bool)
+    sizes = ndimage.histogram(labels, 1, count, count)
+    # labels are numbered in raster order, so each plane holds a contiguous range
+    last_label = np.maximum.accumulate(labels.reshape(len(masks), -1).max(1))
+    ids = np.arange(1, count + 1)
+    plane = np.searchsorted(last_label, ids)
+    order = np.lexsort((-ids, sizes, plane))
+    last = np.r_[plane[order][1:] != plane[order][:-1], True]
+    keep = np.zeros(count + 1, dtype=bool)
+    keep[ids[order][last]] = True
+    return keep[labels]
+
+
+def compute_connectivity_error(pred, target, unknown, step=0.1):
+    """
+    Connectivity error over the unknown region, in thousands. All thresholds are
+    processed at once as a (T, H, W) stack.
+    """
+    thresholds = np.linspace(0, 1, int(round(1 / step)) + 1)
+    levels = thresholds[1:, None, None]
+    omega = largest_components((pred >= levels) & (target >= levels))
+    # the last threshold at which each pixel still belongs to the largest component
+    lost = ~omega
+    l_map = np.where(lost.any(0), thresholds[lost.argmax(0)], 1.0)
+    pred_d = pred - l_map
+    target_d = target - l_map
+    pred_phi = 1 - pred_d * (pred_d >= 0.15)
+    target_phi = 1 - target_d * (target_d >= 0.15)
+    return np.abs(pred_phi - target_phi)[unknown].sum() / 1000
+
+
+def compute_metrics(pred, target, trimap):
+    """
+    SAD, MSE, Gradient and Connectivity errors of the alpha `pred` in [0, 1] against
+    the uint8 ground truth `target`, over the unknown region of the uint8 trimap.
+    """
+    pred = pred.astype(np.float64)
+    target = target.astype(np.float64) / 255
+    unknown = trimap == 128
+    return {
+        "SAD": compute_sad(pred, target, unknown),
+        "MSE": compute_mse(pred, target, unknown),
+        "Grad": compute_gradient_error(pred, target, unknown),
+        "Conn": compute_connectivity_error(pred, target, unknown),
+    }
+
+
+def _evaluate_sample(pred, alpha_path, trimap_path):
+    target = cv2.imread(alpha_path, cv2.IMREAD_GRAYSCALE)
+    trimap = cv2.imread(trimap_path, cv2.IMREAD_GRAYSCALE)
+    return compute_metrics(pred, target, trimap)
+
+
+def list_samples(image_dir, trimap_dir, alpha_dir):
+    """
+    (name, image, trimap, alpha) paths of the files found in all three directories,
+    matched by name whatever the extensions.
+    """
+
+    def by_name(directory):
+        paths = glob.glob(os.path.join(directory, "*"))
+        return {os.path.splitext(os.path.basename(p))[0]: p for p in paths}
+
+    images, trimaps, alphas = by_name(image_dir), by_name(trimap_dir), by_name(alpha_dir)
+    names = sorted(images.keys() & trimaps.keys() & alphas.keys())
+    return [(name, images[name], trimaps[name], alphas[name]) for name in names]
+
+
+def configure(model, mode, tile_size):
+    """
+    Set the ViTMatte inference options of `mode` on the model.
+    """
+    if model.__class__.__name__ != "ViTMatte":
+        return
+    model.backbone.sparse_window_skip = mode == "sparse"
+    model.decoder.tile_size = tile_size if mode == "tiled" else None
+
+
+def evaluate(model, samples, precision, mode, pool, tile_size, max_pending):
+    """
+    Run the model on every sample in this process while the metrics of the previous
+    samples are computed on `pool`. Returns the mean metrics and the inference time.
+    """
+    import torch
+    from pipeline import inference
+    from pipeline.memory import MemoryPlanner
+
+    planner = MemoryPlanner(model) if mode == "budget" else None
+    dtype = PRECISIONS[precision]
+    autocast = torch.autocast(
+        device_type=inference.device,
+        dtype=getattr(torch, dtype) if dtype else None,
+        enabled=dtype is not None,
+    )
+    configure(model, mode, tile_size)
+
+    pending, results, inference_time = set(), [], 0.0
+    for name, image_path, trimap_path, alpha_path in samples:
+        image = cv2.cvtColor(cv2.imread(image_path, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        trimap = cv2.imread(trimap_path, cv2.IMREAD_GRAYSCALE)
+        start = time.perf_counter()
+        with torch.no_grad(), autocast:
+            if planner is not None:
+                alpha = inference.matte_within_budget(model, image, trimap, planner)
+            else:
+                alpha = inference.pred_matting(model, image, trimap)
+        inference_time += time.perf_counter() - start
+        alpha = np.asarray(alpha, dtype=np.float32).reshape(trimap.shape)
+
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            results.extend(f.result() for f in done)
+        pending.add(pool.submit(_evaluate_sample, alpha, alpha_path, trimap_path))
+    results.extend(f.result() for f in wait(pending).done)
+
+    report = {k: float(np.mean([r[k] for r in results])) for k in METRICS}
+    report["num_images"] = len(results)
+    report["seconds_per_image"] = inference_time / max(len(results), 1)
+    return report
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image-dir", type=str, required=True)
+    parser.add_argument("--trimap-dir", type=str, required=True)
+    parser.add_argument("--alpha-dir", type=str, required=True)
+    parser.add_argument(
+        "--matte-method",
+        "-m",
+        type=str,
+        default="ViTMatte",
+        choices=["ViTMatte", "DiffMatte", "AEMatter"],
+    )
+    parser.add_argument("--precision", type=str, nargs="+", default=["fp32"], choices=list(PRECISIONS))
+    parser.add_argument(
+        "--mode",
+        type=str,
+        nargs="+",
+        default=["full"],
+        choices=MODES,
+        help="full, sparse attention windows, tiled decoder or memory planned matting",
+    )
+    parser.add_argument("--tile-size", type=int, default=512, help="decoder tile size of --mode tiled")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="metric processes")
+    parser.add_argument("--limit", type=int, default=None, help="evaluate the first N samples")
+    parser.add_argument("--output", type=str, default="evaluation.json")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    samples = list_samples(args.image_dir, args.trimap_dir, args.alpha_dir)[: args.limit]
+    if not samples:
+        raise SystemExit("no image/trimap/alpha triplets found")
+
+    # the metric processes are spawned, so they import this script without torch
+    # instead of forking the process holding the model and its CUDA context
+    from pipeline.inference import init_matte
+
+    model = init_matte(args.matte_method, "vit_b")
+
+    report = {}
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            report = json.load(f)
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        for precision, mode in itertools.product(args.precision, args.mode):
+            if mode != "full" and mode != "budget" and args.matte_method != "ViTMatte":
+                print(f"skipping {mode}: ViTMatte only")
+                continue
+            result = evaluate(model, samples, precision, mode, pool, args.tile_size, 2 * args.workers)
+            print(f"{args.matte_method} {precision} {mode}: " + ", ".join(f"{k} {result[k]:.4f}" for k in METRICS))
+            report.setdefault(args.matte_method, {}).setdefault(precision, {})[mode] = result
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.output}")
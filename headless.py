@@ -0,0 +1,230 @@
+import os
+import glob
+import time
+import argparse
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths += sorted(
+                p for p in glob.glob(os.path.join(item, "*")) if p.lower().endswith(IMAGE_EXTS)
+            )
+        else:
+            paths.append(item)
+    return paths
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Matte images without the UI. With --trimap-dir only the matting "
+        "model is loaded, otherwise the foreground is found with GroundingDINO and SAM."
+    )
+    parser.add_argument("inputs", nargs="+", help="images or directories of images")
+    parser.add_argument("--output-dir", "-o", type=str, default="your_demos")
+    parser.add_argument(
+        "--trimap-dir",
+        type=str,
+        default=None,
+        help="use the trimaps of the same name from this directory instead of segmenting",
+    )
+    parser.add_argument(
+        "--matte-method",
+        "-m",
+        type=str,
+        default="ViTMatte",
+        choices=["ViTMatte", "DiffMatte", "AEMatter"],
+    )
+    parser.add_argument("--sam-model", type=str, default="vit_h", choices=["vit_h", "vit_b"])
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=4,
+        help="images segmented together: SAM encodes them in one batch, halved when "
+        "running out of memory, and GroundingDINO detects each caption over all of them",
+    )
+    parser.add_argument("--fg-caption", type=str, default="the biggest foreground object")
+    parser.add_argument("--fg-box-threshold", type=float, default=0.25)
+    parser.add_argument("--fg-text-threshold", type=float, default=0.25)
+    parser.add_argument(
+        "--multi-object",
+        action="store_true",
+        help="matte every foreground detection, written as <name>_<i>.png",
+    )
+    parser.add_argument(
+        "--tr-caption",
+        type=str,
+        default="glass, lens, crystal, diamond, bubble, bulb, web, grid",
+        help="transparent objects marked unknown in the trimap, empty to disable",
+    )
+    parser.add_argument("--tr-box-threshold", type=float, default=0.5)
+    parser.add_argument("--tr-text-threshold", type=float, default=0.25)
+    parser.add_argument("--erode-kernel-size", type=int, default=10)
+    parser.add_argument("--dilate-kernel-size", type=int, default=10)
+    parser.add_argument("--sparse-windows", action="store_true")
+    parser.add_argument("--decoder-tile-size", type=int, default=None)
+    parser.add_argument("--memory-budget-mb", type=int, default=None)
+    parser.add_argument("--save-trimap", action="store_true", help="also write <name>_trimap.png")
+    return parser.parse_args(argv)
+
+
+class Segmenter:
+    """
+    Foreground masks and transparent object boxes of a batch of images, as in the
+    UI without clicked points: the box of the best foreground detection prompts SAM,
+    or with --multi-object the boxes of all of them at once. The image center is
+    used when nothing is detected. SAM encodes and GroundingDINO detects each
+    caption over the whole batch, only the prompts are decoded image by image.
+    """
+
+    def __init__(self, args):
+        from pipeline.inference import init_segment_anything, init_grounding_dino
+        from pipeline.grounding import CaptionCache
+
+        self.args = args
+        self.predictor = init_segment_anything(args.sam_model)
+        self.grounding_dino = init_grounding_dino()
+        # the same two captions for every image
+        self.captions = CaptionCache(self.grounding_dino)
+
+    def detect(self, images, caption, box_threshold, text_threshold):
+        from pipeline.inference import dino_predict_batch
+
+        return dino_predict_batch(
+            self.grounding_dino,
+            images,
+            caption,
+            box_threshold,
+            text_threshold,
+            caption_cache=self.captions,
+        )
+
+    def __call__(self, pyramids):
+        import torch
+        from torchvision.ops import box_convert
+        from pipeline.inference import device, dino_preprocess
+        from pipeline.sam_embedding import embed_batch, restore
+
+        args, predictor = self.args, self.predictor
+        embeddings = embed_batch(predictor, pyramids, args.batch_size)
+        images = [dino_preprocess(pyramid.for_dino()) for pyramid in pyramids]
+        fg_detections = self.detect(
+            images, args.fg_caption, args.fg_box_threshold, args.fg_text_threshold
+        )
+        tr_detections = [None] * len(pyramids)
+        if args.tr_caption:
+            tr_detections = self.detect(
+                images, args.tr_caption, args.tr_box_threshold, args.tr_text_threshold
+            )
+
+        results = []
+        for pyramid, embedding, (boxes, logits, _), tr_detection in zip(
+            pyramids, embeddings, fg_detections, tr_detections
+        ):
+            h, w = pyramid.size
+            restore(predictor, embedding)
+            if len(boxes) > 0:
+                if not args.multi_object:
+                    boxes = boxes[torch.argmax(logits)][None]
+                box = boxes.to(device) * torch.tensor([w, h, w, h], device=device)
+                box = box_convert(boxes=box, in_fmt="cxcywh", out_fmt="xyxy")
+                prompt = {"boxes": predictor.transform.apply_boxes_torch(box, (h, w))}
+            else:
+                point = torch.tensor([[[w // 2, h // 2]]], dtype=torch.float, device=device)
+                prompt = {
+                    "point_coords": predictor.transform.apply_coords_torch(point, (h, w)),
+                    "point_labels": torch.ones((1, 1), device=device),
+                }
+            masks, _, _ = predictor.predict_torch(multimask_output=False, **prompt)
+            masks = masks[:, 0].cpu().numpy().astype("uint8") * 255
+
+            tr_boxes = []
+            if tr_detection is not None:
+                tr_boxes = box_convert(boxes=tr_detection[0], in_fmt="cxcywh", out_fmt="xyxy")
+                tr_boxes = tr_boxes.numpy() * [w, h, w, h]
+            results.append((masks, tr_boxes))
+        return results
+
+
+def main(args):
+    paths = list_images(args.inputs)
+    if not paths:
+        raise SystemExit("no input images")
+
+    # the models and their backends are only imported once the arguments are valid
+    start = time.perf_counter()
+    import cv2
+    import torch
+    import numpy as np
+    from pipeline.image_loader import ImagePyramid
+    from pipeline.memory import MemoryPlanner
+    from pipeline.inference import (
+        init_matte,
+        generate_trimap,
+        convert_pixels,
+        matte_within_budget,
+        matte_objects,
+    )
+
+    matting_model = init_matte(args.matte_method, "vit_b")
+    if args.sparse_windows and args.matte_method == "ViTMatte":
+        matting_model.backbone.sparse_window_skip = True
+    if args.decoder_tile_size and args.matte_method == "ViTMatte":
+        matting_model.decoder.tile_size = args.decoder_tile_size
+    planner = MemoryPlanner(
+        matting_model,
+        budget_bytes=args.memory_budget_mb * 2**20 if args.memory_budget_mb else None,
+    )
+    segmenter = Segmenter(args) if args.trimap_dir is None else None
+    print(f"models ready in {time.perf_counter() - start:.1f}s")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    batch_size = max(args.batch_size, 1)
+    for batch_start in range(0, len(paths), batch_size):
+        batch = paths[batch_start : batch_start + batch_size]
+        pyramids = [ImagePyramid.from_file(path) for path in batch]
+        segmentations = [None] * len(batch)
+        if segmenter is not None:
+            start = time.perf_counter()
+            segmentations = segmenter(pyramids)
+            print(f"{len(batch)} images segmented in {time.perf_counter() - start:.2f}s")
+
+        for path, pyramid, segmentation in zip(batch, pyramids, segmentations):
+            start = time.perf_counter()
+            name = os.path.splitext(os.path.basename(path))[0]
+            image = pyramid.full
+            if segmenter is None:
+                trimap_paths = glob.glob(os.path.join(args.trimap_dir, name + ".*"))
+                if not trimap_paths:
+                    print(f"{path}: no trimap, skipped")
+                    continue
+                trimaps = [cv2.imread(trimap_paths[0], cv2.IMREAD_GRAYSCALE)]
+            else:
+                masks, tr_boxes = segmentation
+                trimaps = []
+                for mask in masks:
+                    trimap = generate_trimap(mask, args.erode_kernel_size, args.dilate_kernel_size)
+                    if len(tr_boxes) > 0:
+                        trimap = convert_pixels(trimap, tr_boxes)
+                    trimaps.append(trimap)
+
+            with torch.no_grad():
+                if len(trimaps) == 1:
+                    alphas = [matte_within_budget(matting_model, image, trimaps[0], planner)]
+                else:
+                    alphas = matte_objects(matting_model, image, trimaps, planner)
+            bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            for i, (alpha, trimap) in enumerate(zip(alphas, trimaps)):
+                out_name = name if len(alphas) == 1 else f"{name}_{i}"
+                alpha = (np.clip(alpha, 0, 1) * 255 + 0.5).astype(np.uint8)
+                cv2.imwrite(os.path.join(args.output_dir, f"{out_name}.png"), np.dstack([bgr, alpha]))
+                if args.save_trimap:
+                    cv2.imwrite(os.path.join(args.output_dir, f"{out_name}_trimap.png"), trimap)
+            print(f"{path}: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main(parse_arguments())
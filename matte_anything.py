@@ -1,44 +1,37 @@
-import os
-import sys
 import cv2
 import torch
+import atexit
 import argparse
 import numpy as np
 import gradio as gr
-from PIL import Image
-from re import findall
 from torchvision.ops import box_convert
-from detectron2.config import LazyConfig, instantiate
-from detectron2.checkpoint import DetectionCheckpointer
-from segment_anything import sam_model_registry, SamPredictor
-import groundingdino.datasets.transforms as T
-from groundingdino.util.inference import (
-    load_model as dino_load_model,
-    predict as dino_predict,
-    annotate as dino_annotate,
+from pipeline.instrumentation import Instrumentation
+from pipeline.memory import MemoryPlanner
+from pipeline.tracing import TraceSampler
+from pipeline.workers import WorkerPool
+from pipeline.transport import SlabRing
+from pipeline.image_loader import ImagePyramid
+from pipeline.warmup import Warmup, parse_size
+from pipeline.result_cache import ResultCache, file_identity
+from pipeline.checkpoint import mapped_path
+from pipeline.sam_embedding import EmbeddingCache
+from pipeline.grounding import CaptionCache
+from pipeline.inference import (
+    device,
+    models,
+    grounding_dino as grounding_dino_files,
+    init_segment_anything,
+    init_matte,
+    matte_checkpoint,
+    init_grounding_dino,
+    dino_preprocess,
+    dino_predict,
+    generate_trimap,
+    convert_pixels,
+    matte_within_budget,
+    matte_objects,
 )
-
-
-MATTING_MODELS = ["ViTMatte", "DiffMatte", "AEMatter"]
-MATTING_IDX = 0
-
-models = {
-    "vit_h": "./pretrained/sam_vit_h_4b8939.pth",
-    "vit_b": "./pretrained/sam_vit_b_01ec64.pth",
-}
-
-vitmatte_models = {
-    "vit_b": "./pretrained/ViTMatte_B_DIS.pth",
-}
-
-vitmatte_config = {
-    "vit_b": "./configs/matte_anything.py",
-}
-
-grounding_dino = {
-    "config": "./GroundingDINO/groundingdino/config/GroundingDINO_SwinT_OGC.py",
-    "weight": "./pretrained/groundingdino_swint_ogc.pth",
-}
+from groundingdino.util.inference import annotate as dino_annotate
 
 
 def generate_checkerboard_image(height, width, num_squares):
@@ -71,103 +64,8 @@ def generate_white_background(height, width):
     return image
 
 
-def init_segment_anything(model_type):
-    """
-    Initialize the segmenting anything with model_type in ['vit_b', 'vit_l', 'vit_h']
-    """
-
-    sam = sam_model_registry[model_type](checkpoint=models[model_type]).to(device)
-    predictor = SamPredictor(sam)
-
-    return predictor
-
-
-def init_matte(matte_method, vitmatte_model):
-    if matte_method == "ViTMatte":
-        return init_vitmatte(vitmatte_model)
-    elif matte_method == "DiffMatte":
-        return init_diffmatte()
-    elif matte_method == "AEMatter":
-        return init_aematter()
-    else:
-        raise ValueError("Unknown matting model")
-
-
-def init_vitmatte(model_type):
-    """
-    Initialize the vitmatte with model_type in ['vit_s', 'vit_b']
-    """
-    cfg = LazyConfig.load(vitmatte_config[model_type])
-    vitmatte = instantiate(cfg.model)
-    vitmatte.to(device)
-    vitmatte.eval()
-    DetectionCheckpointer(vitmatte).load(vitmatte_models[model_type])
-
-    return vitmatte
-
-
-def init_diffmatte(
-    model="./DiffMatte/configs/ViTS_1024.py",
-    checkpoint="./pretrained/DiffMatte_ViTS_Com_1024.pth",
-    sample_strategy="ddim10",
-):
-
-    diffmatte_path = os.path.join(os.path.dirname(__file__), "DiffMatte")
-    sys.path.insert(0, diffmatte_path)
-
-    cfg = LazyConfig.load(model)
-    if sample_strategy is not None:
-        cfg.difmatte.args["use_ddim"] = True if "ddim" in sample_strategy else False
-        cfg.diffusion.steps = int(findall(r"\d+", sample_strategy)[0])
-
-    model = instantiate(cfg.model)
-    diffusion = instantiate(cfg.diffusion)
-    cfg.difmatte.model = model
-    cfg.difmatte.diffusion = diffusion
-    difmatte = instantiate(cfg.difmatte)
-    difmatte.to(device)
-    difmatte.eval()
-    DetectionCheckpointer(difmatte).load(checkpoint)
-
-    return difmatte
-
-
-def init_aematter(
-    checkpoint="./pretrained/AEMFIX.ckpt",
-):
-    aematte_path = os.path.join(os.path.dirname(__file__), "AEMatter")
-    sys.path.insert(0, aematte_path)
-
-    from model import AEMatter
-
-    aematter = AEMatter()
-    aematter.load_state_dict(torch.load(checkpoint, map_location="cpu")["model"])
-    aematter = aematter.to(device)
-    aematter.eval()
-
-    return aematter
-
-
-def generate_trimap(mask, erode_kernel_size=10, dilate_kernel_size=10):
-    erode_kernel = np.ones((erode_kernel_size, erode_kernel_size), np.uint8)
-    dilate_kernel = np.ones((dilate_kernel_size, dilate_kernel_size), np.uint8)
-    eroded = cv2.erode(mask, erode_kernel, iterations=5)
-    dilated = cv2.dilate(mask, dilate_kernel, iterations=5)
-    trimap = np.zeros_like(mask)
-    trimap[dilated == 255] = 128
-    trimap[eroded == 255] = 255
-    return trimap
-
-
-# user click the image to get points, and show the points on the image
-def get_point(img, sel_pix, point_type, evt: gr.SelectData):
-    if point_type == "foreground_point":
-        sel_pix.append((evt.index, 1))  # append the foreground_point
-    elif point_type == "background_point":
-        sel_pix.append((evt.index, 0))  # append the background_point
-    else:
-        sel_pix.append((evt.index, 1))  # default foreground_point
-    # draw points
+# draw the selected points on the image
+def draw_points(img, sel_pix):
     for point, label in sel_pix:
         cv2.drawMarker(
             img,
@@ -177,29 +75,7 @@ def get_point(img, sel_pix, point_type, evt: gr.SelectData):
             markerSize=20,
             thickness=5,
         )
-    if img[..., 0][0, 0] == img[..., 2][0, 0]:  # BGR to RGB
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    return img if isinstance(img, np.ndarray) else np.array(img)
-
-
-# undo the selected point
-def undo_points(orig_img, sel_pix):
-    temp = orig_img.copy()
-    # draw points
-    if len(sel_pix) != 0:
-        sel_pix.pop()
-        for point, label in sel_pix:
-            cv2.drawMarker(
-                temp,
-                point,
-                colors[label],
-                markerType=markers[label],
-                markerSize=20,
-                thickness=5,
-            )
-    if temp[..., 0][0, 0] == temp[..., 2][0, 0]:  # BGR to RGB
-        temp = cv2.cvtColor(temp, cv2.COLOR_BGR2RGB)
-    return temp if isinstance(temp, np.ndarray) else np.array(temp)
+    return img
 
 
 # undo all selected points
@@ -226,88 +102,6 @@ def store_img(img):
     return img, []  # when new image is uploaded, `selected_points` should be empty
 
 
-def convert_pixels(gray_image, boxes):
-    converted_image = np.copy(gray_image)
-
-    for box in boxes:
-        x1, y1, x2, y2 = box
-        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-        converted_image[y1:y2, x1:x2][converted_image[y1:y2, x1:x2] == 1] = 0.5
-
-    return converted_image
-
-
-def pred_matting(model, input_x, trimap):
-    input = {
-        "image": torch.from_numpy(input_x).permute(2, 0, 1).unsqueeze(0) / 255,
-        "trimap": torch.from_numpy(trimap).unsqueeze(0).unsqueeze(0),
-    }
-
-    if model.__class__.__name__ == "ViTMatte":
-        alpha = model(input)
-        alpha = alpha["phas"].flatten(0, 2)
-        alpha = alpha.detach().cpu().numpy()
-    elif model.__class__.__name__ == "DifMatte":
-        alpha = model(input)
-        alpha /= 255.0
-    elif model.__class__.__name__ == "AEMatter":
-        trimap = np.array(trimap * 255, np.uint8)
-        trimap[trimap == 127] = 128
-        trimap_nonp = trimap.copy()
-        image, trimap, sizes = preprocess_input(input_x, trimap)
-        with torch.no_grad():
-            alpha = model(image, trimap)
-            alpha = postprocess_alpha(alpha, trimap_nonp, sizes)
-    return alpha
-
-
-def preprocess_input(rawimg, trimap):
-    h, w, c = rawimg.shape
-    nonph, nonpw, _ = rawimg.shape
-    newh = (((h - 1) // 32) + 1) * 32
-    neww = (((w - 1) // 32) + 1) * 32
-    padh = newh - h
-    padh1 = int(padh / 2)
-    padh2 = padh - padh1
-    padw = neww - w
-    padw1 = int(padw / 2)
-    padw2 = padw - padw1
-    rawimg_pad = cv2.copyMakeBorder(
-        rawimg, padh1, padh2, padw1, padw2, cv2.BORDER_REFLECT
-    )
-    trimap_pad = cv2.copyMakeBorder(
-        trimap, padh1, padh2, padw1, padw2, cv2.BORDER_REFLECT
-    )
-    h_pad, w_pad, _ = rawimg_pad.shape
-    tritemp = np.zeros([*trimap_pad.shape, 3], np.float32)
-    tritemp[:, :, 0] = trimap_pad == 0
-    tritemp[:, :, 1] = trimap_pad == 128
-    tritemp[:, :, 2] = trimap_pad == 255
-    tritempimgs = np.transpose(tritemp, (2, 0, 1))
-    tritempimgs = tritempimgs[np.newaxis, :, :, :]
-    img = np.transpose(rawimg_pad, (2, 0, 1))[np.newaxis, ::-1, :, :]
-    img = np.array(img, np.float32)
-    img = img / 255.0
-    img = torch.from_numpy(img).to(device)
-    tritempimgs = torch.from_numpy(tritempimgs).to(device)
-    sizes = {"h": h, "w": w, "padh1": padh1, "padw1": padw1}
-    return img, tritempimgs, sizes
-
-
-def postprocess_alpha(pred, trimap_nonp, sizes):
-    h, w, padh1, padw1 = sizes["h"], sizes["w"], sizes["padh1"], sizes["padw1"]
-    pred = pred.detach().cpu().numpy()[0]
-    pred = pred[:, padh1 : padh1 + h, padw1 : padw1 + w]
-    preda = pred[0:1,] * 255
-    preda = np.transpose(preda, (1, 2, 0))
-    preda = (
-        preda * (trimap_nonp[:, :, None] == 128)
-        + (trimap_nonp[:, :, None] == 255) * 255
-    )
-    preda /= 255.0
-    return preda.squeeze()
-
-
 def parse_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -318,29 +112,398 @@ def parse_arguments():
         choices=["ViTMatte", "DiffMatte", "AEMatter"],
         help="Matting method to use (default: 'ViTMatte')",
     )
+    parser.add_argument(
+        "--sparse-windows",
+        action="store_true",
+        help="ViTMatte only: skip attention windows without unknown trimap pixels",
+    )
+    parser.add_argument(
+        "--decoder-tile-size",
+        type=int,
+        default=None,
+        help="ViTMatte only: run the full resolution decoder stages on tiles of this size",
+    )
+    parser.add_argument(
+        "--memory-budget-mb",
+        type=int,
+        default=None,
+        help="Memory budget of the matting stage, degrades to ROI, tiled or downscaled "
+        "matting above it (default: free CUDA memory, no budget on CPU)",
+    )
+    parser.add_argument(
+        "--preview-size",
+        type=int,
+        default=1024,
+        help="Long side of the fast preview in the UI, 0 disables it (default: 1024)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="CPU only: serve requests from this many forked worker processes sharing "
+        "the model weights, each pinned to its own cores (default: 1, in process)",
+    )
+    parser.add_argument(
+        "--shm-slabs",
+        type=int,
+        default=0,
+        help="With --workers, pass images and results through this many shared memory "
+        "slabs instead of pickling them (default: 0, pickle)",
+    )
+    parser.add_argument(
+        "--shm-slab-mb",
+        type=int,
+        default=64,
+        help="Size of each shared memory slab, larger arrays are pickled (default: 64)",
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        type=str,
+        default=None,
+        help="Append per-stage latency and memory of each request to this JSON lines file",
+    )
+    parser.add_argument(
+        "--result-cache-dir",
+        type=str,
+        default=None,
+        help="Reuse the results of identical requests, stored in this directory "
+        "(default: disabled)",
+    )
+    parser.add_argument(
+        "--result-cache-mb",
+        type=int,
+        default=1024,
+        help="Size of the result cache on disk, least recently used entries are evicted "
+        "(default: 1024)",
+    )
+    parser.add_argument(
+        "--result-cache-memory",
+        type=int,
+        default=16,
+        help="Number of results also kept in memory (default: 16)",
+    )
+    parser.add_argument(
+        "--sam-embedding-cache",
+        type=int,
+        default=8,
+        help="Number of SAM image embeddings kept for the live mask preview and "
+        "repeated runs on the same image, about 4MB each (default: 8)",
+    )
+    parser.add_argument(
+        "--warmup-sizes",
+        type=str,
+        nargs="*",
+        default=["1024x1024"],
+        help="Run the models on synthetic HxW inputs at startup before reporting ready, "
+        "none to skip (default: 1024x1024)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus-style per-stage metrics on this port at /metrics, and "
+        "the readiness and warmup timings at /ready",
+    )
+    parser.add_argument(
+        "--trace-python-memory",
+        action="store_true",
+        help="Record peak host memory of each stage with tracemalloc (slow)",
+    )
+    parser.add_argument(
+        "--profile-sample-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests recorded with torch.profiler (default: 0, disabled)",
+    )
+    parser.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="Also record the profiled requests with cProfile",
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_arguments()
 
-    if torch.cuda.is_available():
-        device = "cuda"
-    else:
-        device = "cpu"
-
     sam_model = "vit_h"
     vitmatte_model = "vit_b"
 
     colors = [(255, 0, 0), (0, 255, 0)]
     markers = [1, 5]
+    mask_color = np.array([30, 144, 255])
+
+    instrumentation = Instrumentation(
+        jsonl_path=args.metrics_jsonl,
+        port=args.metrics_port,
+        trace_python_memory=args.trace_python_memory,
+    )
+    # /ready reports 503 until the models are loaded and warmed up
+    warmup = Warmup([parse_size(size) for size in args.warmup_sizes])
+    instrumentation.set_readiness(warmup.status)
+    instrumentation.add_collector(warmup.prometheus_metrics)
 
     print("Initializing models... Please wait...")
 
     predictor = init_segment_anything(sam_model)
     matting_model = init_matte(args.matte_method, vitmatte_model)
-    grounding_dino = dino_load_model(grounding_dino["config"], grounding_dino["weight"])
+    if args.sparse_windows and args.matte_method == "ViTMatte":
+        matting_model.backbone.sparse_window_skip = True
+    if args.decoder_tile_size and args.matte_method == "ViTMatte":
+        matting_model.decoder.tile_size = args.decoder_tile_size
+    grounding_dino = init_grounding_dino()
+    captions = CaptionCache(grounding_dino)
+    planner = MemoryPlanner(
+        matting_model,
+        budget_bytes=args.memory_budget_mb * 2**20 if args.memory_budget_mb else None,
+    )
+    warmup.run(predictor, matting_model, grounding_dino, planner, captions)
+
+    result_cache = None
+    if args.result_cache_dir is not None:
+        result_cache = ResultCache(
+            args.result_cache_dir,
+            max_bytes=args.result_cache_mb * 2**20,
+            memory_entries=args.result_cache_memory,
+        )
+        instrumentation.add_collector(result_cache.prometheus_metrics)
+    embeddings = EmbeddingCache(args.sam_embedding_cache)
+    instrumentation.add_collector(embeddings.prometheus_metrics)
+    instrumentation.add_collector(captions.prometheus_metrics)
+    # everything besides the request inputs that changes the results, with the
+    # checkpoints the models were loaded from
+    matting_checkpoint = matte_checkpoint(args.matte_method, vitmatte_model)
+    model_identity = {
+        "sam": [sam_model]
+        + file_identity(models[sam_model], mapped_path(models[sam_model])),
+        "grounding_dino": file_identity(grounding_dino_files["weight"]),
+        "matting": [args.matte_method, vitmatte_model]
+        + file_identity(matting_checkpoint, mapped_path(matting_checkpoint)),
+        "sparse_windows": args.sparse_windows,
+        "decoder_tile_size": args.decoder_tile_size,
+        "memory_budget_mb": args.memory_budget_mb,
+    }
 
+    tracer = TraceSampler(
+        instrumentation,
+        sample_rate=args.profile_sample_rate,
+        output_dir=f"profiling_results/{args.matte_method}",
+        cprofile=args.cprofile,
+    )
+
+    def state_to_arrays(state):
+        return {
+            "low_res_logits": state["low_res_logits"].numpy(),
+            "input_size": np.array(state["input_size"]),
+            "tr_boxes": np.asarray(state["tr_boxes"]),
+            "erode_kernel_size": np.array(state["erode_kernel_size"]),
+            "dilate_kernel_size": np.array(state["dilate_kernel_size"]),
+        }
+
+    def state_from_arrays(arrays):
+        return {
+            "low_res_logits": torch.from_numpy(arrays["low_res_logits"].copy()),
+            "input_size": tuple(int(x) for x in arrays["input_size"]),
+            "tr_boxes": arrays["tr_boxes"],
+            "erode_kernel_size": int(arrays["erode_kernel_size"]),
+            "dilate_kernel_size": int(arrays["dilate_kernel_size"]),
+        }
+
+    def preview_input(input_x, preview):
+        """
+        The image the pipeline runs on, reduced to the preview size if enabled, and
+        its scale.
+        """
+        if preview and args.preview_size and max(input_x.shape[:2]) > args.preview_size:
+            scale = args.preview_size / max(input_x.shape[:2])
+            size = (round(input_x.shape[1] * scale), round(input_x.shape[0] * scale))
+            return cv2.resize(input_x, size, interpolation=cv2.INTER_AREA), scale
+        return input_x, 1.0
+
+    def embed(input_x, image_key):
+        """
+        SAM embedding of `input_x`, which is the image hashed to `image_key` or its
+        preview. Without a key, it is computed and not cached.
+        """
+        h, w = input_x.shape[:2]
+        key = f"{image_key}:{h}x{w}" if image_key is not None else None
+        return embeddings.embed(predictor, ImagePyramid.from_array(input_x), key)
+
+    def upload_image(img, preview):
+        """
+        Store the uploaded image, and embed it right away so that the first click
+        already gets a live mask. The matting state of the previous image is
+        dropped, so that Export needs a preview of the new one.
+        """
+        image_key = ResultCache.key(img)
+        embed(preview_input(img, preview)[0], image_key)
+        return store_img(img) + (image_key, None)
+
+    def show_points(orig_img, sel_pix, image_key, preview):
+        """
+        The image with the selected points, over the SAM mask they prompt. Only the
+        prompt encoder and mask decoder run, on the cached embedding of the image
+        `run_inference` will use.
+        """
+        if orig_img is None:
+            raise gr.Error("Please upload pictures first!")
+        img = orig_img.copy()
+        if len(sel_pix) > 0:
+            if image_key is None:
+                image_key = ResultCache.key(orig_img)
+            input_x, scale = preview_input(orig_img, preview)
+            entry = embed(input_x, image_key)
+            points = torch.Tensor([p for p, _ in sel_pix]).to(device)[None] * scale
+            labels = torch.Tensor([l for _, l in sel_pix]).to(device)[None]
+            with torch.no_grad(), embeddings.use(predictor, entry):
+                _, _, low_res_logits = predictor.predict_torch(
+                    point_coords=predictor.transform.apply_coords_torch(points, input_x.shape[:2]),
+                    point_labels=labels,
+                    multimask_output=False,
+                )
+                # upsampled to the displayed image, as the export does
+                masks = predictor.model.postprocess_masks(
+                    low_res_logits, entry["input_size"], orig_img.shape[:2]
+                )
+            mask = (masks[0, 0] > predictor.model.mask_threshold).cpu().numpy()
+            img[mask] = img[mask] * 0.5 + mask_color * 0.5
+        return draw_points(img, sel_pix)
+
+    def add_point(orig_img, sel_pix, point_type, image_key, preview, evt: gr.SelectData):
+        if point_type == "background_point":
+            sel_pix.append((evt.index, 0))
+        else:
+            sel_pix.append((evt.index, 1))  # foreground_point by default
+        return show_points(orig_img, sel_pix, image_key, preview)
+
+    def undo_point(orig_img, sel_pix, image_key, preview):
+        if len(sel_pix) != 0:
+            sel_pix.pop()
+        return show_points(orig_img, sel_pix, image_key, preview)
+
+    def matte(input_x, masks, erode_kernel_size, dilate_kernel_size, tr_boxes):
+        """
+        Trimaps from the SAM masks of the objects, with the transparent objects given
+        as normalized xyxy boxes marked unknown, then one alpha matte per object,
+        batched when there are several.
+        """
+        with instrumentation.span("trimap"):
+            trimaps = []
+            for mask in masks:
+                trimap = generate_trimap(mask, erode_kernel_size, dilate_kernel_size)
+                if len(tr_boxes) > 0:
+                    h, w = mask.shape
+                    trimap = convert_pixels(trimap, tr_boxes * np.array([w, h, w, h]))
+                trimaps.append(trimap)
+
+        with instrumentation.span("matting"):
+            if len(trimaps) == 1:
+                alphas = [matte_within_budget(matting_model, input_x, trimaps[0], planner)]
+            else:
+                alphas = matte_objects(matting_model, input_x, trimaps, planner)
+        return np.stack(alphas)
+
+    def cutouts(input_x, alphas, save_name=None):
+        """
+        RGBA cutouts of the objects. When there are several, they are also saved to
+        `your_demos/<save_name>_<i>.png` if a name is given.
+        """
+        with instrumentation.span("compositing"):
+            images = [
+                np.dstack([input_x, (np.clip(alpha, 0, 1) * 255 + 0.5).astype(np.uint8)])
+                for alpha in alphas
+            ]
+        if save_name is not None and len(images) > 1:
+            with instrumentation.span("write"):
+                for i, rgba in enumerate(images):
+                    cv2.imwrite(
+                        f"your_demos/{save_name}_{i}.png", cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGRA)
+                    )
+        return images
+
+    def finish(input_x, masks, alphas, save_name=None):
+        """
+        Outputs of `compose` for all the objects together, followed by their cutouts.
+        """
+        outputs = compose(input_x, masks.max(0), alphas.max(0), save_name)
+        return outputs + (cutouts(input_x, alphas, save_name),)
+
+    def compose(input_x, mask, alpha, save_name=None):
+        """
+        Composite the foreground over the backgrounds, and save the RGBA cutout to
+        `your_demos/<save_name>.png` if a name is given.
+        """
+        with instrumentation.span("compositing"):
+            # get a green background
+            # background = generate_checkerboard_image(input_x.shape[0], input_x.shape[1], 8)
+            background = generate_white_background(input_x.shape[0], input_x.shape[1])
+            # calculate foreground with alpha blending
+            foreground_alpha = (
+                input_x * np.expand_dims(alpha, axis=2).repeat(3, 2) / 255
+                + background * (1 - np.expand_dims(alpha, axis=2).repeat(3, 2)) / 255
+            )
+
+            # calculate foreground with mask
+            foreground_mask = (
+                input_x * np.expand_dims(mask / 255, axis=2).repeat(3, 2) / 255
+                + background * (1 - np.expand_dims(mask / 255, axis=2).repeat(3, 2)) / 255
+            )
+
+        if save_name is not None:
+            with instrumentation.span("write"):
+                # concatenate input_x and foreground_alpha
+                cv2_alpha = (np.expand_dims(alpha, axis=2) * 255).astype(np.uint8)
+                cv2_input_x = cv2.cvtColor(input_x, cv2.COLOR_BGR2RGB)
+                rgba = np.concatenate((cv2_input_x, cv2_alpha), axis=2)
+                cv2.imwrite(f"your_demos/{save_name}.png", rgba)
+
+        with instrumentation.span("compositing"):
+            foreground_alpha[foreground_alpha > 1] = 1
+            foreground_mask[foreground_mask > 1] = 1
+
+            # return img, mask_all
+
+            # new background
+
+            background_1 = cv2.imread("figs/sea.jpg")
+            background_2 = cv2.imread("figs/forest.jpg")
+            background_3 = cv2.imread("figs/sunny.jpg")
+
+            background_1 = cv2.resize(background_1, (input_x.shape[1], input_x.shape[0]))
+            background_2 = cv2.resize(background_2, (input_x.shape[1], input_x.shape[0]))
+            background_3 = cv2.resize(background_3, (input_x.shape[1], input_x.shape[0]))
+
+            # to RGB
+            background_1 = cv2.cvtColor(background_1, cv2.COLOR_BGR2RGB)
+            background_2 = cv2.cvtColor(background_2, cv2.COLOR_BGR2RGB)
+            background_3 = cv2.cvtColor(background_3, cv2.COLOR_BGR2RGB)
+
+            # use alpha blending
+            new_bg_1 = (
+                input_x * np.expand_dims(alpha, axis=2).repeat(3, 2) / 255
+                + background_1 * (1 - np.expand_dims(alpha, axis=2).repeat(3, 2)) / 255
+            )
+            new_bg_2 = (
+                input_x * np.expand_dims(alpha, axis=2).repeat(3, 2) / 255
+                + background_2 * (1 - np.expand_dims(alpha, axis=2).repeat(3, 2)) / 255
+            )
+            new_bg_3 = (
+                input_x * np.expand_dims(alpha, axis=2).repeat(3, 2) / 255
+                + background_3 * (1 - np.expand_dims(alpha, axis=2).repeat(3, 2)) / 255
+            )
+
+        return (
+            mask,
+            alpha,
+            foreground_mask,
+            foreground_alpha,
+            new_bg_1,
+            new_bg_2,
+            new_bg_3,
+        )
+
+    @tracer.trace_request
+    @instrumentation.track_request
     def run_inference(
         input_x,
         selected_points,
@@ -353,6 +516,9 @@ if __name__ == "__main__":
         tr_text_threshold,
         save_name,
         tr_caption="glass, lens, crystal, diamond, bubble, bulb, web, grid",
+        preview=False,
+        multi_object=False,
+        image_key=None,
     ):
 
         if len(selected_points) == 0:
@@ -361,18 +527,54 @@ if __name__ == "__main__":
         if fg_caption is None or fg_caption == "":
             fg_caption = "the biggest foreground object"
 
-        predictor.set_image(input_x)
+        cached = None
+        if result_cache is not None:
+            with instrumentation.span("cache"):
+                if image_key is None:
+                    # the upload handler hashes the image, unless it was not uploaded
+                    image_key = ResultCache.key(input_x)
+                cache_key = result_cache.key(
+                    image=image_key,
+                    request="run_inference",
+                    models=model_identity,
+                    points=selected_points,
+                    erode_kernel_size=erode_kernel_size,
+                    dilate_kernel_size=dilate_kernel_size,
+                    fg_box_threshold=fg_box_threshold,
+                    fg_text_threshold=fg_text_threshold,
+                    fg_caption=fg_caption,
+                    tr_box_threshold=tr_box_threshold,
+                    tr_text_threshold=tr_text_threshold,
+                    tr_caption=tr_caption,
+                    preview_size=args.preview_size if preview else None,
+                    multi_object=multi_object,
+                )
+                cached = result_cache.get(cache_key)
+
+        # trimap settings of the full resolution export
+        trimap_settings = {
+            "erode_kernel_size": erode_kernel_size,
+            "dilate_kernel_size": dilate_kernel_size,
+        }
+        # run everything at the preview resolution, pixel sizes scaled accordingly
+        input_x, scale = preview_input(input_x, preview)
+        if scale != 1.0:
+            erode_kernel_size = max(round(erode_kernel_size * scale), 1)
+            dilate_kernel_size = max(round(dilate_kernel_size * scale), 1)
+
+        if cached is not None:
+            # same image, prompts and settings as an earlier request
+            outputs = finish(
+                input_x, cached["masks"], cached["alphas"], None if preview else save_name
+            )
+            return outputs + (state_from_arrays(cached),)
 
-        dino_transform = T.Compose(
-            [
-                T.RandomResize([800], max_size=1333),
-                T.ToTensor(),
-                T.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
-            ]
-        )
-        image_transformed, _ = dino_transform(Image.fromarray(input_x), None)
+        with instrumentation.span("set_image"):
+            # usually embedded when the image was uploaded
+            entry = embed(input_x, image_key)
+            pyramid = ImagePyramid.from_array(input_x)
 
-        points = torch.Tensor([p for p, _ in selected_points]).to(device).unsqueeze(1)
+        points = torch.Tensor([p for p, _ in selected_points]).to(device).unsqueeze(1) * scale
         labels = (
             torch.Tensor([int(l) for _, l in selected_points]).to(device).unsqueeze(1)
         )
@@ -389,149 +591,158 @@ if __name__ == "__main__":
         point_coords = transformed_points.permute(1, 0, 2)
         point_labels = labels.permute(1, 0)
 
-        fg_boxes, logits, phrases = dino_predict(
-            model=grounding_dino,
-            image=image_transformed,
-            caption=fg_caption,
-            box_threshold=fg_box_threshold,
-            text_threshold=fg_text_threshold,
-            device=device,
-        )
-
-        print(logits, phrases, fg_boxes)
-        if len(phrases) > 1:
-            max_logit_index = torch.argmax(logits)
-            logits = logits[max_logit_index]
-            phrases = phrases[max_logit_index]
-            fg_boxes = fg_boxes[max_logit_index]
+        with instrumentation.span("dino_fg"):
+            # boxes come out normalized, the reduced level gives the same ones
+            dino_image = pyramid.for_dino()
+            image_transformed = dino_preprocess(dino_image)
 
-        if fg_boxes.shape[0] == 0:
-            # no fg object detected
-            transformed_boxes = None
-        else:
-            h, w, _ = input_x.shape
-            fg_boxes = torch.Tensor(fg_boxes).to(device)
-            fg_boxes = fg_boxes * torch.Tensor([w, h, w, h]).to(device)
-            fg_boxes = box_convert(boxes=fg_boxes, in_fmt="cxcywh", out_fmt="xyxy")
-            transformed_boxes = predictor.transform.apply_boxes_torch(
-                fg_boxes, input_x.shape[:2]
+            fg_boxes, logits, phrases = dino_predict(
+                grounding_dino,
+                image_transformed,
+                fg_caption,
+                fg_box_threshold,
+                fg_text_threshold,
+                caption_cache=captions,
             )
 
-        # predict segmentation according to the boxes
-        masks, scores, logits = predictor.predict_torch(
-            point_coords=point_coords,
-            point_labels=point_labels,
-            boxes=transformed_boxes,
-            multimask_output=False,
-        )
-        masks = masks.cpu().detach().numpy()
-        mask_all = np.ones((input_x.shape[0], input_x.shape[1], 3))
-        for ann in masks:
-            color_mask = np.random.random((1, 3)).tolist()[0]
-            for i in range(3):
-                mask_all[ann[0] == True, i] = color_mask[i]
-        img = input_x / 255 * 0.3 + mask_all * 0.7
-
-        # generate alpha matte
-        torch.cuda.empty_cache()
-        mask = masks[0][0].astype(np.uint8) * 255
-        trimap = generate_trimap(mask, erode_kernel_size, dilate_kernel_size).astype(
-            np.float32
-        )
-        trimap[trimap == 128] = 0.5
-        trimap[trimap == 255] = 1
-
-        boxes, logits, phrases = dino_predict(
-            model=grounding_dino,
-            image=image_transformed,
-            caption=tr_caption,
-            box_threshold=tr_box_threshold,
-            text_threshold=tr_text_threshold,
-            device=device,
-        )
-        annotated_frame = dino_annotate(
-            image_source=input_x, boxes=boxes, logits=logits, phrases=phrases
-        )
-
-        annotated_frame = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
-
-        if boxes.shape[0] == 0:
-            # no transparent object detected
-            pass
-        else:
-            h, w, _ = input_x.shape
-            boxes = boxes * torch.Tensor([w, h, w, h])
-            xyxy = box_convert(boxes=boxes, in_fmt="cxcywh", out_fmt="xyxy").numpy()
-            trimap = convert_pixels(trimap, xyxy)
-
-        torch.cuda.empty_cache()
-        alpha = pred_matting(matting_model, input_x, trimap)
-
-        # get a green background
-        # background = generate_checkerboard_image(input_x.shape[0], input_x.shape[1], 8)
-        background = generate_white_background(input_x.shape[0], input_x.shape[1])
-        # calculate foreground with alpha blending
-        foreground_alpha = (
-            input_x * np.expand_dims(alpha, axis=2).repeat(3, 2) / 255
-            + background * (1 - np.expand_dims(alpha, axis=2).repeat(3, 2)) / 255
-        )
-
-        # calculate foreground with mask
-        foreground_mask = (
-            input_x * np.expand_dims(mask / 255, axis=2).repeat(3, 2) / 255
-            + background * (1 - np.expand_dims(mask / 255, axis=2).repeat(3, 2)) / 255
-        )
-
-        # concatenate input_x and foreground_alpha
-        cv2_alpha = (np.expand_dims(alpha, axis=2) * 255).astype(np.uint8)
-        cv2_input_x = cv2.cvtColor(input_x, cv2.COLOR_BGR2RGB)
-        rgba = np.concatenate((cv2_input_x, cv2_alpha), axis=2)
-        cv2.imwrite(f"your_demos/{save_name}.png", rgba)
-
-        foreground_alpha[foreground_alpha > 1] = 1
-        foreground_mask[foreground_mask > 1] = 1
-
-        # return img, mask_all
-        trimap[trimap == 1] == 0.999
-
-        # new background
-
-        background_1 = cv2.imread("figs/sea.jpg")
-        background_2 = cv2.imread("figs/forest.jpg")
-        background_3 = cv2.imread("figs/sunny.jpg")
+            print(logits, phrases, fg_boxes)
+            if len(phrases) > 1 and not multi_object:
+                max_logit_index = torch.argmax(logits)
+                logits = logits[max_logit_index]
+                phrases = phrases[max_logit_index]
+                fg_boxes = fg_boxes[max_logit_index]
+
+            if fg_boxes.shape[0] == 0:
+                # no fg object detected
+                transformed_boxes = None
+            else:
+                h, w, _ = input_x.shape
+                fg_boxes = torch.Tensor(fg_boxes).to(device)
+                fg_boxes = fg_boxes * torch.Tensor([w, h, w, h]).to(device)
+                fg_boxes = box_convert(boxes=fg_boxes, in_fmt="cxcywh", out_fmt="xyxy")
+                transformed_boxes = predictor.transform.apply_boxes_torch(
+                    fg_boxes, input_x.shape[:2]
+                )
+                if transformed_boxes.shape[0] > 1:
+                    # one object per box, the points would apply to all of them
+                    point_coords, point_labels = None, None
+
+        with instrumentation.span("sam_decode"):
+            # predict segmentation according to the boxes, all objects in one batch
+            with embeddings.use(predictor, entry):
+                masks, scores, low_res_logits = predictor.predict_torch(
+                    point_coords=point_coords,
+                    point_labels=point_labels,
+                    boxes=transformed_boxes,
+                    multimask_output=False,
+                )
+            masks = masks.cpu().detach().numpy()
+            mask_all = np.ones((input_x.shape[0], input_x.shape[1], 3))
+            for ann in masks:
+                color_mask = np.random.random((1, 3)).tolist()[0]
+                for i in range(3):
+                    mask_all[ann[0] == True, i] = color_mask[i]
+            img = input_x / 255 * 0.3 + mask_all * 0.7
+            masks = masks[:, 0].astype(np.uint8) * 255
+
+        with instrumentation.span("dino_transparency"):
+            boxes, logits, phrases = dino_predict(
+                grounding_dino,
+                image_transformed,
+                tr_caption,
+                tr_box_threshold,
+                tr_text_threshold,
+                caption_cache=captions,
+            )
+            annotated_frame = dino_annotate(
+                image_source=dino_image, boxes=boxes, logits=logits, phrases=phrases
+            )
 
-        background_1 = cv2.resize(background_1, (input_x.shape[1], input_x.shape[0]))
-        background_2 = cv2.resize(background_2, (input_x.shape[1], input_x.shape[0]))
-        background_3 = cv2.resize(background_3, (input_x.shape[1], input_x.shape[0]))
+            annotated_frame = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
 
-        # to RGB
-        background_1 = cv2.cvtColor(background_1, cv2.COLOR_BGR2RGB)
-        background_2 = cv2.cvtColor(background_2, cv2.COLOR_BGR2RGB)
-        background_3 = cv2.cvtColor(background_3, cv2.COLOR_BGR2RGB)
+            # normalized, so that they apply at any resolution
+            tr_boxes = box_convert(boxes=boxes, in_fmt="cxcywh", out_fmt="xyxy").numpy()
 
-        # use alpha blending
-        new_bg_1 = (
-            input_x * np.expand_dims(alpha, axis=2).repeat(3, 2) / 255
-            + background_1 * (1 - np.expand_dims(alpha, axis=2).repeat(3, 2)) / 255
-        )
-        new_bg_2 = (
-            input_x * np.expand_dims(alpha, axis=2).repeat(3, 2) / 255
-            + background_2 * (1 - np.expand_dims(alpha, axis=2).repeat(3, 2)) / 255
+        # generate alpha matte
+        alphas = matte(input_x, masks, erode_kernel_size, dilate_kernel_size, tr_boxes)
+
+        outputs = finish(input_x, masks, alphas, None if preview else save_name)
+        # what the export needs to redo the matting at full resolution
+        state = {
+            "low_res_logits": low_res_logits.cpu(),
+            "input_size": entry["input_size"],
+            "tr_boxes": tr_boxes,
+            **trimap_settings,
+        }
+        if result_cache is not None:
+            with instrumentation.span("cache"):
+                result_cache.put(
+                    cache_key, {"masks": masks, "alphas": alphas, **state_to_arrays(state)}
+                )
+        return outputs + (state,)
+
+    @tracer.trace_request
+    @instrumentation.track_request
+    def export(input_x, state, save_name):
+        """
+        Redo the matting of the last preview at full resolution, from the SAM logits,
+        transparency boxes and trimap settings of the preview.
+        """
+        if state is None:
+            raise gr.Error("Please run a preview first!")
+        if result_cache is not None:
+            with instrumentation.span("cache"):
+                arrays = state_to_arrays(state)
+                cache_key = result_cache.key(
+                    input_x, *arrays.values(), request="export", models=model_identity
+                )
+                cached = result_cache.get(cache_key)
+            if cached is not None:
+                return finish(input_x, cached["masks"], cached["alphas"], save_name)
+
+        with instrumentation.span("sam_decode"):
+            masks = predictor.model.postprocess_masks(
+                state["low_res_logits"].to(device), state["input_size"], input_x.shape[:2]
+            )
+            masks = (masks[:, 0] > predictor.model.mask_threshold).cpu().numpy()
+            masks = masks.astype(np.uint8) * 255
+
+        alphas = matte(
+            input_x,
+            masks,
+            state["erode_kernel_size"],
+            state["dilate_kernel_size"],
+            state["tr_boxes"],
         )
-        new_bg_3 = (
-            input_x * np.expand_dims(alpha, axis=2).repeat(3, 2) / 255
-            + background_3 * (1 - np.expand_dims(alpha, axis=2).repeat(3, 2)) / 255
-        )
-
-        return (
-            mask,
-            alpha,
-            foreground_mask,
-            foreground_alpha,
-            new_bg_1,
-            new_bg_2,
-            new_bg_3,
+        if result_cache is not None:
+            with instrumentation.span("cache"):
+                result_cache.put(cache_key, {"masks": masks, "alphas": alphas})
+        return finish(input_x, masks, alphas, save_name)
+
+    if args.workers > 1:
+        if device != "cpu":
+            raise ValueError("--workers is only supported on CPU")
+        transport = None
+        if args.shm_slabs > 0:
+            transport = SlabRing(args.shm_slabs, args.shm_slab_mb * 2**20)
+        handlers = {"run_inference": run_inference, "export": export}
+
+        def serve(name, *inputs):
+            return handlers[name](*inputs)
+
+        pool = WorkerPool(
+            serve,
+            args.workers,
+            models=[predictor.model, matting_model, grounding_dino],
+            instrumentation=instrumentation,
+            transport=transport,
         )
+        # stops the workers and frees the shared memory slabs when the server exits
+        atexit.register(pool.close)
+        for worker_id, cores in enumerate(pool.cores):
+            print(f"worker {worker_id} pinned to cores {cores}")
+        run_inference = pool.remote("run_inference")
+        export = pool.remote("export")
 
     with gr.Blocks() as demo:
         gr.Markdown(
@@ -545,6 +756,7 @@ if __name__ == "__main__":
                 original_image = gr.State(
                     value="numpy"
                 )  # store original image without points, default None
+                image_key = gr.State(None)  # content hash of the original image
                 input_image = gr.Image(type="numpy", label="Input Image")
                 # prompt (point or text)
                 # Point Input
@@ -579,7 +791,18 @@ if __name__ == "__main__":
                         )
 
                 # run button
-                button = gr.Button("Start!")
+                with gr.Row():
+                    button = gr.Button("Start!")
+                    export_button = gr.Button("Export")
+                preview = gr.Checkbox(
+                    value=args.preview_size > 0,
+                    label=f"Fast preview at {args.preview_size}px, Export renders full resolution",
+                )
+                multi_object = gr.Checkbox(
+                    value=False,
+                    label="Matte every object the foreground text detects",
+                )
+                matting_state = gr.State(None)
 
                 # Trimap Settings
                 with gr.Tab(label="Trimap Settings"):
@@ -662,14 +885,22 @@ if __name__ == "__main__":
                     new_bg_2 = gr.Image(type="numpy")
                 with gr.Tab(label="New Background 3"):
                     new_bg_3 = gr.Image(type="numpy")
+                with gr.Tab(label="Cutouts"):
+                    objects = gr.Gallery(label="Cutouts")
 
-        input_image.upload(store_img, [input_image], [original_image, selected_points])
+        input_image.upload(
+            upload_image,
+            [input_image, preview],
+            [original_image, selected_points, image_key, matting_state],
+        )
         input_image.select(
-            get_point,
-            [input_image, selected_points, radio],
+            add_point,
+            [original_image, selected_points, radio, image_key, preview],
             [input_image],
         )
-        undo_button.click(undo_points, [original_image, selected_points], [input_image])
+        undo_button.click(
+            undo_point, [original_image, selected_points, image_key, preview], [input_image]
+        )
         undo_all_button.click(
             undo_all_points, [original_image, selected_points], [input_image]
         )
@@ -690,6 +921,9 @@ if __name__ == "__main__":
                 tr_text_threshold,
                 save_dir,
                 tr_caption,
+                preview,
+                multi_object,
+                image_key,
             ],
             outputs=[
                 mask,
@@ -699,6 +933,22 @@ if __name__ == "__main__":
                 new_bg_1,
                 new_bg_2,
                 new_bg_3,
+                objects,
+                matting_state,
+            ],
+        )
+        export_button.click(
+            export,
+            inputs=[original_image, matting_state, save_dir],
+            outputs=[
+                mask,
+                alpha,
+                foreground_by_sam_mask,
+                refined_by_vitmatte,
+                new_bg_1,
+                new_bg_2,
+                new_bg_3,
+                objects,
             ],
         )
 
@@ -706,4 +956,7 @@ if __name__ == "__main__":
             with gr.Column():
                 background_image = gr.State(value=None)
 
+    if args.workers > 1:
+        # let gradio keep every worker busy
+        demo.queue(default_concurrency_limit=args.workers)
     demo.launch(server_name="0.0.0.0", server_port=7860)
\ No newline at end of file
@@ -108,11 +108,18 @@ def add_decomposed_rel_pos(attn, q, rel_pos_h, rel_pos_w, q_size, k_size):
     Returns:
         attn (Tensor): attention map with added relative positional embeddings.
     """
+    Rh = get_rel_pos(q_size[0], k_size[0], rel_pos_h)
+    Rw = get_rel_pos(q_size[1], k_size[1], rel_pos_w)
+    return apply_rel_pos(attn, q, Rh, Rw, q_size, k_size)
+
+
+def apply_rel_pos(attn, q, Rh, Rw, q_size, k_size):
+    """
+    Add the relative positional embeddings Rh (q_h, k_h, C) and Rw (q_w, k_w, C) from
+    `get_rel_pos` to the attention map, see `add_decomposed_rel_pos`.
+    """
     q_h, q_w = q_size
     k_h, k_w = k_size
-    Rh = get_rel_pos(q_h, k_h, rel_pos_h)
-    Rw = get_rel_pos(q_w, k_w, rel_pos_w)
-
     B, _, dim = q.shape
     r_q = q.reshape(B, q_h, q_w, dim)
     rel_h = torch.einsum("bhwc,hkc->bhwk", r_q, Rh)
@@ -125,6 +132,30 @@ def add_decomposed_rel_pos(attn, q, rel_pos_h, rel_pos_w, q_size, k_size):
     return attn
 
 
+def cached_at_inference(cache, key, params, compute, max_entries=16):
+    """
+    Memoize `compute()` in the dict `cache` by `key` and by the storage and version
+    of the tensors `params`, when autograd is disabled. Used for the positional
+    embeddings resized to the input shape, which are the same for all inputs of a
+    shape.
+    Args:
+        cache (dict): cache owned by the module.
+        key (hashable): shapes the result depends on.
+        params (list[Tensor]): tensors the result is computed from.
+        compute (callable): computes the result.
+        max_entries (int): the cache is cleared when it grows past this.
+    """
+    if torch.is_grad_enabled():
+        return compute()
+    key = (key,) + tuple((p.device, p.data_ptr(), p._version) for p in params)
+    value = cache.get(key)
+    if value is None:
+        if len(cache) >= max_entries:
+            cache.clear()
+        value = cache[key] = compute()
+    return value
+
+
 def get_abs_pos(abs_pos, has_cls_token, hw):
     """
     Calculate absolute positional embeddings. If needed, resize embeddings and remove cls_token
@@ -11,8 +11,10 @@ from timm.models.layers import DropPath, Mlp, trunc_normal_
 from .backbone import Backbone
 from .utils import (
     PatchEmbed,
-    add_decomposed_rel_pos,
+    apply_rel_pos,
+    cached_at_inference,
     get_abs_pos,
+    get_rel_pos,
     window_partition,
     window_unpartition,
 )
@@ -62,6 +64,8 @@ class Attention(nn.Module):
             if not rel_pos_zero_init:
                 trunc_normal_(self.rel_pos_h, std=0.02)
                 trunc_normal_(self.rel_pos_w, std=0.02)
+        # embeddings resized to the token grid at inference, see cached_at_inference
+        self._rel_pos_cache = {}
 
     def forward(self, x):
         B, H, W, _ = x.shape
@@ -73,7 +77,13 @@ class Attention(nn.Module):
         attn = (q * self.scale) @ k.transpose(-2, -1)
 
         if self.use_rel_pos:
-            attn = add_decomposed_rel_pos(attn, q, self.rel_pos_h, self.rel_pos_w, (H, W), (H, W))
+            Rh, Rw = cached_at_inference(
+                self._rel_pos_cache,
+                (H, W),
+                (self.rel_pos_h, self.rel_pos_w),
+                lambda: (get_rel_pos(H, H, self.rel_pos_h), get_rel_pos(W, W, self.rel_pos_w)),
+            )
+            attn = apply_rel_pos(attn, q, Rh, Rw, (H, W), (H, W))
 
         attn = attn.softmax(dim=-1)
         x = (attn @ v).view(B, self.num_heads, H, W, -1).permute(0, 2, 3, 1, 4).reshape(B, H, W, -1)
@@ -246,7 +256,11 @@ class Block(nn.Module):
             self.attn = CrissCrossAttention(dim)
 
 
-    def forward(self, x):
+    def forward(self, x, active_windows=None):
+        if active_windows is not None and self.window_size > 0 and not self.training:
+            x = self._forward_active_windows(x, active_windows)
+            return self._forward_conv_blocks(x)
+
         shortcut = x
         x = self.norm1(x)
 
@@ -301,6 +315,33 @@ class Block(nn.Module):
         x = shortcut + self.drop_path(x)
         x = x + self.drop_path(self.mlp(self.norm2(x)))
 
+        return self._forward_conv_blocks(x)
+
+    def _forward_active_windows(self, x, active_windows):
+        """
+        Run attention and MLP only on the windows flagged in `active_windows`,
+        the other windows are passed through unchanged.
+        Args:
+            x (tensor): input tokens with [B, H, W, C].
+            active_windows (tensor): bool mask with [B * num_windows].
+        """
+        H, W = x.shape[1], x.shape[2]
+        windows, pad_hw = window_partition(x, self.window_size)
+        index = active_windows.nonzero().flatten()
+        if index.numel() > 0:
+            shortcut = windows.index_select(0, index)
+            y = self.norm1(shortcut)
+            if pad_hw != (H, W):
+                # the dense path pads after norm1, padded tokens have to stay zero
+                valid, _ = window_partition(x.new_ones(1, H, W, 1), self.window_size)
+                y = y * valid.repeat(x.shape[0], 1, 1, 1).index_select(0, index)
+            y = shortcut + self.drop_path(self.attn(y))
+            y = y + self.drop_path(self.mlp(self.norm2(y)))
+            windows = windows.index_copy(0, index, y)
+
+        return window_unpartition(windows, self.window_size, pad_hw, (H, W))
+
+    def _forward_conv_blocks(self, x):
         if self.use_residual_block:
             x = self.residual(x.permute(0, 3, 1, 2)).permute(0, 2, 3, 1)
         if self.use_convnext_block:
@@ -341,6 +382,7 @@ class ViT(Backbone):
         out_feature="last_feat",
         res_conv_kernel_size=3, 
         res_conv_padding=1,
+        sparse_window_skip=False,
     ):
         """
         Args:
@@ -365,9 +407,16 @@ class ViT(Backbone):
             pretrain_img_size (int): input image size for pretraining models.
             pretrain_use_cls_token (bool): If True, pretrainig models use class token.
             out_feature (str): name of the feature from the last block.
+            sparse_window_skip (bool): If True, window attention blocks skip at inference
+                the windows without unknown pixels in the trimap (last input channel).
         """
         super().__init__()
         self.pretrain_use_cls_token = pretrain_use_cls_token
+        self.patch_size = patch_size
+        self.window_size = window_size
+        self.sparse_window_skip = sparse_window_skip
+        # fraction of the windows skipped by the window blocks in the last forward
+        self.window_skip_ratio = 0.0
 
         self.patch_embed = PatchEmbed(
             kernel_size=(patch_size, patch_size),
@@ -383,9 +432,12 @@ class ViT(Backbone):
             self.pos_embed = nn.Parameter(torch.zeros(1, num_positions, embed_dim))
         else:
             self.pos_embed = None
+        # pos_embed resized to the token grid at inference, see cached_at_inference
+        self._abs_pos_cache = {}
 
-        # stochastic depth decay rule
-        dpr = [x.item() for x in torch.linspace(0, drop_path_rate, depth)]
+        # stochastic depth decay rule, computed without tensors so that the model can
+        # be built on the meta device
+        dpr = [drop_path_rate * i / max(depth - 1, 1) for i in range(depth)]
 
         self.blocks = nn.ModuleList()
         for i in range(depth):
@@ -427,15 +479,42 @@ class ViT(Backbone):
             nn.init.constant_(m.bias, 0)
             nn.init.constant_(m.weight, 1.0)
 
+    def active_windows(self, x):
+        """
+        Find the attention windows that contain unknown trimap pixels.
+        Args:
+            x (tensor): input images with [B, C, H, W], the trimap in the last channel.
+
+        Returns:
+            bool mask with [B * num_windows], in window_partition order.
+        """
+        trimap = x[:, -1:]
+        unknown = ((trimap > 0) & (trimap < 1)).float()
+        unknown = F.max_pool2d(unknown, self.patch_size)
+        windows, _ = window_partition(unknown.permute(0, 2, 3, 1), self.window_size)
+        active = windows.flatten(1).amax(1) > 0
+
+        self.window_skip_ratio = 1.0 - active.float().mean().item()
+        logger.debug(f"Skipping {self.window_skip_ratio:.1%} of the attention windows")
+        return active
+
     def forward(self, x):
+        active_windows = None
+        if self.sparse_window_skip and self.window_size > 0 and not self.training:
+            active_windows = self.active_windows(x)
+
         x = self.patch_embed(x)
         if self.pos_embed is not None:
-            x = x + get_abs_pos(
-                self.pos_embed, self.pretrain_use_cls_token, (x.shape[1], x.shape[2])
+            hw = (x.shape[1], x.shape[2])
+            x = x + cached_at_inference(
+                self._abs_pos_cache,
+                hw,
+                (self.pos_embed,),
+                lambda: get_abs_pos(self.pos_embed, self.pretrain_use_cls_token, hw),
             )
 
         for blk in self.blocks:
-            x = blk(x)
+            x = blk(x, active_windows)
 
         outputs = {self._out_features[0]: x.permute(0, 3, 1, 2)}
 
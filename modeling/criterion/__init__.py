@@ -1 +1 @@
-from .matting_criterion import MattingCriterion
\ No newline at end of file
+from .matting_criterion import MattingCriterion, FusedMattingCriterion
\ No newline at end of file
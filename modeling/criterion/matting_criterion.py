@@ -2,6 +2,11 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+def _area(sample_map):
+    # B * H * W, i.e. B * 262144 for 512x512 crops, so that the scales do not
+    # depend on the crop size
+    return sample_map.shape[0]*sample_map.shape[2]*sample_map.shape[3]
+
 class MattingCriterion(nn.Module):
     def __init__(self,
                  *,
@@ -15,7 +20,7 @@ class MattingCriterion(nn.Module):
         targets = targets['phas']
 
         #sample_map for unknown area
-        scale = sample_map.shape[0]*262144/torch.sum(sample_map)
+        scale = _area(sample_map)/torch.sum(sample_map)
 
         #gradient in x
         sobel_x_kernel = torch.tensor([[[[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]]]).type(dtype=preds.type())
@@ -43,7 +48,7 @@ class MattingCriterion(nn.Module):
 
     def unknown_l1_loss(self, sample_map, preds, targets):
         
-        scale = sample_map.shape[0]*262144/torch.sum(sample_map)
+        scale = _area(sample_map)/torch.sum(sample_map)
         # scale = 1
 
         loss = F.l1_loss(preds['phas']*sample_map, targets['phas']*sample_map)*scale
@@ -56,7 +61,7 @@ class MattingCriterion(nn.Module):
         if torch.sum(new_sample_map) == 0:
             scale = 0
         else:
-            scale = new_sample_map.shape[0]*262144/torch.sum(new_sample_map)
+            scale = _area(new_sample_map)/torch.sum(new_sample_map)
         # scale = 1
 
         loss = F.l1_loss(preds['phas']*new_sample_map, targets['phas']*new_sample_map)*scale
@@ -129,4 +134,87 @@ def crop_to_even_size(img):
     H, W = img.shape[2:]
     H = H - H % 2
     W = W - W % 2
-    return img[:, :, :H, :W]
\ No newline at end of file
+    return img[:, :, :H, :W]
+
+class FusedMattingCriterion(nn.Module):
+    """
+    Drop-in replacement of MattingCriterion computing the same losses with fewer
+    kernels: the Sobel and Gaussian kernels are cached buffers, prediction and target
+    go through the Sobel filter and the Laplacian pyramid as one batch, and the
+    unknown/known masks and their scales are computed once for all losses.
+    """
+    def __init__(self,
+                 *,
+                 losses,
+                 ):
+        super(FusedMattingCriterion, self).__init__()
+        self.losses = losses
+        sobel = torch.tensor([[[[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]],
+                              [[[-1, -2, -1], [0, 0, 0], [1, 2, 1]]]], dtype=torch.float32)
+        self.register_buffer("sobel_kernel", sobel, False)
+        self.register_buffer("gauss_kernel", gauss_kernel(), False)
+
+    def _kernel(self, name, x):
+        kernel = getattr(self, name)
+        return kernel if kernel.dtype == x.dtype else kernel.to(x.dtype)
+
+    def gradient_penalty(self, unknown, scale, preds, targets):
+        B = preds.shape[0]
+        # x and y gradients of prediction and target in one convolution
+        delta = F.conv2d(torch.cat([preds, targets]), self._kernel("sobel_kernel", preds), padding=1)
+        delta_pred = delta[:B] * unknown
+        delta_gt = delta[B:] * unknown
+        # the means over both directions stand for the sums of the per-direction means
+        return 2 * scale * (F.l1_loss(delta_pred, delta_gt) + 0.01 * delta_pred.abs().mean())
+
+    def laplacian(self, preds, targets, max_levels=5):
+        B = preds.shape[0]
+        kernel = self._kernel("gauss_kernel", preds)
+        current = torch.cat([preds, targets])
+        loss = 0
+        for level in range(max_levels):
+            current = crop_to_even_size(current)
+            down = fused_downsample(current, kernel)
+            diff = current - fused_upsample(down, kernel)
+            loss += (2 ** level) * F.l1_loss(diff[:B], diff[B:])
+            current = down
+        return loss / max_levels
+
+    def forward(self, sample_map, preds, targets):
+        preds, targets = preds['phas'], targets['phas']
+        losses = dict()
+        unknown = sample_map
+        area = _area(sample_map)
+        if {'unknown_l1_loss', 'loss_gradient_penalty'} & set(self.losses):
+            unknown_scale = area/torch.sum(unknown)
+        if {'unknown_l1_loss', 'known_l1_loss'} & set(self.losses):
+            abs_diff = (preds - targets).abs()
+
+        for k in self.losses:
+            if k == 'unknown_l1_loss':
+                losses[k] = (abs_diff * unknown).mean() * unknown_scale
+            elif k == 'known_l1_loss':
+                known = (sample_map == 0).to(sample_map.dtype)
+                known_sum = torch.sum(known)
+                known_scale = 0 if known_sum == 0 else area/known_sum
+                losses[k] = (abs_diff * known).mean() * known_scale
+            elif k == 'loss_gradient_penalty':
+                losses[k] = self.gradient_penalty(unknown, unknown_scale, preds, targets)
+            elif k == 'loss_pha_laplacian':
+                losses[k] = self.laplacian(preds, targets)
+            else:
+                raise ValueError(f"unknown loss {k}")
+        return losses
+
+
+def fused_downsample(img, kernel):
+    # only the kept pixels of the blurred image are computed
+    B, C, H, W = img.shape
+    img = F.pad(img.reshape(B * C, 1, H, W), (2, 2, 2, 2), mode='reflect')
+    return F.conv2d(img, kernel, stride=2).reshape(B, C, H // 2, W // 2)
+
+def fused_upsample(img, kernel):
+    # zero insertion as a single pad of a (B, C, H, 1, W, 1) view
+    B, C, H, W = img.shape
+    out = F.pad((img * 4).reshape(B, C, H, 1, W, 1), (0, 1, 0, 0, 0, 1))
+    return gauss_convolution(out.reshape(B, C, H * 2, W * 2), kernel)
@@ -97,9 +97,25 @@ class Matting_Head(nn.Module):
 
         return x
 
+def _expand(span, halo, size):
+    return (max(span[0] - halo, 0), min(span[1] + halo, size))
+
+def _upsample_source(span, size):
+    """
+    Rows (or columns) of the input read by a 2x bilinear upsampling to produce `span`.
+    """
+    return (max(span[0] // 2 - 1, 0), min((span[1] + 1) // 2 + 1, size))
+
+def _crop(x, ys, xs, offset=(0, 0)):
+    return x[:, :, ys[0]-offset[0]:ys[1]-offset[0], xs[0]-offset[1]:xs[1]-offset[1]]
+
 class Detail_Capture(nn.Module):
     """
     Simple and Lightweight Detail Capture Module for ViT Matting.
+
+    If `tile_size` is set, the last `tiled_stages` fusion blocks and the matting head
+    run at inference on tiles of `tile_size` pixels, each extended by the receptive
+    field of these stages, which bounds the memory used at full resolution.
     """
     def __init__(
         self,
@@ -107,6 +123,8 @@ class Detail_Capture(nn.Module):
         img_chans=4,
         convstream_out = [48, 96, 192],
         fusion_out = [256, 128, 64, 32],
+        tile_size = None,
+        tiled_stages = 2,
     ):
         super().__init__()
         assert len(fusion_out) == len(convstream_out) + 1
@@ -128,8 +146,16 @@ class Detail_Capture(nn.Module):
         self.matting_head = Matting_Head(
             in_chans = fusion_out[-1],
         )
+        self.memory_format = torch.contiguous_format
+        self.tile_size = tile_size
+        self.tiled_stages = tiled_stages
 
     def forward(self, features, images):
+        features = features.contiguous(memory_format=self.memory_format)
+        images = images.contiguous(memory_format=self.memory_format)
+        if self.tile_size and not self.training:
+            return self.forward_tiled(features, images, self.tile_size)
+
         detail_features = self.convstream(images)
         for i in range(len(self.fusion_blks)):
             d_name_ = 'D'+str(len(self.fusion_blks)-i-1)
@@ -138,3 +164,52 @@ class Detail_Capture(nn.Module):
         phas = torch.sigmoid(self.matting_head(features))
 
         return {'phas': phas}
+
+    def forward_tiled(self, features, images, tile_size):
+        """
+        Same output as forward, with the full resolution stages computed tile by tile.
+        """
+        detail_features = self.convstream(images)
+        num_untiled = len(self.fusion_blks) - self.tiled_stages
+        for i in range(num_untiled):
+            d_name_ = 'D'+str(len(self.fusion_blks)-i-1)
+            features = self.fusion_blks[i](features, detail_features[d_name_])
+
+        H, W = images.shape[-2:]
+        phas = None
+        for y in range(0, H, tile_size):
+            for x in range(0, W, tile_size):
+                ys, xs = (y, min(y + tile_size, H)), (x, min(x + tile_size, W))
+                # halo for the 3x3 conv of the matting head
+                in_ys, in_xs = _expand(ys, 1, H), _expand(xs, 1, W)
+                out = self._fusion_region(
+                    len(self.fusion_blks) - 1, in_ys, in_xs, features, detail_features
+                )
+                out = _crop(self.matting_head(out), ys, xs, (in_ys[0], in_xs[0]))
+                if phas is None:
+                    phas = out.new_empty((out.shape[0], 1, H, W))
+                phas[:, :, ys[0]:ys[1], xs[0]:xs[1]] = torch.sigmoid(out)
+
+        return {'phas': phas}
+
+    def _fusion_region(self, i, ys, xs, features, detail_features):
+        """
+        Output of the i-th fusion block over rows `ys` and columns `xs` of its resolution.
+        `features` is the output of the last untiled fusion block.
+        """
+        if i < len(self.fusion_blks) - self.tiled_stages:
+            return _crop(features, ys, xs)
+
+        D = detail_features['D'+str(len(self.fusion_blks)-i-1)]
+        H, W = D.shape[-2:]
+        # halo for the 3x3 conv, then for the bilinear upsampling of the previous stage
+        in_ys, in_xs = _expand(ys, 1, H), _expand(xs, 1, W)
+        src_ys, src_xs = _upsample_source(in_ys, H // 2), _upsample_source(in_xs, W // 2)
+        x = self._fusion_region(i - 1, src_ys, src_xs, features, detail_features)
+
+        F_up = F.interpolate(x, scale_factor=2, mode='bilinear', align_corners=False)
+        F_up = _crop(F_up, in_ys, in_xs, (2 * src_ys[0], 2 * src_xs[0]))
+        out = torch.cat([_crop(D, in_ys, in_xs), F_up], dim=1)
+        out = self.fusion_blks[i].conv(out)
+
+        return _crop(out, ys, xs, (in_ys[0], in_xs[0]))
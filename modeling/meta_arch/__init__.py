@@ -1 +1,2 @@
-from .vitmatte import ViTMatte
\ No newline at end of file
+from .vitmatte import ViTMatte
+from .optimize import optimize_for_inference
@@ -0,0 +1,179 @@
+import torch
+from torch import nn
+
+from ..decoder.detail_capture import Basic_Conv3x3, Matting_Head
+
+__all__ = ["fuse_conv_bn", "fold_input_normalization", "optimize_for_inference"]
+
+
+class NormFoldedConv2d(nn.Conv2d):
+    """
+    Conv2d whose weights absorb a per-channel input normalization (x - mean) / std.
+
+    Zero padding of the normalized input corresponds to padding the raw input with
+    `mean`, so the taps that fall outside the image are added back on the border
+    outputs. This keeps the result exact on the whole map, not only in the interior.
+    """
+
+    def forward(self, x):
+        out = super().forward(x)
+        if self.padding[0] > 0 or self.padding[1] > 0:
+            self._correct_border(out, x.shape[-2:])
+        return out
+
+    def _correct_border(self, out, in_hw):
+        rows = _inside_taps(out.shape[-2], in_hw[0], 0, self, out.device)
+        cols = _inside_taps(out.shape[-1], in_hw[1], 1, self, out.device)
+        border_rows = (rows < 1).any(1).nonzero().flatten()
+        border_cols = (cols < 1).any(1).nonzero().flatten()
+        taps = self.border_taps.to(out.dtype)
+        total = taps.sum((1, 2))
+
+        # columns on the left/right border, assuming all row taps are inside
+        col_corr = None
+        if border_cols.numel() > 0:
+            col_corr = total[:, None] - torch.einsum("oij,xj->ox", taps, cols[border_cols])
+            out[:, :, :, border_cols] += col_corr[None, :, None, :]
+        # rows on the top/bottom border, replacing the column guess made above
+        if border_rows.numel() > 0:
+            row_corr = total[:, None, None] - torch.einsum(
+                "oij,yi,xj->oyx", taps, rows[border_rows], cols
+            )
+            if col_corr is not None:
+                row_corr[:, :, border_cols] -= col_corr[:, None, :]
+            out[:, :, border_rows, :] += row_corr[None]
+
+
+def _inside_taps(out_size, in_size, dim, conv, device):
+    """
+    Returns a (out_size, kernel_size) float mask of the taps that read inside the input.
+    """
+    k, s, p, d = conv.kernel_size[dim], conv.stride[dim], conv.padding[dim], conv.dilation[dim]
+    pos = (
+        torch.arange(out_size, device=device)[:, None] * s
+        - p
+        + torch.arange(k, device=device)[None, :] * d
+    )
+    return ((pos >= 0) & (pos < in_size)).float()
+
+
+def _new_conv(conv, cls=nn.Conv2d):
+    new = cls(
+        conv.in_channels,
+        conv.out_channels,
+        conv.kernel_size,
+        stride=conv.stride,
+        padding=conv.padding,
+        dilation=conv.dilation,
+        groups=conv.groups,
+        bias=True,
+    )
+    return new.to(device=conv.weight.device, dtype=conv.weight.dtype)
+
+
+@torch.no_grad()
+def fuse_conv_bn(conv, bn):
+    """
+    Fold an eval-mode BatchNorm2d into the preceding Conv2d.
+    Args:
+        conv (nn.Conv2d): convolution followed by `bn`.
+        bn (nn.BatchNorm2d): batch norm using its running statistics.
+
+    Returns:
+        nn.Conv2d with bias computing bn(conv(x)).
+    """
+    fused = _new_conv(conv)
+    scale = torch.rsqrt(bn.running_var + bn.eps)
+    if bn.affine:
+        scale = scale * bn.weight
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    fused.weight.copy_(conv.weight * scale.view(-1, 1, 1, 1))
+    fused.bias.copy_((bias - bn.running_mean) * scale)
+    if bn.affine:
+        fused.bias.add_(bn.bias)
+    return fused
+
+
+@torch.no_grad()
+def fold_input_normalization(conv, mean, std):
+    """
+    Fold (x - mean) / std on the input channels into the weights of `conv`.
+    Args:
+        conv (nn.Conv2d): convolution reading the normalized input.
+        mean (Tensor): per input channel mean, 0 for channels that are not normalized.
+        std (Tensor): per input channel std, 1 for channels that are not normalized.
+
+    Returns:
+        nn.Conv2d taking the raw input. Padded convolutions are returned as
+        :class:`NormFoldedConv2d` to keep the borders exact.
+    """
+    assert conv.groups == 1, "grouped convolutions are not supported"
+    padded = conv.padding[0] > 0 or conv.padding[1] > 0
+    folded = _new_conv(conv, NormFoldedConv2d if padded else nn.Conv2d)
+    mean = mean.to(conv.weight).view(1, -1, 1, 1)
+    std = std.to(conv.weight).view(1, -1, 1, 1)
+
+    weight = conv.weight / std
+    taps = (weight * mean).sum(1)
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(taps[:, 0, 0])
+    folded.weight.copy_(weight)
+    folded.bias.copy_(bias - taps.sum((1, 2)))
+    if padded:
+        folded.register_buffer("border_taps", taps, False)
+    return folded
+
+
+def _channel_stats(model, in_chans):
+    mean = torch.zeros(in_chans, device=model.device)
+    std = torch.ones(in_chans, device=model.device)
+    n = model.pixel_mean.shape[0]
+    mean[:n] = model.pixel_mean.flatten()
+    std[:n] = model.pixel_std.flatten()
+    return mean, std
+
+
+@torch.no_grad()
+def optimize_for_inference(model):
+    """
+    Apply exact inference-only graph transforms to a ViTMatte model in place:
+
+    * fold BatchNorm into the preceding conv of every Basic_Conv3x3 and of the Matting_Head;
+    * fold pixel_mean / pixel_std into the convs reading the raw image, i.e. the patch
+      embedding, the first ConvStream conv and the last Fusion_Block (which gets D0);
+    * convert the decoder to channels_last;
+    * switch to eval mode and freeze all parameters.
+    Args:
+        model (ViTMatte): model with loaded weights.
+
+    Returns:
+        The same model, ready for inference only.
+    """
+    model.eval()
+    decoder = model.decoder
+
+    for module in decoder.modules():
+        if isinstance(module, Basic_Conv3x3):
+            module.conv = fuse_conv_bn(module.conv, module.bn)
+            module.bn = nn.Identity()
+        elif isinstance(module, Matting_Head):
+            convs = module.matting_convs
+            convs[0] = fuse_conv_bn(convs[0], convs[1])
+            convs[1] = nn.Identity()
+
+    if model.normalize_inputs:
+        proj = model.backbone.patch_embed.proj
+        proj_stats = _channel_stats(model, proj.in_channels)
+        model.backbone.patch_embed.proj = fold_input_normalization(proj, *proj_stats)
+        for block in (decoder.convstream.convs[0], decoder.fusion_blks[-1].conv):
+            block.conv = fold_input_normalization(
+                block.conv, *_channel_stats(model, block.conv.in_channels)
+            )
+        model.normalize_inputs = False
+
+    decoder.to(memory_format=torch.channels_last)
+    decoder.memory_format = torch.channels_last
+
+    for param in model.parameters():
+        param.requires_grad_(False)
+
+    return model
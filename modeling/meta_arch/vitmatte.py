@@ -30,6 +30,8 @@ class ViTMatte(nn.Module):
         assert (
             self.pixel_mean.shape == self.pixel_std.shape
         ), f"{self.pixel_mean} and {self.pixel_std} have different shapes!"
+        # set to False once the normalization is folded into the input convs
+        self.normalize_inputs = True
     
     @property
     def device(self):
@@ -57,29 +59,39 @@ class ViTMatte(nn.Module):
     def preprocess_inputs(self, batched_inputs):
         """
         Normalize, pad and batch the input images.
+        Images and trimaps may be uint8 tensors (trimap in 0/128/255), they are then
+        converted on the device while being written into the padded batch.
         """
-        images = batched_inputs["image"].to(self.device)
-        trimap = batched_inputs['trimap'].to(self.device)
-        images = (images - self.pixel_mean) / self.pixel_std
+        images = batched_inputs["image"].to(self.device, non_blocking=True)
+        trimap = batched_inputs['trimap'].to(self.device, non_blocking=True)
 
-        if 'fg' in batched_inputs.keys():
+        if trimap.dtype == torch.uint8:
+            trimap = (trimap >= 85).to(self.pixel_mean.dtype).add_(trimap >= 170).mul_(0.5)
+        elif 'fg' in batched_inputs.keys():
             trimap[trimap < 85] = 0
             trimap[trimap >= 170] = 1
             trimap[trimap >= 85] = 0.5
 
-        images = torch.cat((images, trimap), dim=1)
-        
         B, C, H, W = images.shape
-        if images.shape[-1]%32!=0 or images.shape[-2]%32!=0:
-            new_H = (32-images.shape[-2]%32) + H
-            new_W = (32-images.shape[-1]%32) + W
-            new_images = torch.zeros((images.shape[0], images.shape[1], new_H, new_W)).to(self.device)
-            new_images[:,:,:H,:W] = images[:,:,:,:]
-            del images
-            images = new_images
+        new_H = H + (-H) % self.size_divisibility
+        new_W = W + (-W) % self.size_divisibility
+        padded = torch.zeros((B, C + trimap.shape[1], new_H, new_W), device=self.device)
+        if not self.normalize_inputs:
+            # padding has to stay zero after the folded normalization
+            padded[:, :C] = self.pixel_mean
+        rgb = padded[:, :C, :H, :W]
+        rgb.copy_(images)
+        if images.dtype == torch.uint8:
+            rgb.div_(255)
+        if self.normalize_inputs:
+            rgb.sub_(self.pixel_mean).div_(self.pixel_std)
+        padded[:, C:, :H, :W] = trimap
+        images = padded
 
         if "alpha" in batched_inputs:
-            phas = batched_inputs["alpha"].to(self.device)
+            phas = batched_inputs["alpha"].to(self.device, non_blocking=True)
+            if phas.dtype == torch.uint8:
+                phas = phas.to(self.pixel_mean.dtype).div_(255)
         else:
             phas = None
 
@@ -0,0 +1,87 @@
+import os
+import warnings
+
+import torch
+
+__all__ = ["mapped_path", "save_mapped", "load_mapped", "is_mapped"]
+
+# data pointers of the storages mapped by load_mapped
+_mapped_storages = set()
+
+
+def mapped_path(checkpoint):
+    """
+    Path of the memory-mappable conversion of `checkpoint`, next to it.
+    """
+    return os.path.splitext(checkpoint)[0] + ".mapped.pt"
+
+
+def _named_tensors(module):
+    # parameters and all buffers, non-persistent ones included, so that a module
+    # built on the meta device can be fully materialized from the file
+    yield from module.named_parameters()
+    yield from module.named_buffers()
+
+
+def save_mapped(module, path):
+    """
+    Save every parameter and buffer of `module` as a flat dict of tensors in the
+    zip format of torch.save, which `torch.load(mmap=True)` maps without copying.
+    """
+    tmp = path + ".tmp"
+    torch.save({name: t.detach().cpu().contiguous() for name, t in _named_tensors(module)}, tmp)
+    os.replace(tmp, path)
+
+
+def _build_on_meta(build):
+    try:
+        with torch.device("meta"):
+            return build()
+    except (RuntimeError, NotImplementedError) as e:
+        # constructors reading tensor values, e.g. with .item(), need real tensors
+        warnings.warn(f"building on the meta device failed ({e}), initializing the weights")
+        return build()
+
+
+def load_mapped(build, path):
+    """
+    Build a module with `build()` and map its tensors from a file written by
+    `save_mapped`, instead of unpickling a checkpoint into memory.
+
+    The module is built on the meta device when possible, so no time is spent on
+    weight initialization, and its parameters and buffers are assigned the
+    memory-mapped tensors. Pages are read on first use and shared through the page
+    cache between the processes using the same file. The mapping is private, so
+    in-place changes such as BatchNorm folding stay local to the process.
+
+    Args:
+        build (callable): returns the module, e.g. `sam_model_registry["vit_h"]`.
+        path (str): file written by `save_mapped`.
+
+    Returns:
+        the module on the CPU.
+    """
+    module = _build_on_meta(build)
+    tensors = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    _mapped_storages.update(t.untyped_storage().data_ptr() for t in tensors.values())
+    missing, unexpected = module.load_state_dict(tensors, strict=False, assign=True)
+    if missing:
+        raise KeyError(f"{path} has no tensors for {missing}")
+    for name in unexpected:
+        # non-persistent buffers are not part of the state dict
+        module_name, _, buffer_name = name.rpartition(".")
+        owner = module.get_submodule(module_name)
+        if buffer_name not in owner._buffers:
+            raise KeyError(f"{path} has unknown tensor {name}")
+        owner._buffers[buffer_name] = tensors[name]
+    meta = [name for name, t in _named_tensors(module) if t.is_meta]
+    if meta:
+        raise RuntimeError(f"{path} leaves {meta} uninitialized")
+    return module
+
+
+def is_mapped(tensor):
+    """
+    Whether `tensor` is backed by a file mapped by `load_mapped`.
+    """
+    return tensor.device.type == "cpu" and tensor.untyped_storage().data_ptr() in _mapped_storages
@@ -0,0 +1,181 @@
+import threading
+from collections import OrderedDict
+
+import torch
+import torch.nn.functional as F
+
+__all__ = ["CaptionCache", "encode_caption", "detect"]
+
+# GroundingDINO.forward split in its text and image branches, so that the text
+# features of a caption can be computed once and reused. GroundingDINO is imported
+# by the functions, like in inference.py
+
+
+def encode_caption(model, caption):
+    """
+    Text features of `caption`, as GroundingDINO.forward computes them for a batch
+    of one, along with the tokenized caption the phrases are read from.
+    Args:
+        model (GroundingDINO): the detector.
+        caption (str): caption, already lowercased and ending with a period.
+    """
+    from groundingdino.models.GroundingDINO.bertwarper import (
+        generate_masks_with_special_tokens_and_transfer_map,
+    )
+
+    device = next(model.parameters()).device
+    tokenized = model.tokenizer([caption], padding="longest", return_tensors="pt").to(device)
+    attention_masks, position_ids, _ = generate_masks_with_special_tokens_and_transfer_map(
+        tokenized, model.specical_tokens, model.tokenizer
+    )
+    max_len = model.max_text_len
+    if attention_masks.shape[1] > max_len:
+        attention_masks = attention_masks[:, :max_len, :max_len]
+        position_ids = position_ids[:, :max_len]
+        for name in ("input_ids", "attention_mask", "token_type_ids"):
+            tokenized[name] = tokenized[name][:, :max_len]
+
+    if model.sub_sentence_present:
+        tokenized_for_encoder = {k: v for k, v in tokenized.items() if k != "attention_mask"}
+        tokenized_for_encoder["attention_mask"] = attention_masks
+        tokenized_for_encoder["position_ids"] = position_ids
+    else:
+        tokenized_for_encoder = tokenized
+
+    with torch.no_grad():
+        bert_output = model.bert(**tokenized_for_encoder)
+        encoded_text = model.feat_map(bert_output["last_hidden_state"])
+    return {
+        "encoded_text": encoded_text[:, :max_len],
+        "text_token_mask": tokenized.attention_mask.bool()[:, :max_len],
+        "position_ids": position_ids[:, :max_len],
+        "text_self_attention_masks": attention_masks[:, :max_len, :max_len],
+        # what `get_phrases_from_posmap` reads the phrases from
+        "tokenized": model.tokenizer(caption),
+    }
+
+
+class CaptionCache:
+    """
+    Text features of the last `max_entries` captions, see `encode_caption`.
+
+    The captions are few, the default transparency caption and a handful of
+    foreground ones, so running the text encoder once per caption instead of once
+    per request saves a BERT forward on every detection.
+    """
+
+    def __init__(self, model, max_entries=32):
+        """
+        Args:
+            model (GroundingDINO): the detector the features are computed with.
+            max_entries (int): number of captions kept.
+        """
+        self.model = model
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, caption):
+        """
+        Text features of `caption`, which is normalized like GroundingDINO's
+        `predict` does.
+        """
+        from groundingdino.util.inference import preprocess_caption
+
+        caption = preprocess_caption(caption)
+        with self._lock:
+            text = self._entries.get(caption)
+            if text is not None:
+                self._entries.move_to_end(caption)
+                self.hits += 1
+                return text
+            self.misses += 1
+        text = encode_caption(self.model, caption)
+        with self._lock:
+            self._entries[caption] = text
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return text
+
+    def prometheus_metrics(self):
+        """
+        Hit and miss counters, for Instrumentation.add_collector.
+        """
+        with self._lock:
+            return [
+                "# TYPE matte_anything_caption_cache_requests_total counter",
+                f'matte_anything_caption_cache_requests_total{{result="hit"}} {self.hits}',
+                f'matte_anything_caption_cache_requests_total{{result="miss"}} {self.misses}',
+            ]
+
+
+def _forward(model, images, text):
+    """
+    GroundingDINO.forward on a list of normalized image tensors, with the text
+    features of one caption shared by all of them. Only the last decoder layer,
+    which the predictions come from, goes through the box and class heads.
+
+    Returns:
+        logits (Tensor): B x queries x 256, before the sigmoid.
+        boxes (Tensor): B x queries x 4, normalized cxcywh.
+    """
+    from groundingdino.util.misc import NestedTensor, inverse_sigmoid, nested_tensor_from_tensor_list
+
+    samples = nested_tensor_from_tensor_list(images)
+    batch_size = samples.tensors.shape[0]
+    text_dict = {
+        name: text[name].repeat(batch_size, *[1] * (text[name].dim() - 1))
+        for name in ("encoded_text", "text_token_mask", "position_ids", "text_self_attention_masks")
+    }
+
+    features, poss = model.backbone(samples)
+    srcs, masks = [], []
+    for level, feature in enumerate(features):
+        src, mask = feature.decompose()
+        srcs.append(model.input_proj[level](src))
+        masks.append(mask)
+    for level in range(len(features), model.num_feature_levels):
+        if level == len(features):
+            src = model.input_proj[level](features[-1].tensors)
+        else:
+            src = model.input_proj[level](srcs[-1])
+        mask = F.interpolate(samples.mask[None].float(), size=src.shape[-2:]).to(torch.bool)[0]
+        poss.append(model.backbone[1](NestedTensor(src, mask)).to(src.dtype))
+        srcs.append(src)
+        masks.append(mask)
+
+    hs, reference, _, _, _ = model.transformer(srcs, masks, None, poss, None, None, text_dict)
+    boxes = (model.bbox_embed[-1](hs[-1]) + inverse_sigmoid(reference[-2])).sigmoid()
+    logits = model.class_embed[-1](hs[-1], text_dict)
+    return logits, boxes
+
+
+def detect(model, images, text, box_threshold, text_threshold):
+    """
+    GroundingDINO's `predict` on several images from `dino_preprocess`, with the
+    text features of `CaptionCache.get` or `encode_caption`.
+
+    Returns:
+        list of (boxes, logits, phrases) per image, as `predict` returns them.
+    """
+    from groundingdino.util.utils import get_phrases_from_posmap
+
+    device = next(model.parameters()).device
+    with torch.no_grad():
+        logits, boxes = _forward(model, [image.to(device) for image in images], text)
+    logits, boxes = logits.cpu().sigmoid(), boxes.cpu()
+
+    results = []
+    for image_logits, image_boxes in zip(logits, boxes):
+        keep = image_logits.max(dim=1)[0] > box_threshold
+        image_logits, image_boxes = image_logits[keep], image_boxes[keep]
+        phrases = [
+            get_phrases_from_posmap(logit > text_threshold, text["tokenized"], model.tokenizer).replace(
+                ".", ""
+            )
+            for logit in image_logits
+        ]
+        results.append((image_boxes, image_logits.max(dim=1)[0], phrases))
+    return results
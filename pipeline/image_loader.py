@@ -0,0 +1,95 @@
+import cv2
+from PIL import Image
+
+__all__ = ["ImagePyramid"]
+
+# cv2 flags decoding JPEGs at 1/2, 1/4 and 1/8 resolution in the DCT domain
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# EXIF orientations for which the decoded image is transposed
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class ImagePyramid:
+    """
+    An RGB uint8 image at 1/1, 1/2, 1/4 and 1/8 resolution.
+
+    Levels are produced on demand. Images loaded from a file are decoded directly at
+    the reduced resolution, which for JPEGs skips most of the decoding work, and the
+    full resolution is only decoded when `full` is accessed. Level `f` has size
+    ceil(H / f) x ceil(W / f). Coordinates normalized by the image size are valid
+    at every level, pixel coordinates at level `f` are full resolution ones / f.
+    """
+
+    factors = (1, 2, 4, 8)
+
+    def __init__(self, path=None, array=None):
+        assert (path is None) != (array is None), "give either a path or an array"
+        self.path = path
+        self._levels = {}
+        if array is not None:
+            self._levels[1] = array
+            self.size = array.shape[:2]
+        else:
+            with Image.open(path) as img:
+                w, h = img.size
+                if img.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+                    h, w = w, h
+            self.size = (h, w)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(path=path)
+
+    @classmethod
+    def from_array(cls, array):
+        return cls(array=array)
+
+    @property
+    def full(self):
+        return self.level(1)
+
+    def level(self, factor):
+        """
+        The image downscaled by `factor`, one of `factors`.
+        """
+        if factor not in self._levels:
+            self._levels[factor] = self._make_level(factor)
+        return self._levels[factor]
+
+    def _make_level(self, factor):
+        if self.path is not None:
+            flag = _REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+            bgr = cv2.imread(self.path, flag)
+            if bgr is None:
+                raise ValueError(f"cannot decode {self.path}")
+            return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        # the next finer level that is already available
+        source = max(f for f in self._levels if f < factor and factor % f == 0)
+        h, w = self.size
+        size = (-(-w // factor), -(-h // factor))
+        return cv2.resize(self._levels[source], size, interpolation=cv2.INTER_AREA)
+
+    def factor_for(self, scale):
+        """
+        The coarsest factor whose level is at least `scale` times the full resolution.
+        """
+        return max(f for f in self.factors if f == 1 or 1 / f >= scale)
+
+    def for_sam(self, long_side=1024):
+        """
+        Smallest level SAM resizes down to `long_side`.
+        """
+        return self.level(self.factor_for(long_side / max(self.size)))
+
+    def for_dino(self, short_side=800, max_size=1333):
+        """
+        Smallest level GroundingDINO's RandomResize([short_side], max_size) resizes down.
+        """
+        h, w = self.size
+        scale = min(short_side / min(h, w), max_size / max(h, w))
+        return self.level(self.factor_for(scale))
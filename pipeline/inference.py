@@ -0,0 +1,482 @@
+import os
+import sys
+from re import findall
+
+import cv2
+import numpy as np
+import torch
+
+from .checkpoint import mapped_path, load_mapped
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+# segment_anything, GroundingDINO, detectron2 and the DiffMatte/AEMatter sources are
+# imported by the functions using them, so that a process only loads the backends
+# it runs
+
+MATTING_MODELS = ["ViTMatte", "DiffMatte", "AEMatter"]
+MATTING_IDX = 0
+
+models = {
+    "vit_h": "./pretrained/sam_vit_h_4b8939.pth",
+    "vit_b": "./pretrained/sam_vit_b_01ec64.pth",
+}
+
+vitmatte_models = {
+    "vit_b": "./pretrained/ViTMatte_B_DIS.pth",
+}
+
+vitmatte_config = {
+    "vit_b": "./configs/matte_anything.py",
+}
+
+grounding_dino = {
+    "config": "./GroundingDINO/groundingdino/config/GroundingDINO_SwinT_OGC.py",
+    "weight": "./pretrained/groundingdino_swint_ogc.pth",
+}
+
+diffmatte = {
+    "config": "./DiffMatte/configs/ViTS_1024.py",
+    "weight": "./pretrained/DiffMatte_ViTS_Com_1024.pth",
+}
+
+aematter = {
+    "weight": "./pretrained/AEMFIX.ckpt",
+}
+
+
+def init_segment_anything(model_type):
+    """
+    Initialize the segmenting anything with model_type in ['vit_b', 'vit_l', 'vit_h']
+    The weights are memory-mapped when the checkpoint was converted with
+    convert_checkpoint.py.
+    """
+    from segment_anything import sam_model_registry, SamPredictor
+
+    mapped = mapped_path(models[model_type])
+    if os.path.exists(mapped):
+        sam = load_mapped(sam_model_registry[model_type], mapped).to(device)
+    else:
+        sam = sam_model_registry[model_type](checkpoint=models[model_type]).to(device)
+    predictor = SamPredictor(sam)
+
+    return predictor
+
+
+def init_matte(matte_method, vitmatte_model):
+    if matte_method == "ViTMatte":
+        return init_vitmatte(vitmatte_model)
+    elif matte_method == "DiffMatte":
+        return init_diffmatte()
+    elif matte_method == "AEMatter":
+        return init_aematter()
+    else:
+        raise ValueError("Unknown matting model")
+
+
+def matte_checkpoint(matte_method, vitmatte_model):
+    """
+    Checkpoint `init_matte` loads for `matte_method`. Its memory-mapped
+    conversion at `mapped_path`, when it exists, is loaded instead.
+    """
+    if matte_method == "ViTMatte":
+        return vitmatte_models[vitmatte_model]
+    elif matte_method == "DiffMatte":
+        return diffmatte["weight"]
+    elif matte_method == "AEMatter":
+        return aematter["weight"]
+    else:
+        raise ValueError("Unknown matting model")
+
+
+def init_vitmatte(model_type):
+    """
+    Initialize the vitmatte with model_type in ['vit_s', 'vit_b']
+    """
+    from detectron2.config import LazyConfig, instantiate
+    from detectron2.checkpoint import DetectionCheckpointer
+    from modeling.meta_arch.optimize import optimize_for_inference
+
+    cfg = LazyConfig.load(vitmatte_config[model_type])
+    mapped = mapped_path(vitmatte_models[model_type])
+    if os.path.exists(mapped):
+        vitmatte = load_mapped(lambda: instantiate(cfg.model), mapped)
+        vitmatte.to(device)
+        vitmatte.eval()
+    else:
+        vitmatte = instantiate(cfg.model)
+        vitmatte.to(device)
+        vitmatte.eval()
+        DetectionCheckpointer(vitmatte).load(vitmatte_models[model_type])
+    optimize_for_inference(vitmatte)
+
+    return vitmatte
+
+
+def init_diffmatte(
+    model=diffmatte["config"],
+    checkpoint=diffmatte["weight"],
+    sample_strategy="ddim10",
+):
+    from detectron2.config import LazyConfig, instantiate
+    from detectron2.checkpoint import DetectionCheckpointer
+
+    diffmatte_path = os.path.join(ROOT, "DiffMatte")
+    if diffmatte_path not in sys.path:
+        sys.path.insert(0, diffmatte_path)
+
+    cfg = LazyConfig.load(model)
+    if sample_strategy is not None:
+        cfg.difmatte.args["use_ddim"] = True if "ddim" in sample_strategy else False
+        cfg.diffusion.steps = int(findall(r"\d+", sample_strategy)[0])
+
+    model = instantiate(cfg.model)
+    diffusion = instantiate(cfg.diffusion)
+    cfg.difmatte.model = model
+    cfg.difmatte.diffusion = diffusion
+    difmatte = instantiate(cfg.difmatte)
+    difmatte.to(device)
+    difmatte.eval()
+    DetectionCheckpointer(difmatte).load(checkpoint)
+
+    return difmatte
+
+
+def init_aematter(
+    checkpoint=aematter["weight"],
+):
+    aematte_path = os.path.join(ROOT, "AEMatter")
+    if aematte_path not in sys.path:
+        sys.path.insert(0, aematte_path)
+
+    from model import AEMatter
+
+    mapped = mapped_path(checkpoint)
+    if os.path.exists(mapped):
+        aematter = load_mapped(AEMatter, mapped)
+    else:
+        aematter = AEMatter()
+        aematter.load_state_dict(torch.load(checkpoint, map_location="cpu")["model"])
+    aematter = aematter.to(device)
+    aematter.eval()
+
+    return aematter
+
+
+def init_grounding_dino():
+    from groundingdino.util.inference import load_model
+
+    return load_model(grounding_dino["config"], grounding_dino["weight"])
+
+
+def dino_preprocess(image):
+    """
+    Resize and normalize an RGB uint8 image for GroundingDINO.
+    """
+    import groundingdino.datasets.transforms as T
+    from PIL import Image
+
+    transform = T.Compose(
+        [
+            T.RandomResize([800], max_size=1333),
+            T.ToTensor(),
+            T.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+        ]
+    )
+    image_transformed, _ = transform(Image.fromarray(image), None)
+    return image_transformed
+
+
+def dino_predict(model, image, caption, box_threshold, text_threshold, caption_cache=None):
+    """
+    Boxes (normalized cxcywh), logits and phrases of `caption` in the image from
+    `dino_preprocess`. With a CaptionCache, the text features of the caption are
+    only computed the first time it is used.
+    """
+    if caption_cache is not None:
+        from .grounding import detect
+
+        text = caption_cache.get(caption)
+        return detect(model, [image], text, box_threshold, text_threshold)[0]
+
+    from groundingdino.util.inference import predict
+
+    return predict(
+        model=model,
+        image=image,
+        caption=caption,
+        box_threshold=box_threshold,
+        text_threshold=text_threshold,
+        device=device,
+    )
+
+
+def dino_predict_batch(model, images, caption, box_threshold, text_threshold, caption_cache=None):
+    """
+    `dino_predict` on several images from `dino_preprocess` in one forward, sharing
+    the text features of `caption`. The images are padded to a common size and
+    masked, so the results can differ slightly from one image at a time, like for
+    any batched DETR.
+
+    Returns:
+        list of (boxes, logits, phrases) per image.
+    """
+    from .grounding import detect, encode_caption
+
+    if caption_cache is not None:
+        text = caption_cache.get(caption)
+    else:
+        from groundingdino.util.inference import preprocess_caption
+
+        text = encode_caption(model, preprocess_caption(caption))
+    return detect(model, images, text, box_threshold, text_threshold)
+
+
+def generate_trimap(mask, erode_kernel_size=10, dilate_kernel_size=10):
+    erode_kernel = np.ones((erode_kernel_size, erode_kernel_size), np.uint8)
+    dilate_kernel = np.ones((dilate_kernel_size, dilate_kernel_size), np.uint8)
+    eroded = cv2.erode(mask, erode_kernel, iterations=5)
+    dilated = cv2.dilate(mask, dilate_kernel, iterations=5)
+    trimap = np.zeros_like(mask)
+    trimap[dilated == 255] = 128
+    trimap[eroded == 255] = 255
+    return trimap
+
+
+def set_sam_image(predictor, pyramid):
+    """
+    Embed the smallest pyramid level SAM needs, while keeping the full resolution as
+    the original size so that prompts and masks stay in full resolution coordinates.
+    """
+    predictor.set_image(pyramid.for_sam())
+    predictor.original_size = pyramid.size
+
+
+def convert_pixels(gray_image, boxes):
+    converted_image = np.copy(gray_image)
+
+    for box in boxes:
+        x1, y1, x2, y2 = box
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        converted_image[y1:y2, x1:x2][converted_image[y1:y2, x1:x2] == 255] = 128
+
+    return converted_image
+
+
+def upload_uint8(array):
+    """
+    Copy a uint8 numpy array to `device` as is, going through pinned memory on GPU.
+    """
+    tensor = torch.from_numpy(np.ascontiguousarray(array))
+    if device == "cuda":
+        tensor = tensor.pin_memory().to(device, non_blocking=True)
+    return tensor
+
+
+def pred_matting(model, input_x, trimap):
+    image = upload_uint8(input_x).permute(2, 0, 1).unsqueeze(0)
+    trimap_t = upload_uint8(trimap).unsqueeze(0).unsqueeze(0)
+
+    if model.__class__.__name__ == "ViTMatte":
+        # no autograd, which also lets the backbone reuse its resized embeddings
+        with torch.no_grad():
+            alpha = model({"image": image, "trimap": trimap_t})
+        alpha = alpha["phas"].flatten(0, 2)
+        alpha = alpha.detach().cpu().numpy()
+    elif model.__class__.__name__ == "DifMatte":
+        input = {
+            "image": image.float() / 255,
+            "trimap": (trimap_t >= 85).float().add_(trimap_t >= 170).mul_(0.5),
+        }
+        alpha = model(input)
+        alpha /= 255.0
+    elif model.__class__.__name__ == "AEMatter":
+        image, trimap_t, sizes = preprocess_input(input_x, trimap)
+        with torch.no_grad():
+            alpha = model(image, trimap_t)
+            alpha = postprocess_alpha(alpha, trimap, sizes)
+    return alpha
+
+
+def run_matting(model, input_x, trimap, plan):
+    """
+    Run `pred_matting` as described by a MattingPlan, the alpha is always full size.
+    """
+    if plan.crop is None:
+        image, trimap_crop = input_x, trimap
+    else:
+        y0, y1, x0, x1 = plan.crop
+        image, trimap_crop = input_x[y0:y1, x0:x1], trimap[y0:y1, x0:x1]
+    h, w = trimap_crop.shape
+    if plan.scale < 1:
+        size = (max(int(w * plan.scale), 1), max(int(h * plan.scale), 1))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        trimap_crop = cv2.resize(trimap_crop, size, interpolation=cv2.INTER_NEAREST)
+
+    if plan.tile_size is not None and model.__class__.__name__ == "ViTMatte":
+        tile_size = model.decoder.tile_size
+        model.decoder.tile_size = plan.tile_size
+        try:
+            alpha = pred_matting(model, image, trimap_crop)
+        finally:
+            model.decoder.tile_size = tile_size
+    else:
+        alpha = pred_matting(model, image, trimap_crop)
+
+    if plan.scale < 1:
+        alpha = cv2.resize(alpha.astype(np.float32), (w, h), interpolation=cv2.INTER_LINEAR)
+        # known regions come from the full resolution trimap
+        known = trimap[plan.crop[0]:plan.crop[1], plan.crop[2]:plan.crop[3]] if plan.crop else trimap
+        alpha[known == 0] = 0
+        alpha[known == 255] = 1
+    if plan.crop is None:
+        return alpha
+    full = np.zeros(trimap.shape, dtype=alpha.dtype)
+    full[y0:y1, x0:x1] = alpha
+    return full
+
+
+def matte_within_budget(model, input_x, trimap, planner, min_side=64):
+    """
+    Plan the matting stage with `planner` and degrade further if CUDA still runs out
+    of memory. As a last resort, the alpha is taken from the trimap.
+    """
+    plan = planner.plan(trimap)
+    print(f"Matting plan: {plan}")
+    while True:
+        try:
+            return run_matting(model, input_x, trimap, plan)
+        except torch.cuda.OutOfMemoryError:
+            torch.cuda.empty_cache()
+            side = min(trimap.shape) if plan.crop is None else min(
+                plan.crop[1] - plan.crop[0], plan.crop[3] - plan.crop[2]
+            )
+            if side * plan.scale < min_side:
+                print("Out of memory at the smallest scale, using the trimap as alpha")
+                return trimap.astype(np.float32) / 255
+            plan = plan.degraded()
+            print(f"Out of memory, retrying with {plan}")
+
+
+def pred_matting_batch(model, images, trimaps):
+    """
+    ViTMatte alphas of same-size images and trimaps, in one forward.
+    """
+    image = upload_uint8(np.stack(images)).permute(0, 3, 1, 2)
+    trimap_t = upload_uint8(np.stack(trimaps)).unsqueeze(1)
+    with torch.no_grad():
+        alpha = model({"image": image, "trimap": trimap_t})["phas"][:, 0]
+    return list(alpha.cpu().numpy())
+
+
+def expand_crop(crop, size, shape):
+    """
+    Grow the (y0, y1, x0, x1) crop to `size` (h, w) around its center, shifted to
+    stay within an image of `shape`.
+    """
+    y0, y1, x0, x1 = crop
+    h, w = size
+    y0 = min(max(y0 - (h - (y1 - y0)) // 2, 0), shape[0] - h)
+    x0 = min(max(x0 - (w - (x1 - x0)) // 2, 0), shape[1] - w)
+    return y0, y0 + h, x0, x0 + w
+
+
+def matte_objects(model, input_x, trimaps, planner):
+    """
+    Full size alphas of several objects of the same image, one per trimap.
+
+    With ViTMatte, the trimap ROIs are grown to a common size, which adds context
+    rather than padding, and matted in as few batches as the memory budget of
+    `planner` allows. Other models, and the batches that would not fit or run out
+    of memory, go through `matte_within_budget` one object at a time.
+    """
+    alphas = [None] * len(trimaps)
+    crops = [planner.roi(trimap) for trimap in trimaps]
+    pending = []
+    for i, crop in enumerate(crops):
+        if crop is None:
+            # nothing of this object in the trimap
+            alphas[i] = np.zeros(trimaps[i].shape, np.float32)
+        else:
+            pending.append(i)
+
+    if planner.supported and len(pending) > 1:
+        h = max(crops[i][1] - crops[i][0] for i in pending)
+        w = max(crops[i][3] - crops[i][2] for i in pending)
+        budget = planner.budget()
+        batch_size = len(pending) if budget is None else budget // planner.estimate(h, w)
+        print(f"Matting {len(pending)} objects at {h}x{w} in batches of {batch_size}")
+        if batch_size > 1:
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start : start + batch_size]
+                boxes = [expand_crop(crops[i], (h, w), input_x.shape[:2]) for i in batch]
+                try:
+                    batch_alphas = pred_matting_batch(
+                        model,
+                        [input_x[y0:y1, x0:x1] for y0, y1, x0, x1 in boxes],
+                        [trimaps[i][y0:y1, x0:x1] for i, (y0, y1, x0, x1) in zip(batch, boxes)],
+                    )
+                except torch.cuda.OutOfMemoryError:
+                    torch.cuda.empty_cache()
+                    break
+                for i, (y0, y1, x0, x1), alpha in zip(batch, boxes, batch_alphas):
+                    alphas[i] = np.zeros(trimaps[i].shape, alpha.dtype)
+                    alphas[i][y0:y1, x0:x1] = alpha
+
+    for i in pending:
+        if alphas[i] is None:
+            alphas[i] = matte_within_budget(model, input_x, trimaps[i], planner)
+        # the cutouts must not pick up the other objects
+        alphas[i][trimaps[i] == 0] = 0
+        alphas[i][trimaps[i] == 255] = 1
+    return alphas
+
+
+def reflect_index(size, before, after):
+    """
+    Indices padding an axis of `size` like cv2.BORDER_REFLECT (fedcba|abcdefgh|hgfedcb).
+    """
+    # the reflection repeats with period 2 * size, also for pads longer than the axis
+    index = torch.arange(-before, size + after, device=device) % (2 * size)
+    return torch.where(index >= size, 2 * size - index - 1, index)
+
+
+def preprocess_input(rawimg, trimap):
+    h, w, c = rawimg.shape
+    newh = (((h - 1) // 32) + 1) * 32
+    neww = (((w - 1) // 32) + 1) * 32
+    padh = newh - h
+    padh1 = int(padh / 2)
+    padh2 = padh - padh1
+    padw = neww - w
+    padw1 = int(padw / 2)
+    padw2 = padw - padw1
+    rows = reflect_index(h, padh1, padh2)[:, None]
+    cols = reflect_index(w, padw1, padw2)[None, :]
+    # pad and swap RGB to BGR with a single gather
+    bgr = torch.arange(c - 1, -1, -1, device=device)
+    img_pad = upload_uint8(rawimg)[rows[..., None], cols[..., None], bgr]
+    trimap_pad = upload_uint8(trimap)[rows, cols]
+    img = torch.empty((1, c, newh, neww), device=device)
+    img[0].copy_(img_pad.permute(2, 0, 1)).div_(255.0)
+    tritempimgs = torch.stack(
+        [trimap_pad == 0, trimap_pad == 128, trimap_pad == 255]
+    ).unsqueeze(0).float()
+    sizes = {"h": h, "w": w, "padh1": padh1, "padw1": padw1}
+    return img, tritempimgs, sizes
+
+
+def postprocess_alpha(pred, trimap_nonp, sizes):
+    h, w, padh1, padw1 = sizes["h"], sizes["w"], sizes["padh1"], sizes["padw1"]
+    pred = pred.detach().cpu().numpy()[0]
+    pred = pred[:, padh1 : padh1 + h, padw1 : padw1 + w]
+    preda = pred[0:1,] * 255
+    preda = np.transpose(preda, (1, 2, 0))
+    preda = (
+        preda * (trimap_nonp[:, :, None] == 128)
+        + (trimap_nonp[:, :, None] == 255) * 255
+    )
+    preda /= 255.0
+    return preda.squeeze()
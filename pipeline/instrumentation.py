@@ -0,0 +1,310 @@
+import json
+import time
+import functools
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+
+__all__ = ["Instrumentation", "STAGES"]
+
+# named spans of the matting pipeline, in execution order
+STAGES = [
+    "cache",
+    "set_image",
+    "dino_fg",
+    "sam_decode",
+    "dino_transparency",
+    "trimap",
+    "matting",
+    "compositing",
+    "write",
+]
+
+
+class _NullContext:
+    """
+    Shared no-op context returned when instrumentation is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_CONTEXT = _NullContext()
+
+
+class Span:
+    """
+    Measures wall time, CPU time and peak memory of one pipeline stage.
+    """
+
+    def __init__(self, instrumentation, name, tracing=False):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.range = torch.profiler.record_function(name) if tracing else None
+
+    def __enter__(self):
+        if self.range is not None:
+            self.range.__enter__()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            self.cuda_base = torch.cuda.memory_allocated()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self.cpu_base = tracemalloc.get_traced_memory()[0]
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if torch.cuda.is_available():
+            # kernels are asynchronous, wait for them to attribute time to this stage
+            torch.cuda.synchronize()
+        record = {
+            "wall_ms": (time.perf_counter() - self.wall_start) * 1000,
+            "cpu_ms": (time.process_time() - self.cpu_start) * 1000,
+        }
+        if tracemalloc.is_tracing():
+            record["peak_cpu_mb"] = (tracemalloc.get_traced_memory()[1] - self.cpu_base) / 2**20
+        if torch.cuda.is_available():
+            record["peak_cuda_mb"] = (torch.cuda.max_memory_allocated() - self.cuda_base) / 2**20
+        if self.range is not None:
+            self.range.__exit__(*exc)
+        self.instrumentation._finish_span(self.name, record)
+        return False
+
+
+class Request:
+    """
+    Groups the spans of one pipeline run and reports them when it exits.
+    """
+
+    def __init__(self, instrumentation):
+        self.instrumentation = instrumentation
+
+    def __enter__(self):
+        self.instrumentation._local.spans = {}
+        self.wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        spans = self.instrumentation._local.spans
+        self.instrumentation._local.spans = None
+        self.instrumentation._finish_request(
+            {
+                "time": time.time(),
+                "total_ms": (time.perf_counter() - self.wall_start) * 1000,
+                "ok": exc_type is None,
+                "spans": spans,
+            }
+        )
+        return False
+
+
+class Instrumentation:
+    """
+    Per-stage latency and memory instrumentation of the matting pipeline.
+
+    Each request is written as one JSON line to `jsonl_path` and aggregated into
+    Prometheus-style metrics served on `port` at /metrics, along with /ready (see
+    `set_readiness`). When neither is set, `span` and `request` return a shared
+    no-op context, unless the thread is being traced (see `set_tracing`), in which
+    case spans are torch.profiler ranges.
+    """
+
+    def __init__(self, jsonl_path=None, port=None, trace_python_memory=False):
+        """
+        Args:
+            jsonl_path (str or None): file the per-request records are appended to.
+            port (int or None): port of the /metrics and /ready HTTP endpoints.
+            trace_python_memory (bool): If True, track peak host memory with tracemalloc,
+                which slows down Python allocations noticeably.
+        """
+        self.enabled = jsonl_path is not None or port is not None
+        self.jsonl_path = jsonl_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._requests = {"ok": 0, "error": 0}
+        self._collectors = []
+        self._readiness = None
+        self._server = None
+
+        if self.enabled and trace_python_memory:
+            tracemalloc.start()
+        if port is not None:
+            self.serve(port)
+
+    def span(self, name):
+        tracing = getattr(self._local, "tracing", False)
+        if not self.enabled:
+            return torch.profiler.record_function(name) if tracing else NULL_CONTEXT
+        return Span(self, name, tracing)
+
+    def request(self):
+        if not self.enabled:
+            return NULL_CONTEXT
+        return Request(self)
+
+    def set_tracing(self, tracing):
+        """
+        Emit the spans of the current thread as torch.profiler ranges.
+        """
+        self._local.tracing = tracing
+
+    def track_request(self, func):
+        """
+        Decorator running `func` inside `request()`.
+        """
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.request():
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def last_request(self):
+        """
+        Record of the last request finished on the current thread, or None.
+        """
+        return getattr(self._local, "last_request", None)
+
+    def merge(self, record):
+        """
+        Aggregate a request record produced by another process, which already wrote
+        it to its JSON lines file.
+        """
+        self._aggregate(record["spans"])
+        with self._lock:
+            self._requests["ok" if record["ok"] else "error"] += 1
+
+    def add_collector(self, collector):
+        """
+        Register a callable returning extra Prometheus lines for /metrics.
+        """
+        self._collectors.append(collector)
+
+    def set_readiness(self, probe):
+        """
+        Register a callable returning a JSON-serializable dict with a "ready" key,
+        served on /ready with status 200 when ready and 503 otherwise. Without one,
+        /ready always reports ready.
+        """
+        self._readiness = probe
+
+    def readiness(self):
+        if self._readiness is None:
+            return {"ready": True}
+        return self._readiness()
+
+    def _finish_span(self, name, record):
+        spans = getattr(self._local, "spans", None)
+        if spans is None:
+            # span outside of a request, reported on its own
+            self._aggregate({name: record})
+            return
+        if name in spans:
+            # stages entered several times in a request accumulate
+            previous = spans[name]
+            for key, value in record.items():
+                if key.startswith("peak_"):
+                    record[key] = max(previous.get(key, 0.0), value)
+                else:
+                    record[key] = previous[key] + value
+        spans[name] = record
+
+    def _aggregate(self, spans):
+        with self._lock:
+            for name, record in spans.items():
+                totals = self._totals.setdefault(name, {"wall_ms": 0.0, "cpu_ms": 0.0, "count": 0})
+                totals["count"] += 1
+                for key, value in record.items():
+                    if key.startswith("peak_"):
+                        totals[key] = max(totals.get(key, 0.0), value)
+                    else:
+                        totals[key] += value
+
+    def _finish_request(self, record):
+        self._local.last_request = record
+        self._aggregate(record["spans"])
+        with self._lock:
+            self._requests["ok" if record["ok"] else "error"] += 1
+            if self.jsonl_path is not None:
+                with open(self.jsonl_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    def prometheus_metrics(self):
+        """
+        Returns the aggregated metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            "# TYPE matte_anything_requests_total counter",
+        ]
+        with self._lock:
+            for status, count in self._requests.items():
+                lines.append(f'matte_anything_requests_total{{status="{status}"}} {count}')
+            lines.append("# TYPE matte_anything_stage_wall_seconds summary")
+            for name, totals in self._totals.items():
+                lines.append(
+                    f'matte_anything_stage_wall_seconds_sum{{stage="{name}"}} '
+                    f'{totals["wall_ms"] / 1000:.6f}'
+                )
+                lines.append(
+                    f'matte_anything_stage_wall_seconds_count{{stage="{name}"}} {totals["count"]}'
+                )
+            lines.append("# TYPE matte_anything_stage_cpu_seconds_total counter")
+            for name, totals in self._totals.items():
+                lines.append(
+                    f'matte_anything_stage_cpu_seconds_total{{stage="{name}"}} '
+                    f'{totals["cpu_ms"] / 1000:.6f}'
+                )
+            lines.append("# TYPE matte_anything_stage_peak_memory_bytes gauge")
+            for name, totals in self._totals.items():
+                for device in ("cpu", "cuda"):
+                    if f"peak_{device}_mb" in totals:
+                        lines.append(
+                            f'matte_anything_stage_peak_memory_bytes{{stage="{name}",device="{device}"}} '
+                            f'{int(totals[f"peak_{device}_mb"] * 2**20)}'
+                        )
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port):
+        """
+        Serve /metrics and /ready on `port` from a daemon thread.
+        """
+        instrumentation = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    status = 200
+                    body = instrumentation.prometheus_metrics().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/ready":
+                    readiness = instrumentation.readiness()
+                    status = 200 if readiness["ready"] else 503
+                    body = json.dumps(readiness).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
@@ -0,0 +1,236 @@
+import math
+
+import numpy as np
+import torch
+
+__all__ = ["MattingPlan", "MemoryPlanner", "vit_peak_bytes", "decoder_peak_bytes"]
+
+
+def vit_peak_bytes(
+    h_tokens,
+    w_tokens,
+    embed_dim,
+    num_heads,
+    window_size,
+    mlp_ratio=4.0,
+    global_splits=1,
+    bytes_per_element=4,
+):
+    """
+    Estimate the peak activation memory of a plain ViT backbone at inference.
+    Args:
+        h_tokens, w_tokens (int): token grid size.
+        embed_dim (int): token dimension.
+        num_heads (int): number of attention heads.
+        window_size (int): window size of the window attention blocks, 0 if none.
+        mlp_ratio (float): ratio of mlp hidden dim to embedding dim.
+        global_splits (int): number of chunks global attention is computed in.
+        bytes_per_element (int): 4 for fp32, 2 for fp16.
+
+    Returns:
+        peak memory in bytes.
+    """
+    n = h_tokens * w_tokens
+    # input, shortcut and normalized tokens, qkv, and the MLP hidden layer
+    block = n * embed_dim * (3 + 3 + mlp_ratio)
+    # attention scores, rel-pos sum and softmax output for one chunk
+    n_global = n / global_splits
+    attention = 3 * num_heads * n_global * n_global
+    if window_size > 0:
+        hp = math.ceil(h_tokens / window_size) * window_size
+        wp = math.ceil(w_tokens / window_size) * window_size
+        attention = max(attention, 3 * num_heads * hp * wp * window_size * window_size)
+    return int(bytes_per_element * (block + attention))
+
+
+def decoder_peak_bytes(decoder, height, width, tile_size=None, bytes_per_element=4):
+    """
+    Estimate the peak activation memory of Detail_Capture at inference.
+    Args:
+        decoder (Detail_Capture): decoder module, only its channel layout is used.
+        height, width (int): padded input size.
+        tile_size (int or None): tile size of the full resolution stages.
+        bytes_per_element (int): 4 for fp32, 2 for fp16.
+
+    Returns:
+        peak memory in bytes.
+    """
+    conv_chans, fus_chans = decoder.conv_chans, decoder.fus_channs
+    num_blocks = len(decoder.fusion_blks)
+    num_untiled = num_blocks - decoder.tiled_stages if tile_size else num_blocks
+    pixels = height * width
+
+    # ConvStream outputs stay alive during the whole decoder
+    live = sum(c * pixels / 4**i for i, c in enumerate(conv_chans))
+    stages = []
+    for i in range(num_blocks):
+        stride = 2 ** (num_blocks - i - 1)
+        stage_pixels = pixels / stride**2
+        if i >= num_untiled:
+            # tile and halo at this stage resolution
+            side = tile_size / stride + 2 * (num_blocks - i + 1)
+            stage_pixels = min(stage_pixels, side * side)
+        # upsampled features, concatenation and conv output
+        cat_chans = fus_chans[i] + conv_chans[-(i + 1)]
+        stages.append(stage_pixels * (fus_chans[i] + cat_chans + fus_chans[i + 1]))
+    head_pixels = pixels if not tile_size else min(pixels, (tile_size + 2) ** 2)
+    stages.append(head_pixels * (fus_chans[-1] + 2 * decoder.matting_head.matting_convs[0].out_channels))
+
+    # the full resolution output
+    return int(bytes_per_element * (live + max(stages) + pixels))
+
+
+class MattingPlan:
+    """
+    How the matting stage is run on one request.
+
+    strategy is one of "full", "roi" (matte only `crop`), "tiled" (ROI crop with a tiled
+    decoder) and "downscale" (ROI crop matted at `scale`, alpha upsampled back).
+    """
+
+    def __init__(self, strategy, estimate=None, crop=None, tile_size=None, scale=1.0):
+        self.strategy = strategy
+        self.estimate = estimate
+        self.crop = crop
+        self.tile_size = tile_size
+        self.scale = scale
+
+    def __repr__(self):
+        estimate = "?" if self.estimate is None else f"{self.estimate / 2**20:.0f} MiB"
+        return (
+            f"MattingPlan(strategy={self.strategy}, estimate={estimate}, crop={self.crop}, "
+            f"tile_size={self.tile_size}, scale={self.scale:.3g})"
+        )
+
+    def degraded(self, factor=0.5):
+        """
+        Next plan to try after running out of memory with this one.
+        """
+        return MattingPlan(
+            "downscale", crop=self.crop, tile_size=self.tile_size, scale=self.scale * factor
+        )
+
+
+class MemoryPlanner:
+    """
+    Picks a matting strategy ahead of time from the input size and model config so
+    that the estimated peak memory stays within a budget.
+    """
+
+    def __init__(
+        self,
+        model,
+        budget_bytes=None,
+        margin=64,
+        tile_sizes=(1024, 512, 256),
+        min_side=256,
+    ):
+        """
+        Args:
+            model (nn.Module): matting model. Estimates are only available for ViTMatte,
+                other models always get the "full" plan.
+            budget_bytes (int or None): activation memory budget. If None, the free CUDA
+                memory is used on GPU and no budget is applied on CPU.
+            margin (int): context in pixels kept around the trimap ROI.
+            tile_sizes (tuple): decoder tile sizes to try, largest first.
+            min_side (int): smallest short side the input is downscaled to.
+        """
+        self.model = model
+        self.budget_bytes = budget_bytes
+        self.margin = margin
+        self.tile_sizes = tile_sizes
+        self.min_side = min_side
+        self.supported = model.__class__.__name__ == "ViTMatte"
+
+    def budget(self):
+        if self.budget_bytes is not None:
+            return self.budget_bytes
+        if torch.cuda.is_available():
+            free, _ = torch.cuda.mem_get_info()
+            return int(free * 0.9)
+        return None
+
+    def estimate(self, height, width, tile_size=None):
+        """
+        Estimated peak memory in bytes of the matting model on a height x width input.
+        """
+        model = self.model
+        backbone = model.backbone
+        divisibility = model.size_divisibility
+        height = math.ceil(height / divisibility) * divisibility
+        width = math.ceil(width / divisibility) * divisibility
+        bytes_per_element = backbone.patch_embed.proj.weight.element_size()
+
+        embed_dim = backbone.patch_embed.proj.out_channels
+        attn = backbone.blocks[0].attn
+        mlp_ratio = backbone.blocks[0].mlp.fc1.out_features / embed_dim
+        vit = vit_peak_bytes(
+            height // backbone.patch_size,
+            width // backbone.patch_size,
+            embed_dim,
+            attn.num_heads,
+            backbone.window_size,
+            mlp_ratio=mlp_ratio,
+            # ViT blocks compute global attention on 2x2 strided subsets at inference
+            global_splits=4,
+            bytes_per_element=bytes_per_element,
+        )
+        decoder = decoder_peak_bytes(
+            model.decoder, height, width, tile_size, bytes_per_element
+        )
+        # the padded 4-channel input and backbone features are alive in both
+        inputs = bytes_per_element * height * width * 4
+        return inputs + max(vit, decoder)
+
+    def roi(self, trimap):
+        """
+        Bounding box (y0, y1, x0, x1) of the non-background trimap pixels plus margin.
+        """
+        rows = np.flatnonzero(trimap.any(1))
+        cols = np.flatnonzero(trimap.any(0))
+        if rows.size == 0:
+            return None
+        h, w = trimap.shape
+        return (
+            max(int(rows[0]) - self.margin, 0),
+            min(int(rows[-1]) + 1 + self.margin, h),
+            max(int(cols[0]) - self.margin, 0),
+            min(int(cols[-1]) + 1 + self.margin, w),
+        )
+
+    def plan(self, trimap):
+        """
+        Args:
+            trimap (ndarray): uint8 trimap of the request.
+
+        Returns:
+            MattingPlan, the cheapest degradation that fits the budget.
+        """
+        budget = self.budget()
+        if not self.supported:
+            return MattingPlan("full")
+        h, w = trimap.shape
+        estimate = self.estimate(h, w)
+        if budget is None or estimate <= budget:
+            return MattingPlan("full", estimate)
+
+        crop = self.roi(trimap)
+        if crop is not None:
+            h, w = crop[1] - crop[0], crop[3] - crop[2]
+            estimate = self.estimate(h, w)
+            if estimate <= budget:
+                return MattingPlan("roi", estimate, crop)
+
+        for tile_size in self.tile_sizes:
+            estimate = self.estimate(h, w, tile_size)
+            if estimate <= budget:
+                return MattingPlan("tiled", estimate, crop, tile_size)
+
+        tile_size = self.tile_sizes[-1]
+        scale = 1.0
+        while min(h, w) * scale > self.min_side:
+            scale *= 0.75
+            estimate = self.estimate(int(h * scale), int(w * scale), tile_size)
+            if estimate <= budget:
+                break
+        return MattingPlan("downscale", estimate, crop, tile_size, scale)
@@ -0,0 +1,192 @@
+import os
+import io
+import json
+import hashlib
+import zipfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+__all__ = ["ResultCache", "file_identity"]
+
+
+def file_identity(*paths):
+    """
+    Path, size and modification time of each existing file, so that keys change
+    when a checkpoint is replaced.
+    """
+    identity = []
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            identity.append([path, stat.st_size, int(stat.st_mtime)])
+        else:
+            identity.append([path, None, None])
+    return identity
+
+
+class ResultCache:
+    """
+    Content-addressed cache of pipeline results, dicts of numpy arrays.
+
+    Keys hash the input arrays with the parameters (see `key`). Entries are stored
+    as compressed .npz files in `directory`, evicted least recently used first once
+    they take more than `max_bytes`, and the last `memory_entries` entries used are
+    also kept decoded in memory. Files are written atomically, so processes can
+    share a directory, each evicting with its own view of the access order.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30, memory_entries=16):
+        """
+        Args:
+            directory (str): where the entries are stored, created if needed.
+            max_bytes (int): size budget of the files in `directory`.
+            memory_entries (int): number of decoded entries kept in memory.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        # key -> file size, least recently used first
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime, name[: -len(".npz")], stat.st_size))
+        self._files = OrderedDict((key, size) for _, key, size in sorted(files))
+        self._bytes = sum(self._files.values())
+
+    @staticmethod
+    def key(*arrays, **params):
+        """
+        Hash of the arrays' contents, shapes and dtypes and of the JSON-serializable
+        parameters.
+        """
+        h = hashlib.blake2b(digest_size=20)
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            h.update(f"{array.shape}{array.dtype}".encode())
+            h.update(memoryview(array).cast("B"))
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """
+        The arrays stored under `key`, read-only, or None.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                if key in self._files:
+                    self._files.move_to_end(key)
+                self.hits["memory"] += 1
+                return entry
+        # also finds the entries written by other processes
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                entry = {name: data[name] for name in data.files}
+            os.utime(path)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile) as e:
+            # unreadable or truncated, dropped and recomputed by the caller
+            print(f"Dropping result cache entry {key}: {e!r}")
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            self._remove(path)
+            return None
+        for array in entry.values():
+            array.setflags(write=False)
+        with self._lock:
+            self.hits["disk"] += 1
+            if key not in self._files:
+                self._bytes += size
+            self._files[key] = size
+            self._files.move_to_end(key)
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, arrays):
+        """
+        Store the dict of numpy arrays `arrays` under `key`. When the file cannot
+        be written, the result is not cached and the request goes on.
+        """
+        entry = {name: np.array(array) for name, array in arrays.items()}
+        for array in entry.values():
+            array.setflags(write=False)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **entry)
+        size = buffer.tell()
+        if size > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Not caching result {key}: {e!r}")
+            self._remove(tmp)
+            return
+
+        with self._lock:
+            self._forget(key)
+            self._files[key] = size
+            self._bytes += size
+            self._remember(key, entry)
+            while self._bytes > self.max_bytes:
+                old, _ = next(iter(self._files.items()))
+                self._forget(old)
+                self._remove(self._path(old))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _forget(self, key):
+        size = self._files.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+        self._memory.pop(key, None)
+
+    def prometheus_metrics(self):
+        """
+        Hit, miss and size metrics, for Instrumentation.add_collector.
+        """
+        with self._lock:
+            return [
+                "# TYPE matte_anything_result_cache_requests_total counter",
+                f'matte_anything_result_cache_requests_total{{result="memory_hit"}} {self.hits["memory"]}',
+                f'matte_anything_result_cache_requests_total{{result="disk_hit"}} {self.hits["disk"]}',
+                f'matte_anything_result_cache_requests_total{{result="miss"}} {self.misses}',
+                "# TYPE matte_anything_result_cache_bytes gauge",
+                f"matte_anything_result_cache_bytes {self._bytes}",
+                "# TYPE matte_anything_result_cache_entries gauge",
+                f"matte_anything_result_cache_entries {len(self._files)}",
+            ]
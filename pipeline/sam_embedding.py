@@ -0,0 +1,132 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+
+from .inference import set_sam_image
+
+__all__ = ["EmbeddingCache", "embed_batch", "restore"]
+
+
+def embed_batch(predictor, pyramids, batch_size=4):
+    """
+    SAM embeddings of several images, encoded `batch_size` at a time.
+
+    Each image is resized and padded to SAM's square input like `set_sam_image`
+    does, so that the embeddings are the same as one by one, and the batch size is
+    halved when CUDA runs out of memory.
+    Args:
+        predictor (SamPredictor): predictor of the SAM model.
+        pyramids (list[ImagePyramid]): the images.
+        batch_size (int): images per image encoder forward.
+
+    Returns:
+        list[dict]: entries as `EmbeddingCache.embed` returns them, for `restore`.
+    """
+    model = predictor.model
+    inputs, entries = [], []
+    for pyramid in pyramids:
+        image = predictor.transform.apply_image(pyramid.for_sam())
+        image = torch.as_tensor(image, device=predictor.device).permute(2, 0, 1)[None]
+        entries.append({"input_size": tuple(image.shape[-2:]), "original_size": pyramid.size})
+        inputs.append(model.preprocess(image))
+
+    start = 0
+    while start < len(inputs):
+        batch = torch.cat(inputs[start : start + batch_size])
+        try:
+            with torch.no_grad():
+                features = model.image_encoder(batch)
+        except torch.cuda.OutOfMemoryError:
+            if batch_size == 1:
+                raise
+            torch.cuda.empty_cache()
+            batch_size //= 2
+            print(f"Out of memory, encoding {batch_size} images at a time")
+            continue
+        for entry, image_features in zip(entries[start:], features.split(1)):
+            entry["features"] = image_features
+        start += len(batch)
+    return entries
+
+
+def restore(predictor, entry):
+    """
+    Make `predictor` hold the embedding `entry`, as if its image had been set.
+    """
+    predictor.features = entry["features"]
+    predictor.input_size = entry["input_size"]
+    predictor.original_size = entry["original_size"]
+    predictor.is_image_set = True
+
+
+class EmbeddingCache:
+    """
+    SAM image embeddings of the last `max_entries` images, so that prompting the
+    same image again only runs the prompt encoder and mask decoder.
+
+    An entry is what `SamPredictor.set_image` leaves on the predictor: the features
+    and the input and original sizes. The predictor holds the embedding of a single
+    image, so it is only used through `use`, which restores an entry under a lock
+    shared with `embed`.
+    """
+
+    def __init__(self, max_entries=8):
+        """
+        Args:
+            max_entries (int): number of embeddings kept, about 4MB each.
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, predictor, pyramid, key):
+        """
+        Embedding of the image of `pyramid`, stored under `key`, computed with
+        `set_sam_image` unless it is cached. A None key is neither looked up nor
+        stored.
+        """
+        with self.lock:
+            entry = self._entries.get(key) if key is not None else None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            set_sam_image(predictor, pyramid)
+            entry = {
+                "features": predictor.features,
+                "input_size": predictor.input_size,
+                "original_size": predictor.original_size,
+            }
+            if key is not None and self.max_entries > 0:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return entry
+
+    @contextmanager
+    def use(self, predictor, entry):
+        """
+        Context in which `predictor` holds the embedding `entry`, as returned by
+        `embed`.
+        """
+        with self.lock:
+            restore(predictor, entry)
+            yield predictor
+
+    def prometheus_metrics(self):
+        """
+        Hit and miss counters, for Instrumentation.add_collector.
+        """
+        with self.lock:
+            return [
+                "# TYPE matte_anything_sam_embedding_requests_total counter",
+                f'matte_anything_sam_embedding_requests_total{{result="hit"}} {self.hits}',
+                f'matte_anything_sam_embedding_requests_total{{result="miss"}} {self.misses}',
+                "# TYPE matte_anything_sam_embedding_entries gauge",
+                f"matte_anything_sam_embedding_entries {len(self._entries)}",
+            ]
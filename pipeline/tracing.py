@@ -0,0 +1,103 @@
+import io
+import os
+import time
+import pstats
+import random
+import itertools
+import cProfile
+import functools
+from pstats import SortKey
+
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+__all__ = ["TraceSampler"]
+
+
+class TraceSampler:
+    """
+    Profiles a random sample of pipeline requests.
+
+    Sampled requests are recorded with torch.profiler, the pipeline spans of
+    `instrumentation` showing up as record_function ranges, and exported as a Chrome
+    trace plus a table of the top operators. With `cprofile`, the same requests are
+    also profiled with cProfile and dumped as .prof files.
+    """
+
+    def __init__(
+        self,
+        instrumentation,
+        sample_rate=0.0,
+        output_dir="profiling_results",
+        row_limit=25,
+        cprofile=False,
+    ):
+        """
+        Args:
+            instrumentation (Instrumentation): provides the stage spans.
+            sample_rate (float): probability for a request to be profiled.
+            output_dir (str): directory the traces and tables are written to.
+            row_limit (int): number of operators in the summary table.
+            cprofile (bool): If True, also profile the sampled requests with cProfile.
+        """
+        self.instrumentation = instrumentation
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.row_limit = row_limit
+        self.cprofile = cprofile
+        self._count = itertools.count()
+
+    def trace_request(self, func):
+        """
+        Decorator profiling the sampled calls of `func`.
+        """
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+                return func(*args, **kwargs)
+            return self._profile(func, *args, **kwargs)
+
+        return wrapper
+
+    def _profile(self, func, *args, **kwargs):
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        profiler = cProfile.Profile() if self.cprofile else None
+
+        self.instrumentation.set_tracing(True)
+        try:
+            with profile(activities=activities, record_shapes=True, profile_memory=True) as prof:
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            self.instrumentation.set_tracing(False)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = os.path.join(
+            self.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{next(self._count)}'
+        )
+        prof.export_chrome_trace(f"{name}.json")
+        sort_by = "self_cuda_time_total" if torch.cuda.is_available() else "self_cpu_time_total"
+        table = prof.key_averages().table(sort_by=sort_by, row_limit=self.row_limit)
+        with open(f"{name}.txt", "w") as f:
+            f.write(table)
+        print(table)
+        print(f"Trace written to {name}.json")
+
+        if profiler is not None:
+            profiler.dump_stats(f"{name}.prof")
+            s = io.StringIO()
+            ps = pstats.Stats(profiler, stream=s).sort_stats(SortKey.CUMULATIVE)
+            ps.print_stats("predictor.py:", 1)
+            ps.print_stats("inference.py:", 1)
+            ps.print_stats("matte_anything.py:", 3)
+            print(s.getvalue())
+
+        return result
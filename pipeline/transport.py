@@ -0,0 +1,199 @@
+import time
+import weakref
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+__all__ = ["SlabHandle", "SlabRing"]
+
+
+class SlabHandle:
+    """
+    Picklable reference to an array stored in a slab of a SlabRing.
+    """
+
+    __slots__ = ("slab", "shape", "dtype")
+
+    def __init__(self, slab, shape, dtype):
+        self.slab = slab
+        self.shape = shape
+        self.dtype = dtype
+
+    def __getstate__(self):
+        return self.slab, self.shape, self.dtype
+
+    def __setstate__(self, state):
+        self.slab, self.shape, self.dtype = state
+
+    def __repr__(self):
+        return f"SlabHandle(slab={self.slab}, shape={self.shape}, dtype={self.dtype})"
+
+
+class SlabRing:
+    """
+    Ring of preallocated shared memory slabs for passing arrays between processes.
+
+    An array is written once into a free slab and travels as a SlabHandle. The
+    receiving process maps the slab without copying. Slabs are reference counted in
+    shared memory: `put` and `empty` return a handle holding one reference, `take`
+    hands that reference to the returned array, which releases it when garbage
+    collected, and `retain`/`release` manage extra references explicitly. The ring
+    has to be created before the processes using it are forked.
+    """
+
+    def __init__(self, num_slabs, slab_bytes, min_bytes=1 << 16, context=None):
+        """
+        Args:
+            num_slabs (int): number of slabs.
+            slab_bytes (int): size of each slab, the largest array it can hold.
+            min_bytes (int): arrays smaller than this are not worth a slab in `pack`.
+            context: multiprocessing context the shared counters are created with.
+        """
+        context = context or mp.get_context()
+        self.num_slabs = num_slabs
+        self.slab_bytes = slab_bytes
+        self.min_bytes = min_bytes
+        self._slabs = [
+            shared_memory.SharedMemory(create=True, size=slab_bytes) for _ in range(num_slabs)
+        ]
+        self._refcounts = context.Array("i", num_slabs, lock=False)
+        self._next = context.Value("i", 0, lock=False)
+        self._freed = context.Condition()
+
+    def _acquire(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._freed:
+            while True:
+                for i in range(self.num_slabs):
+                    slab = (self._next.value + i) % self.num_slabs
+                    if self._refcounts[slab] == 0:
+                        self._refcounts[slab] = 1
+                        self._next.value = (slab + 1) % self.num_slabs
+                        return slab
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._freed.wait(remaining)
+
+    def empty(self, shape, dtype, timeout=None):
+        """
+        Allocate an uninitialized array in a free slab.
+
+        Returns:
+            (SlabHandle, ndarray) or None if the array does not fit in a slab or no
+            slab was freed within `timeout` seconds.
+        """
+        dtype = np.dtype(dtype)
+        if int(np.prod(shape)) * dtype.itemsize > self.slab_bytes:
+            return None
+        slab = self._acquire(timeout)
+        if slab is None:
+            return None
+        handle = SlabHandle(slab, tuple(shape), dtype.str)
+        return handle, self._view(handle)
+
+    def put(self, array, timeout=None):
+        """
+        Copy `array` into a free slab, returns its SlabHandle or None (see `empty`).
+        """
+        allocated = self.empty(array.shape, array.dtype, timeout)
+        if allocated is None:
+            return None
+        handle, view = allocated
+        np.copyto(view, array)
+        return handle
+
+    def _view(self, handle):
+        return np.ndarray(handle.shape, np.dtype(handle.dtype), self._slabs[handle.slab].buf)
+
+    def take(self, handle):
+        """
+        Map the array of `handle` without copying. The reference held by the handle
+        moves to the array and is released once the array and its views are gone.
+        """
+        # a fresh ndarray so the finalizer follows the lifetime of this array only
+        view = self._view(handle)[...]
+        weakref.finalize(view, self.release, handle)
+        return view
+
+    def retain(self, handle):
+        with self._freed:
+            self._refcounts[handle.slab] += 1
+
+    def release(self, handle):
+        with self._freed:
+            count = self._refcounts[handle.slab] - 1
+            assert count >= 0, f"{handle} released too often"
+            self._refcounts[handle.slab] = count
+            if count == 0:
+                self._freed.notify_all()
+
+    def locked(self):
+        """
+        Context holding the lock the reference counts change under, so that shared
+        state updated in it changes together with the references released in it.
+        """
+        return self._freed
+
+    def in_use(self):
+        """
+        Number of slabs currently referenced.
+        """
+        with self._freed:
+            return sum(count > 0 for count in self._refcounts)
+
+    def pack(self, obj):
+        """
+        Replace the large arrays of `obj`, possibly nested in tuples, lists and dicts, by
+        handles. Arrays that do not fit are left to pickling, no slab is waited for.
+        """
+        if isinstance(obj, np.ndarray):
+            if obj.nbytes < self.min_bytes or obj.dtype.hasobject:
+                return obj
+            handle = self.put(obj, timeout=0)
+            return obj if handle is None else handle
+        if type(obj) in (tuple, list):
+            return type(obj)(self.pack(o) for o in obj)
+        if isinstance(obj, dict):
+            return {k: self.pack(v) for k, v in obj.items()}
+        return obj
+
+    def unpack(self, obj):
+        """
+        Inverse of `pack`, the arrays map the slabs and release them when collected.
+        """
+        if isinstance(obj, SlabHandle):
+            return self.take(obj)
+        if type(obj) in (tuple, list):
+            return type(obj)(self.unpack(o) for o in obj)
+        if isinstance(obj, dict):
+            return {k: self.unpack(v) for k, v in obj.items()}
+        return obj
+
+    @staticmethod
+    def handles(obj):
+        """
+        The SlabHandles in a packed `obj`.
+        """
+        if isinstance(obj, SlabHandle):
+            return [obj]
+        if type(obj) in (tuple, list):
+            return [h for o in obj for h in SlabRing.handles(o)]
+        if isinstance(obj, dict):
+            return [h for o in obj.values() for h in SlabRing.handles(o)]
+        return []
+
+    def close(self, unlink=True):
+        """
+        Unmap the slabs and, in the process that created the ring, free them.
+        """
+        for slab in self._slabs:
+            try:
+                slab.close()
+            except BufferError:
+                # arrays still map the slab, the mapping goes away with the process
+                pass
+            if unlink:
+                slab.unlink()
+        self._slabs = []
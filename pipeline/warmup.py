@@ -0,0 +1,183 @@
+import time
+import threading
+
+import cv2
+import numpy as np
+import torch
+
+from .image_loader import ImagePyramid
+from . import inference
+
+__all__ = ["Warmup", "parse_size"]
+
+
+def parse_size(text):
+    """
+    "HxW" to (h, w).
+    """
+    h, w = text.lower().split("x")
+    return int(h), int(w)
+
+
+def synthetic_inputs(h, w, seed=0):
+    """
+    Noise image with an elliptic foreground: its mask, trimap and box (xyxy).
+    """
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    mask = np.zeros((h, w), np.uint8)
+    cv2.ellipse(mask, (w // 2, h // 2), (w // 4, h // 3), 0, 0, 360, 255, -1)
+    trimap = inference.generate_trimap(mask, 10, 10)
+    box = np.array([w // 4, h // 6, 3 * w // 4, 5 * h // 6], dtype=np.float32)
+    return image, mask, trimap, box
+
+
+def _synchronize():
+    if inference.device == "cuda":
+        torch.cuda.synchronize()
+
+
+class Warmup:
+    """
+    Runs the loaded models on synthetic inputs at the configured sizes before the
+    server reports ready.
+
+    The first run at a size pays for allocator growth, lazy CUDA/cuDNN initialization
+    and kernel selection, and for the positional embeddings the ViT backbones resize
+    to the token grid, which ViTMatte then keeps per shape. Each size is run
+    `iterations` times and the wall time of every run is recorded, so the gap
+    between the first and the last run shows what the warmup saved. `ready` is set
+    once everything ran, also when warmup is disabled.
+    """
+
+    def __init__(self, sizes=((1024, 1024),), iterations=2):
+        """
+        Args:
+            sizes (list[tuple]): (h, w) input sizes, empty to skip the warmup.
+            iterations (int): runs per model and size.
+        """
+        self.sizes = [tuple(size) for size in sizes]
+        self.iterations = iterations
+        self.ready = threading.Event()
+        # {model: {"HxW": [seconds per run]}}, read from the HTTP thread during `run`
+        self.timings = {}
+        self._lock = threading.Lock()
+        self.total_seconds = 0.0
+
+    def _time(self, name, size, func):
+        with self._lock:
+            runs = self.timings.setdefault(name, {}).setdefault(f"{size[0]}x{size[1]}", [])
+        for _ in range(self.iterations):
+            start = time.perf_counter()
+            func()
+            _synchronize()
+            with self._lock:
+                runs.append(time.perf_counter() - start)
+
+    def _timings(self):
+        # a copy, safe to iterate while `run` adds timings
+        with self._lock:
+            return {
+                name: {size: list(runs) for size, runs in sizes.items()}
+                for name, sizes in self.timings.items()
+            }
+
+    def run(
+        self, predictor=None, matting_model=None, grounding_dino=None, planner=None, captions=None
+    ):
+        """
+        Warm up the given models and set `ready`.
+        Args:
+            predictor (SamPredictor or None): SAM, warmed up with a box prompt.
+            matting_model (nn.Module or None): matting model.
+            grounding_dino (nn.Module or None): GroundingDINO, warmed up with a caption.
+            planner (MemoryPlanner or None): if given, the matting goes through
+                `matte_within_budget` like the requests do.
+            captions (CaptionCache or None): if given, GroundingDINO goes through it like
+                the requests do, which also encodes the default caption.
+        """
+        start = time.perf_counter()
+        with torch.no_grad():
+            for size in self.sizes:
+                image, _, trimap, box = synthetic_inputs(*size)
+                pyramid = ImagePyramid.from_array(image)
+                if predictor is not None:
+                    self._time("sam", size, lambda: self._sam(predictor, pyramid, box))
+                if grounding_dino is not None:
+                    self._time(
+                        "grounding_dino",
+                        size,
+                        lambda: self._grounding_dino(grounding_dino, pyramid, captions),
+                    )
+                if matting_model is not None:
+                    self._time(
+                        "matting", size, lambda: self._matting(matting_model, image, trimap, planner)
+                    )
+        self.total_seconds = time.perf_counter() - start
+        if self.sizes:
+            print(f"Warmup done in {self.total_seconds:.1f}s: {self.summary()}")
+        self.ready.set()
+
+    @staticmethod
+    def _sam(predictor, pyramid, box):
+        inference.set_sam_image(predictor, pyramid)
+        boxes = torch.from_numpy(box[None]).to(inference.device)
+        predictor.predict_torch(
+            point_coords=None,
+            point_labels=None,
+            boxes=predictor.transform.apply_boxes_torch(boxes, pyramid.size),
+            multimask_output=False,
+        )
+
+    @staticmethod
+    def _grounding_dino(model, pyramid, captions):
+        image = inference.dino_preprocess(pyramid.for_dino())
+        inference.dino_predict(
+            model, image, "the biggest foreground object", 0.25, 0.25, caption_cache=captions
+        )
+
+    @staticmethod
+    def _matting(model, image, trimap, planner):
+        if planner is not None:
+            inference.matte_within_budget(model, image, trimap, planner)
+        else:
+            inference.pred_matting(model, image, trimap)
+
+    def summary(self):
+        """
+        First and last run of every model and size, e.g. "matting 1024x1024 3.20s -> 0.85s".
+        """
+        return ", ".join(
+            f"{name} {size} {runs[0]:.2f}s -> {runs[-1]:.2f}s"
+            for name, sizes in self._timings().items()
+            for size, runs in sizes.items()
+            if runs
+        )
+
+    def status(self):
+        """
+        Readiness and warmup timings, as reported on /ready.
+        """
+        return {
+            "ready": self.ready.is_set(),
+            "warmup_seconds": self.total_seconds,
+            "timings": self._timings(),
+        }
+
+    def prometheus_metrics(self):
+        """
+        Readiness gauge and warmup run times, for Instrumentation.add_collector.
+        """
+        lines = [
+            "# TYPE matte_anything_ready gauge",
+            f"matte_anything_ready {int(self.ready.is_set())}",
+            "# TYPE matte_anything_warmup_seconds gauge",
+        ]
+        for name, sizes in self._timings().items():
+            for size, runs in sizes.items():
+                for run, seconds in enumerate(runs):
+                    lines.append(
+                        f'matte_anything_warmup_seconds{{model="{name}",size="{size}",run="{run}"}} '
+                        f"{seconds:.6f}"
+                    )
+        return lines
@@ -0,0 +1,340 @@
+import os
+import time
+import pickle
+import itertools
+import threading
+import traceback
+import functools
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.reduction import ForkingPickler
+
+import torch
+
+from .checkpoint import is_mapped
+
+__all__ = ["WorkerPool", "split_cores"]
+
+
+def split_cores(num_workers, cores=None):
+    """
+    Split the cores available to this process into `num_workers` contiguous groups.
+    """
+    cores = sorted(os.sched_getaffinity(0) if cores is None else cores)
+    per_worker = max(len(cores) // num_workers, 1)
+    return [
+        cores[i * per_worker : (i + 1) * per_worker] or cores[-per_worker:]
+        for i in range(num_workers)
+    ]
+
+
+def _picklable(exc):
+    try:
+        pickle.dumps(exc)
+        return exc
+    except Exception:
+        return RuntimeError(f"{type(exc).__name__}: {exc}")
+
+
+def _worker_main(worker_id, func, cores, tasks, results, instrumentation, transport, inputs_held):
+    if cores:
+        os.sched_setaffinity(0, cores)
+        torch.set_num_threads(len(cores))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, payload = task
+        args, kwargs = ForkingPickler.loads(payload)
+        del payload
+        if transport is not None:
+            args, kwargs = transport.unpack((args, kwargs))
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result, error = None, None
+        try:
+            result = func(*args, **kwargs)
+            if transport is not None:
+                result = transport.pack(result)
+        except Exception as e:
+            traceback.print_exc()
+            error = _picklable(e.with_traceback(None))
+        stats = {
+            "wall_ms": (time.perf_counter() - wall_start) * 1000,
+            "cpu_ms": (time.process_time() - cpu_start) * 1000,
+            "request": instrumentation.last_request() if instrumentation is not None else None,
+        }
+        if transport is not None:
+            # drop the input arrays so their slabs are released, and tell the parent
+            # in the same step, so that it does not release them again if this
+            # process dies later
+            with transport.locked():
+                del args, kwargs
+                inputs_held[worker_id] = 0
+        else:
+            del args, kwargs
+        results.put(("done", worker_id, task_id, result, error, stats))
+
+
+class WorkerPool:
+    """
+    Serves `func` from forked CPU worker processes.
+
+    The models `func` closes over are loaded once in the parent and moved to shared
+    memory, the workers inherit them through fork instead of loading their own copy.
+    Each worker is pinned to its own group of cores and runs intra-op parallelism on
+    them only. Requests wait in the parent until a worker is idle and are then sent
+    to that worker's own queue, so the pool knows which request a worker holds when
+    it dies. A dispatcher thread resolves the futures returned by `submit`.
+    """
+
+    def __init__(
+        self, func, num_workers, models=(), cores=None, instrumentation=None, transport=None
+    ):
+        """
+        Args:
+            func (callable): request handler, arguments and results must be picklable.
+            num_workers (int): number of worker processes.
+            models (list[nn.Module]): models used by `func`, moved to shared memory
+                except for the tensors `load_mapped` maps from a file.
+            cores (list[int] or None): cores to spread the workers over, defaults to
+                the affinity of this process.
+            instrumentation (Instrumentation or None): receives the per-request spans of
+                the workers and exports per-worker metrics.
+            transport (SlabRing or None): if given, large arrays in the arguments and
+                results travel through its shared memory slabs instead of being pickled.
+        """
+        if torch.cuda.is_initialized():
+            raise RuntimeError("WorkerPool forks its workers, CUDA must not be initialized")
+        self.func = func
+        self.num_workers = num_workers
+        self.cores = split_cores(num_workers, cores)
+        self.instrumentation = instrumentation
+        self.transport = transport
+        for model in models:
+            for tensor in itertools.chain(model.parameters(), model.buffers()):
+                # the tensors mapped from a file already reach the workers through
+                # the page cache, share_memory_ would copy them
+                if not is_mapped(tensor):
+                    tensor.share_memory_()
+
+        self._context = mp.get_context("fork")
+        self._tasks = [None] * num_workers
+        # unbuffered, so a crashing worker cannot lose results it already sent
+        self._results = self._context.SimpleQueue()
+        self._futures = {}
+        self._handles = {}
+        # whether each worker still holds the input slabs of its task
+        self._inputs_held = self._context.Array("b", num_workers, lock=False)
+        # task ids by worker, for the workers holding one
+        self._running = {}
+        self._pending = deque()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._stats = [
+            {"requests": 0, "errors": 0, "restarts": 0, "busy_ms": 0.0, "cpu_ms": 0.0}
+            for _ in range(num_workers)
+        ]
+        self._processes = [self._spawn(i) for i in range(num_workers)]
+        self._closed = False
+        self._stopped = False
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+        self._monitor = threading.Thread(target=self._check_workers, daemon=True)
+        self._monitor.start()
+        if instrumentation is not None:
+            instrumentation.add_collector(self.prometheus_metrics)
+
+    def _spawn(self, worker_id):
+        # fed by a background thread, so that sending a task never blocks on a worker
+        # that died before reading it
+        self._tasks[worker_id] = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                worker_id,
+                self.func,
+                self.cores[worker_id],
+                self._tasks[worker_id],
+                self._results,
+                self.instrumentation,
+                self.transport,
+                self._inputs_held,
+            ),
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def submit(self, *args, **kwargs):
+        """
+        Queue a request, returns a Future of its result.
+        """
+        if self._closed:
+            raise RuntimeError("WorkerPool is closed")
+        future = Future()
+        task_id = next(self._ids)
+        if self.transport is not None:
+            args, kwargs = self.transport.pack((args, kwargs))
+        try:
+            # pickled here so that unpicklable arguments fail the call
+            payload = bytes(ForkingPickler.dumps((args, kwargs)))
+        except Exception:
+            if self.transport is not None:
+                for handle in self.transport.handles((args, kwargs)):
+                    self.transport.release(handle)
+            raise
+        with self._lock:
+            self._futures[task_id] = future
+            if self.transport is not None:
+                self._handles[task_id] = self.transport.handles((args, kwargs))
+            self._pending.append((task_id, payload))
+            self._assign()
+        return future
+
+    def _assign(self):
+        # with the lock held
+        for worker_id in range(self.num_workers):
+            if not self._pending:
+                break
+            if worker_id not in self._running:
+                task_id, payload = self._pending.popleft()
+                self._running[worker_id] = task_id
+                self._inputs_held[worker_id] = task_id in self._handles
+                self._tasks[worker_id].put((task_id, payload))
+
+    def remote(self, *bound):
+        """
+        Blocking stand-in for `func` that runs it on the pool, with `bound` prepended
+        to the arguments.
+        """
+
+        def wrapper(*args, **kwargs):
+            return self.submit(*bound, *args, **kwargs).result()
+
+        return wrapper if bound else functools.wraps(self.func)(wrapper)
+
+    def _dispatch(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                break
+            try:
+                self._handle(message)
+            except Exception:
+                # a dead dispatcher would leave every request hanging
+                traceback.print_exc()
+
+    def _handle(self, message):
+        if message[0] == "exit":
+            self._restart(*message[1:])
+            return
+
+        _, worker_id, task_id, result, error, stats = message
+        with self._lock:
+            self._running.pop(worker_id, None)
+            self._handles.pop(task_id, None)
+            future = self._futures.pop(task_id)
+            worker_stats = self._stats[worker_id]
+            worker_stats["requests"] += 1
+            worker_stats["errors"] += error is not None
+            worker_stats["busy_ms"] += stats["wall_ms"]
+            worker_stats["cpu_ms"] += stats["cpu_ms"]
+            self._assign()
+            self._drained.notify_all()
+        if error is None:
+            if self.transport is not None:
+                result = self.transport.unpack(result)
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+        if stats["request"] is not None:
+            self.instrumentation.merge(stats["request"])
+
+    def _check_workers(self, interval=1.0):
+        reported = set()
+        while not self._stopped:
+            time.sleep(interval)
+            for worker_id, process in enumerate(self._processes):
+                if process.is_alive() or process.pid in reported or self._stopped:
+                    continue
+                reported.add(process.pid)
+                # through the results queue, after anything the worker sent before dying
+                self._results.put(("exit", worker_id, process.exitcode))
+
+    def _restart(self, worker_id, exitcode):
+        with self._lock:
+            # the task sent to the worker, whether or not it started on it
+            task_id = self._running.pop(worker_id, None)
+            future = self._futures.pop(task_id, None) if task_id is not None else None
+            handles = self._handles.pop(task_id, [])
+            self._stats[worker_id]["restarts"] += 1
+        if handles:
+            with self.transport.locked():
+                # the inputs the worker had mapped die with it, unless it released them
+                if self._inputs_held[worker_id]:
+                    for handle in handles:
+                        self.transport.release(handle)
+                self._inputs_held[worker_id] = 0
+        if future is not None:
+            future.set_exception(RuntimeError(f"worker {worker_id} exited with code {exitcode}"))
+        tasks = self._tasks[worker_id]
+        tasks.close()
+        tasks.cancel_join_thread()
+        with self._lock:
+            if not self._stopped:
+                self._processes[worker_id] = self._spawn(worker_id)
+                self._assign()
+            self._drained.notify_all()
+
+    def stats(self):
+        """
+        Per-worker counters: requests, errors, restarts, busy and CPU milliseconds.
+        """
+        with self._lock:
+            return [
+                dict(stats, pid=process.pid, cores=cores)
+                for stats, process, cores in zip(self._stats, self._processes, self.cores)
+            ]
+
+    def prometheus_metrics(self):
+        stats = self.stats()
+        families = [
+            ("requests_total", lambda s: s["requests"]),
+            ("errors_total", lambda s: s["errors"]),
+            ("restarts_total", lambda s: s["restarts"]),
+            ("busy_seconds_total", lambda s: f"{s['busy_ms'] / 1000:.6f}"),
+            ("cpu_seconds_total", lambda s: f"{s['cpu_ms'] / 1000:.6f}"),
+        ]
+        lines = []
+        # each family's samples right after its TYPE line, as the format requires
+        for name, value in families:
+            lines.append(f"# TYPE matte_anything_worker_{name} counter")
+            for worker_id, worker_stats in enumerate(stats):
+                lines.append(
+                    f'matte_anything_worker_{name}{{worker="{worker_id}"}} {value(worker_stats)}'
+                )
+        return lines
+
+    def close(self):
+        """
+        Stop the workers once they finished the queued requests, then release the
+        shared memory of the transport.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            self._drained.wait_for(lambda: not self._pending and not self._running)
+            self._stopped = True
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join()
+        for tasks in self._tasks:
+            tasks.close()
+        self._results.put(None)
+        self._dispatcher.join()
+        if self.transport is not None:
+            self.transport.close()
@@ -0,0 +1,25 @@
+import cv2
+import numpy as np
+
+from data.cache import AssetCache
+
+
+def write_images(directory, names):
+    paths = []
+    for i, name in enumerate(names):
+        path = str(directory / f"{name}.png")
+        cv2.imwrite(path, np.full((4, 6), i * 40, np.uint8))
+        paths.append(path)
+    return paths
+
+
+def test_open_or_build_rebuilds_for_other_assets(tmp_path):
+    cache_path = str(tmp_path / "cache" / "alpha")
+    paths = write_images(tmp_path, ["a", "b"])
+    cache = AssetCache.open_or_build(paths, cache_path, grayscale=True)
+    assert cache.names == ["a", "b"]
+
+    paths = write_images(tmp_path, ["a", "c", "b"])
+    cache = AssetCache.open_or_build(paths, cache_path, grayscale=True)
+    assert cache.names == ["a", "c", "b"]
+    assert cache[1][0, 0] == 40
@@ -0,0 +1,20 @@
+import pytest
+import torch
+
+pytest.importorskip("detectron2")
+
+from modeling.criterion.matting_criterion import MattingCriterion, FusedMattingCriterion
+
+LOSSES = ["unknown_l1_loss", "known_l1_loss", "loss_pha_laplacian", "loss_gradient_penalty"]
+
+
+@pytest.mark.parametrize("size", [64, 130])
+def test_fused_matches_reference(size):
+    torch.manual_seed(0)
+    targets = torch.rand(2, 1, size, size)
+    sample_map = (torch.randint(0, 3, (2, 1, size, size)) == 1).float()
+    preds = torch.rand(2, 1, size, size)
+    expected = MattingCriterion(losses=LOSSES)(sample_map, {"phas": preds}, {"phas": targets})
+    actual = FusedMattingCriterion(losses=LOSSES)(sample_map, {"phas": preds}, {"phas": targets})
+    for name in LOSSES:
+        torch.testing.assert_close(actual[name], expected[name], rtol=1e-5, atol=1e-6)
@@ -0,0 +1,109 @@
+import os
+
+import cv2
+import numpy as np
+import torch.nn as nn
+
+import headless
+import pipeline.inference
+
+
+class AEMatter(nn.Module):
+    """
+    Stand-in for AEMatter, named so that pred_matting takes its path: the alpha is
+    the unknown region at one half plus the foreground.
+    """
+
+    def forward(self, image, trimap):
+        return trimap[:, 1:2] * 0.5 + trimap[:, 2:3]
+
+
+class StubSegmenter:
+    """
+    One centered square per image, two with --multi-object.
+    """
+
+    def __init__(self, args):
+        self.args = args
+
+    def __call__(self, pyramids):
+        results = []
+        for pyramid in pyramids:
+            h, w = pyramid.size
+            masks = []
+            for x0 in (w // 8, w // 2) if self.args.multi_object else (w // 4,):
+                mask = np.zeros((h, w), np.uint8)
+                mask[h // 4 : 3 * h // 4, x0 : x0 + w // 3] = 255
+                masks.append(mask)
+            results.append((masks, []))
+        return results
+
+
+def write_images(directory, sizes):
+    rng = np.random.default_rng(0)
+    for i, (h, w) in enumerate(sizes):
+        image = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        cv2.imwrite(os.path.join(directory, f"image{i}.png"), image)
+
+
+def run(monkeypatch, tmp_path, *argv):
+    monkeypatch.setattr(pipeline.inference, "init_matte", lambda *_: AEMatter().eval())
+    monkeypatch.setattr(headless, "Segmenter", StubSegmenter)
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    write_images(inputs, [(48, 64), (37, 50), (20, 16)])
+    output = tmp_path / "output"
+    headless.main(
+        headless.parse_arguments(
+            [str(inputs), "-o", str(output), "-m", "AEMatter", "--batch-size", "2", *argv]
+        )
+    )
+    return inputs, output
+
+
+def read_rgba(path):
+    rgba = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    assert rgba is not None and rgba.shape[2] == 4
+    return rgba
+
+
+def test_segmented(monkeypatch, tmp_path):
+    inputs, output = run(monkeypatch, tmp_path, "--erode-kernel-size", "1", "--save-trimap")
+    for i in range(3):
+        rgba = read_rgba(output / f"image{i}.png")
+        image = cv2.imread(str(inputs / f"image{i}.png"))
+        np.testing.assert_array_equal(rgba[..., :3], image)
+        trimap = cv2.imread(str(output / f"image{i}_trimap.png"), cv2.IMREAD_GRAYSCALE)
+        np.testing.assert_array_equal(rgba[..., 3][trimap == 0], 0)
+        np.testing.assert_array_equal(rgba[..., 3][trimap == 255], 255)
+
+
+def test_multi_object(monkeypatch, tmp_path):
+    _, output = run(
+        monkeypatch,
+        tmp_path,
+        "--multi-object",
+        "--erode-kernel-size",
+        "1",
+        "--dilate-kernel-size",
+        "1",
+    )
+    for i in range(3):
+        first, second = (read_rgba(output / f"image{i}_{j}.png")[..., 3] for j in range(2))
+        # each cutout only has its own object
+        assert first[:, -1].max() == 0 and second[:, 0].max() == 0
+
+
+def test_trimap_dir(monkeypatch, tmp_path):
+    trimaps = tmp_path / "trimaps"
+    trimaps.mkdir()
+    trimap = np.zeros((48, 64), np.uint8)
+    trimap[10:30, 10:40] = 128
+    trimap[15:25, 15:35] = 255
+    cv2.imwrite(str(trimaps / "image0.png"), trimap)
+    _, output = run(monkeypatch, tmp_path, "--trimap-dir", str(trimaps))
+    alpha = read_rgba(output / "image0.png")[..., 3]
+    # the stub's one half in the unknown region rounds to 128
+    np.testing.assert_array_equal(alpha, trimap)
+    # images without a trimap are skipped
+    assert sorted(os.listdir(output)) == ["image0.png"]
@@ -0,0 +1,32 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from pipeline.inference import reflect_index, preprocess_input
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 32])
+@pytest.mark.parametrize("before, after", [(0, 0), (2, 3), (15, 16), (40, 9)])
+def test_reflect_index_matches_cv2(size, before, after):
+    axis = np.arange(size, dtype=np.uint8)[None]
+    expected = cv2.copyMakeBorder(axis, 0, 0, before, after, cv2.BORDER_REFLECT)[0]
+    np.testing.assert_array_equal(reflect_index(size, before, after).cpu().numpy(), expected)
+
+
+@pytest.mark.parametrize("h, w", [(5, 3), (1, 40), (33, 64)])
+def test_preprocess_input_pads_tiny_images(h, w):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    trimap = rng.choice(np.array([0, 128, 255], np.uint8), (h, w))
+    img, trimaps, sizes = preprocess_input(image, trimap)
+    newh, neww = img.shape[-2:]
+    assert newh % 32 == 0 and neww % 32 == 0
+    padh, padw = newh - h, neww - w
+    expected = cv2.copyMakeBorder(
+        image[..., ::-1], sizes["padh1"], padh - sizes["padh1"], sizes["padw1"], padw - sizes["padw1"],
+        cv2.BORDER_REFLECT,
+    )
+    actual = (img[0].permute(1, 2, 0) * 255).round().to(torch.uint8).cpu().numpy()
+    np.testing.assert_array_equal(actual, expected)
+    assert torch.equal(trimaps.sum(1), torch.ones(1, newh, neww))
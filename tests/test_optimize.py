@@ -0,0 +1,73 @@
+import copy
+from functools import partial
+
+import pytest
+import torch
+import torch.nn as nn
+
+pytest.importorskip("detectron2")
+
+from modeling.backbone.vit import ViT
+from modeling.decoder.detail_capture import Detail_Capture
+from modeling.meta_arch.vitmatte import ViTMatte
+from modeling.meta_arch.optimize import optimize_for_inference
+
+
+def build_model():
+    torch.manual_seed(0)
+    model = ViTMatte(
+        backbone=ViT(
+            in_chans=4,
+            img_size=128,
+            patch_size=16,
+            embed_dim=64,
+            depth=2,
+            num_heads=2,
+            drop_path_rate=0,
+            window_size=4,
+            mlp_ratio=2,
+            qkv_bias=True,
+            norm_layer=partial(nn.LayerNorm, eps=1e-6),
+            window_block_indexes=[0],
+            residual_block_indexes=[1],
+            use_rel_pos=True,
+            out_feature="last_feat",
+        ),
+        criterion=None,
+        pixel_mean=[0.485, 0.456, 0.406],
+        pixel_std=[0.229, 0.224, 0.225],
+        input_format="RGB",
+        size_divisibility=32,
+        decoder=Detail_Capture(in_chans=64, img_chans=4),
+    ).eval()
+    # random BatchNorm statistics, otherwise folding is close to a no-op
+    with torch.no_grad():
+        for module in model.modules():
+            if isinstance(module, nn.BatchNorm2d):
+                module.running_mean.uniform_(-0.5, 0.5)
+                module.running_var.uniform_(0.5, 2.0)
+                module.weight.uniform_(0.5, 1.5)
+                module.bias.uniform_(-0.5, 0.5)
+    return model
+
+
+def make_inputs(height, width):
+    image = torch.randint(0, 256, (1, 3, height, width), dtype=torch.uint8)
+    trimap = torch.zeros(1, 1, height, width, dtype=torch.uint8)
+    trimap[:, :, height // 4 : 3 * height // 4, width // 4 : 3 * width // 4] = 128
+    trimap[:, :, 3 * height // 8 : 5 * height // 8, 3 * width // 8 : 5 * width // 8] = 255
+    return {"image": image, "trimap": trimap}
+
+
+# 96x128 needs no padding, the others are padded to 32 with pixel_mean
+@pytest.mark.parametrize("size", [(96, 128), (75, 101), (64, 33)])
+def test_optimize_for_inference_is_exact(size):
+    reference = build_model()
+    optimized = optimize_for_inference(copy.deepcopy(reference))
+    assert not optimized.normalize_inputs
+    inputs = make_inputs(*size)
+    with torch.no_grad():
+        expected = reference(inputs)["phas"]
+        actual = optimized(inputs)["phas"]
+    assert actual.shape == (1, 1) + size
+    torch.testing.assert_close(actual, expected, atol=1e-4, rtol=1e-4)
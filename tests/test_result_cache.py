@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+
+from pipeline.result_cache import ResultCache
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path), memory_entries=0)
+    key = ResultCache.key(np.zeros(3))
+    cache.put(key, {"alpha": np.ones(4)})
+    with open(os.path.join(tmp_path, key + ".npz"), "wb") as f:
+        f.write(b"not a zip")
+    assert cache.get(key) is None
+    assert not os.path.exists(os.path.join(tmp_path, key + ".npz"))
+    assert cache.misses == 1
+
+
+def test_failed_write_is_not_cached(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    key = ResultCache.key(np.zeros(3))
+
+    def replace(src, dst):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "replace", replace)
+    cache.put(key, {"alpha": np.ones(4)})
+    monkeypatch.undo()
+    assert os.listdir(tmp_path) == []
+    assert cache.get(key) is None
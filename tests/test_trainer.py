@@ -0,0 +1,17 @@
+import pytest
+import torch
+from torch import nn
+
+pytest.importorskip("detectron2.engine")
+
+from engine import DevicePrefetcher, MattingTrainer
+
+
+def test_cpu_model_skips_prefetcher():
+    model = nn.Linear(4, 1)
+    loader = [{"image": torch.zeros(2, 4)}]
+    trainer = MattingTrainer(model, loader, torch.optim.SGD(model.parameters(), lr=0.1), prefetch=2)
+    assert trainer.device == torch.device("cpu")
+    assert trainer.prefetch == 0
+    assert not isinstance(trainer.data_loader_iter, DevicePrefetcher)
+    assert torch.equal(next(trainer.data_loader_iter)["image"], loader[0]["image"])
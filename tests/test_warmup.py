@@ -0,0 +1,28 @@
+import sys
+import threading
+
+from pipeline.warmup import Warmup
+
+
+def test_status_while_timings_are_added():
+    warmup = Warmup(iterations=1)
+    done = threading.Event()
+
+    def run():
+        for i in range(2000):
+            warmup._time(f"model{i % 7}", (i, i), lambda: None)
+        done.set()
+
+    interval = sys.getswitchinterval()
+    # switch threads as often as possible, so that reads land in the middle of writes
+    sys.setswitchinterval(1e-6)
+    try:
+        thread = threading.Thread(target=run)
+        thread.start()
+        while not done.is_set():
+            warmup.status()
+            warmup.prometheus_metrics()
+        thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert len(warmup.status()["timings"]["model0"]) == 286
@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from pipeline.transport import SlabRing
+from pipeline.workers import WorkerPool
+
+
+def double(array):
+    return array * 2
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs POSIX shared memory")
+def test_close_frees_transport():
+    transport = SlabRing(2, 1 << 20)
+    names = [slab.name for slab in transport._slabs]
+    pool = WorkerPool(double, 1, transport=transport)
+    array = np.arange(1 << 17, dtype=np.float32)
+    np.testing.assert_array_equal(pool.submit(array).result(timeout=60), array * 2)
+    pool.close()
+    pool.close()
+    assert not any(os.path.exists(os.path.join("/dev/shm", name.lstrip("/"))) for name in names)
+
+
+def crash_on_negative(value):
+    if value < 0:
+        os._exit(3)
+    return value + 1
+
+
+def test_crashed_worker_fails_its_request_only():
+    pool = WorkerPool(crash_on_negative, 1)
+    futures = [pool.submit(v) for v in (1, -1, 2, 3)]
+    assert futures[0].result(timeout=60) == 2
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        futures[1].result(timeout=60)
+    assert [f.result(timeout=60) for f in futures[2:]] == [3, 4]
+    assert pool.stats()[0]["restarts"] == 1
+    pool.close()
+
+
+def test_unpicklable_arguments_fail_submit():
+    pool = WorkerPool(crash_on_negative, 1)
+    with pytest.raises(Exception):
+        pool.submit(lambda: None)
+    assert pool.submit(1).result(timeout=60) == 2
+    pool.close()
+
+
+def unpicklable_result(array):
+    return lambda: array.sum()
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs POSIX shared memory")
+def test_worker_dying_after_releasing_inputs():
+    # the result fails to pickle after the worker released its input slab
+    transport = SlabRing(2, 1 << 20)
+    pool = WorkerPool(unpicklable_result, 1, transport=transport)
+    array = np.arange(1 << 17, dtype=np.float32)
+    with pytest.raises(RuntimeError, match="exited"):
+        pool.submit(array).result(timeout=60)
+    pool.close()
+    assert transport.in_use() == 0
+
+
+def test_metric_families_are_contiguous():
+    pool = WorkerPool(crash_on_negative, 2)
+    assert pool.submit(1).result(timeout=60) == 2
+    lines = pool.prometheus_metrics()
+    pool.close()
+    families = [line.split()[2] for line in lines if line.startswith("# TYPE")]
+    assert len(families) == 5
+    for family, following in zip(families, [lines[i + 1 : i + 3] for i in range(0, len(lines), 3)]):
+        assert all(line.startswith(family + "{") for line in following)
+    assert 'matte_anything_worker_requests_total{worker="0"} 1' in lines
+
+
+def test_mapped_tensors_are_not_copied(tmp_path):
+    from torch import nn
+
+    from pipeline.checkpoint import load_mapped, save_mapped
+
+    path = str(tmp_path / "linear.mapped.pt")
+    save_mapped(nn.Linear(8, 4), path)
+    model = load_mapped(lambda: nn.Linear(8, 4), path)
+    model.register_buffer("scale", torch.ones(4))
+    pointers = [p.data_ptr() for p in model.parameters()]
+    pool = WorkerPool(double, 1, models=[model])
+    pool.close()
+    assert [p.data_ptr() for p in model.parameters()] == pointers
+    assert model.scale.is_shared()